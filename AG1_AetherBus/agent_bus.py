@@ -5,7 +5,7 @@ from AG1_AetherBus.keys import StreamKeyBuilder
 import asyncio
 
 from AG1_AetherBus.agent_bus_minimal import get_patterns, register_with_tg_handler
-from AG1_AetherBus.bus import ensure_group, subscribe, build_redis_url
+from AG1_AetherBus.bus import ensure_group, subscribe, build_redis_url, create_redis_client
 from AG1_AetherBus.keys import StreamKeyBuilder
 from redis.asyncio import Redis
 import asyncio
@@ -28,8 +28,8 @@ class AgentBus:
         self.agent_id = agent_id
         self.handler = handler
         self.group = group or f"{agent_id}_agent"
-        self.redis_url = redis_url or build_redis_url()
-        self.redis = Redis.from_url(self.redis_url)
+        self.redis_url = redis_url
+        self.redis = create_redis_client(redis_url)
         self.config = config  # Pass config for registration
         self.patterns = get_patterns(agent_id)
         self.subscribed = set()
@@ -1,5 +1,5 @@
-from AG1_AetherBus.bus import ensure_group, subscribe, build_redis_url, publish_envelope
-from AG1_AetherBus.keys import StreamKeyBuilder
+from AG1_AetherBus.bus import ensure_group, subscribe, subscribe_priority, build_redis_url, publish_envelope, create_redis_client
+from AG1_AetherBus.keys import StreamKeyBuilder, PRIORITY_LANES, DEFAULT_LANE
 from AG1_AetherBus.envelope import Envelope
 from redis.asyncio import Redis
 import redis.asyncio as aioredis
@@ -29,8 +29,8 @@ def get_patterns(agent_name):
     return [kb.agent_inbox(agent_name)]
 
 async def get_redis():
-    """Return a Redis connection using the configured URL."""
-    return Redis.from_url(build_redis_url())
+    """Return a bus client for the configured transport (Redis unless BUS_TRANSPORT=memory)."""
+    return create_redis_client()
 
 async def register_with_tg_handler(config, redis):
     """
@@ -141,13 +141,29 @@ async def old_before_mcp_discover_and_subscribe(redis, pattern, group, handler,
         await asyncio.sleep(poll_delay)
 
         
-async def discover_and_subscribe(redis, pattern, group, handler, poll_delay=5):
+def _is_inbox_lane(key: str) -> bool:
+    return any(key.endswith(f":inbox:{lane}") for lane in PRIORITY_LANES if lane != DEFAULT_LANE)
+
+
+async def discover_and_subscribe(redis, pattern, group, handler, poll_delay=5, stop_event=None, priority_weights=None, **subscribe_kwargs):
+    """
+    Periodically SCAN for streams matching `pattern` and start a subscribe()
+    task for each new one. Extra keyword arguments (e.g. max_in_flight,
+    drain_timeout) are passed straight through to subscribe().
+
+    With priority_weights (e.g. {"high": 16, "normal": 8, "low": 2}) inboxes
+    are read with subscribe_priority() instead, lanes included; it takes the
+    same keyword arguments.
+
+    Setting `stop_event` stops scanning and asks every spawned subscription to
+    drain (see subscribe()); this returns once they have all finished.
+    """
     print(f"[Bus_minimal][DISCOVERY] Starting discovery/subscription task for pattern: {pattern}")
     # Store tasks spawned by *this* discover_and_subscribe instance for specific keys found
     spawned_subscribe_tasks = {} 
 
     try:
-        while True: # Outer loop for periodic scanning
+        while stop_event is None or not stop_event.is_set(): # Outer loop for periodic scanning
             print(f"[Bus_minimal][DISCOVERY] Scanning for streams matching pattern: {pattern}")
             cursor = "0"
             while True: # Inner loop for iterating through `scan` results
@@ -167,12 +183,18 @@ async def discover_and_subscribe(redis, pattern, group, handler, poll_delay=5):
                     # current_subscriptions should ideally be instance-specific if BusAdapterV2 manages it
                     # or passed in if it's global and needs careful handling.
                     # For now, assuming it's a global/module-level set as in your original.
+                    if priority_weights is not None and _is_inbox_lane(key):
+                        continue # read by the subscribe_priority task of its inbox
                     if key not in current_subscriptions and key not in spawned_subscribe_tasks:
                         print(f"[Bus_minimal][DISCOVERY] New stream found: {key}. Ensuring group and subscribing.")
                         try:
                             await ensure_group(redis, key, group) # Ensure group exists for this specific key
                             # Create and store the subscribe task
-                            sub_task = asyncio.create_task(subscribe(redis, key, handler, group, f"{group}_{key.replace(':', '_')}_consumer"))
+                            consumer = f"{group}_{key.replace(':', '_')}_consumer"
+                            if priority_weights is not None and key.endswith(":inbox"):
+                                sub_task = asyncio.create_task(subscribe_priority(redis, key, handler, group, consumer, weights=priority_weights, stop_event=stop_event, **subscribe_kwargs))
+                            else:
+                                sub_task = asyncio.create_task(subscribe(redis, key, handler, group, consumer, stop_event=stop_event, **subscribe_kwargs))
                             spawned_subscribe_tasks[key] = sub_task
                             current_subscriptions.add(key) # Mark as globally active
                             print(f"[Bus_minimal][DISCOVERY] Subscribed to new stream: {key}")
@@ -186,13 +208,24 @@ async def discover_and_subscribe(redis, pattern, group, handler, poll_delay=5):
                             print(f"[Bus_minimal][DISCOVERY] Error setting up subscription for key '{key}': {e}")
                             
                 
-                if cursor == b"0" or cursor == "0": # SCAN returns bytes for cursor '0'
+                if cursor in (0, "0", b"0"): # redis-py returns the cursor as an int
                     break # Finished this scan iteration
                 
                 await asyncio.sleep(0.01) # Yield control during long scans
 
             print(f"[Bus_minimal][DISCOVERY] Finished scan for pattern '{pattern}'. Sleeping for {poll_delay}s.")
-            await asyncio.sleep(poll_delay) # Wait before next full scan cycle
+            if stop_event is None:
+                await asyncio.sleep(poll_delay) # Wait before next full scan cycle
+            else:
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=poll_delay)
+                except asyncio.TimeoutError:
+                    pass
+
+        # Graceful stop: the subscribe tasks saw the same stop_event and are draining
+        if spawned_subscribe_tasks:
+            print(f"[Bus_minimal][DISCOVERY] Stop requested for '{pattern}'. Waiting for {len(spawned_subscribe_tasks)} subscription(s) to drain.")
+            await asyncio.gather(*spawned_subscribe_tasks.values(), return_exceptions=True)
 
     except asyncio.CancelledError:
         print(f"[Bus_minimal][DISCOVERY] Main loop for pattern '{pattern}' cancelled.")
@@ -215,8 +248,8 @@ async def discover_and_subscribe(redis, pattern, group, handler, poll_delay=5):
             current_subscriptions.discard(key)
         print(f"[Bus_minimal][DISCOVERY] Exiting task for pattern: {pattern}. Cleaned up its spawned subscriptions.")
 
-async def start_bus_subscriptions(redis, patterns, group, handler):
+async def start_bus_subscriptions(redis, patterns, group, handler, **subscribe_kwargs):
     await asyncio.gather(*[
-        discover_and_subscribe(redis, pattern, group, handler)
+        discover_and_subscribe(redis, pattern, group, handler, **subscribe_kwargs)
         for pattern in patterns
     ])
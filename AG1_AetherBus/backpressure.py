@@ -0,0 +1,136 @@
+# AG1_AetherBus/backpressure.py
+"""
+Consumer-side flow control for bus subscriptions.
+
+Each subscription owns an InFlightWindow. The subscribe loop asks the window
+for capacity *before* issuing XREADGROUP, so when handlers fall behind the
+reader simply stops pulling entries. The backlog stays in Redis (where other
+consumers in the same group can pick it up) instead of piling up as decoded
+Envelopes in process memory.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+# (channel, group) -> window, so adapters/ops tooling can inspect live subscriptions
+WINDOWS: Dict[Tuple[str, str], "InFlightWindow"] = {}
+
+
+class InFlightWindow:
+    """
+    Bounded window of envelopes currently being handled for one subscription.
+
+    limit == 1 keeps the historical behaviour (handlers run inline, one at a
+    time, in stream order). limit > 1 runs handlers as tasks, at most `limit`
+    at once.
+    """
+
+    def __init__(self, limit: int = 1, channel: str = None, group: str = None):
+        self.limit = max(1, int(limit or 1))
+        self.channel = channel
+        self.group = group
+        self._in_flight = 0
+        self._tasks: set = set()
+        self._capacity = asyncio.Event()
+        self._capacity.set()
+        # metrics
+        self.peak_in_flight = 0
+        self.started_total = 0
+        self.completed_total = 0
+        self.blocked_total = 0          # number of times the reader had to pause
+        self.blocked_seconds = 0.0      # cumulative time the reader spent paused
+        self._blocked_since: Optional[float] = None
+        if channel is not None:
+            WINDOWS[(channel, group)] = self
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def available(self) -> int:
+        return max(0, self.limit - self._in_flight)
+
+    async def wait_for_capacity(self):
+        """Block the reader until at least one slot is free."""
+        if self.available > 0:
+            return
+        self.blocked_total += 1
+        self._blocked_since = time.monotonic()
+        try:
+            while self.available <= 0:
+                self._capacity.clear()
+                await self._capacity.wait()
+        finally:
+            self.blocked_seconds += time.monotonic() - self._blocked_since
+            self._blocked_since = None
+
+    def _acquire(self):
+        self._in_flight += 1
+        self.started_total += 1
+        if self._in_flight > self.peak_in_flight:
+            self.peak_in_flight = self._in_flight
+        if self._in_flight >= self.limit:
+            self._capacity.clear()
+
+    def _release(self, _task=None):
+        self._in_flight -= 1
+        self.completed_total += 1
+        if _task is not None:
+            self._tasks.discard(_task)
+        self._capacity.set()
+
+    async def run(self, coro):
+        """
+        Run a handler coroutine inside the window. Inline when limit == 1,
+        otherwise as a background task that frees its slot when done.
+        """
+        self._acquire()
+        if self.limit == 1:
+            try:
+                await coro
+            finally:
+                self._release()
+            return
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._release)
+
+    async def join(self, timeout: float = None) -> bool:
+        """Wait for in-flight handler tasks. Returns False if the timeout expired."""
+        if not self._tasks:
+            return True
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        return not pending
+
+    def cancel(self) -> int:
+        """Cancel handler tasks that are still running; returns how many were cancelled."""
+        pending = [t for t in self._tasks if not t.done()]
+        for task in pending:
+            task.cancel()
+        return len(pending)
+
+    def stats(self) -> dict:
+        blocked = self.blocked_seconds
+        if self._blocked_since is not None:
+            blocked += time.monotonic() - self._blocked_since
+        return {
+            "channel": self.channel,
+            "group": self.group,
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "started_total": self.started_total,
+            "completed_total": self.completed_total,
+            "blocked_total": self.blocked_total,
+            "blocked_seconds": round(blocked, 6),
+            "blocked_now": self._blocked_since is not None,
+        }
+
+
+def flow_stats(group: str = None) -> List[dict]:
+    """Snapshot of every live window (optionally only those of one consumer group)."""
+    return [
+        w.stats() for (ch, grp), w in list(WINDOWS.items())
+        if group is None or grp == group
+    ]
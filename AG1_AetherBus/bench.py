@@ -0,0 +1,515 @@
+# AG1_AetherBus/bench.py
+"""
+Benchmark suite for the bus hot paths against a local Redis.
+
+    aetherbus bench all --spawn --output bench.json
+    aetherbus bench publish --sizes 64,1024,16384 --messages 5000
+    python -m AG1_AetherBus.bench rpc --url redis://localhost:6379
+
+Benchmarks: publish and subscribe throughput, RPC round-trip latency,
+fan-out cost, envelope codec speed (no Redis needed) and subscribe_simple
+delivery latency; `connections` compares TCP, unix socket and RESP3
+connections for the publish and RPC paths; `priority` checks high-lane
+latency while the low lane is saturated. --spawn starts a throwaway
+`redis-server` on a free port and a unix socket (persistence off);
+otherwise --url / build_redis_url() is used (plus --socket for the unix
+variants), and --url memory:// runs the same suite on the in-process
+transport. Streams
+live under AG1:bench:* and are deleted afterwards. Results are JSON, so a
+CI job can diff them against a stored baseline before a deploy.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import traceback
+import uuid
+from urllib.parse import unquote, urlparse
+
+from redis.asyncio import Redis
+
+from AG1_AetherBus.bus import (
+    build_redis_url, create_redis_client, redis_connection_kwargs, unix_socket_url,
+    publish_envelope, subscribe, subscribe_priority, subscribe_simple,
+)
+from AG1_AetherBus import runtime
+from AG1_AetherBus.envelope import Envelope
+from AG1_AetherBus.reply_mux import close_reply_mux
+from AG1_AetherBus.rpc import bus_rpc_envelope
+
+DEFAULT_SIZES = (64, 1024, 16384)
+
+
+def percentiles(samples_ms) -> dict:
+    """p50/p99/mean/max of a list of millisecond samples."""
+    if not samples_ms:
+        return {"count": 0}
+    ordered = sorted(samples_ms)
+    n = len(ordered)
+
+    def pick(q):
+        return round(ordered[min(n - 1, int(q * n))], 3)
+
+    return {
+        "count": n,
+        "p50_ms": pick(0.50),
+        "p99_ms": pick(0.99),
+        "mean_ms": round(sum(ordered) / n, 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+async def _legacy_subscribe_simple(redis, stream: str, callback, poll_delay: int = 1, start_id: str = "$"):
+    """The pre-optimisation subscribe_simple read loop (10 ms sleeps), kept as a baseline."""
+    last_id = start_id
+    while True:
+        response = await redis.xread(streams={stream: last_id}, count=10, block=poll_delay * 1000)
+        if not response:
+            await asyncio.sleep(0.01)
+            continue
+        for _, messages in response:
+            for msg_id, fields in messages:
+                last_id = msg_id.decode() if isinstance(msg_id, bytes) else msg_id
+                raw = fields.get(b"data") or fields.get("data")
+                await callback(Envelope.from_dict(json.loads(raw)))
+        await asyncio.sleep(0.01)
+
+
+async def bench_subscribe_latency(
+    redis,
+    messages: int = 1000,
+    interval_ms: float = 1.0,
+    legacy: bool = False,
+    low_latency: bool = True,
+) -> dict:
+    """
+    Publish `messages` envelopes at a steady rate and measure publish -> callback
+    latency through subscribe_simple (or the legacy loop when legacy=True).
+    """
+    stream = f"AG1:bench:latency:{uuid.uuid4().hex[:8]}"
+    samples = []
+    done = asyncio.Event()
+
+    async def on_env(env: Envelope):
+        samples.append((time.perf_counter() - env.content["t"]) * 1000)
+        if len(samples) >= messages:
+            done.set()
+
+    # Give the reader a fixed cursor before anything is published
+    await redis.xadd(stream, {"data": json.dumps(Envelope(role="bench", content={"t": 0}).to_dict())})
+    start_id = (await redis.xrevrange(stream, count=1))[0][0]
+    start_id = start_id.decode() if isinstance(start_id, bytes) else start_id
+    if legacy:
+        reader = asyncio.create_task(_legacy_subscribe_simple(redis, stream, on_env, start_id=start_id))
+    else:
+        reader = asyncio.create_task(subscribe_simple(redis, stream, on_env, start_id=start_id, low_latency=low_latency))
+
+    try:
+        await asyncio.sleep(0.05)
+        for i in range(messages):
+            env = Envelope(role="bench", content={"i": i, "t": time.perf_counter()})
+            await redis.xadd(stream, {"data": json.dumps(env.to_dict())})
+            if interval_ms:
+                await asyncio.sleep(interval_ms / 1000)
+        await asyncio.wait_for(done.wait(), timeout=30)
+    finally:
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        await redis.delete(stream)
+
+    result = percentiles(samples)
+    result.update({"loop": "legacy" if legacy else ("low_latency" if low_latency else "default"),
+                   "interval_ms": interval_ms})
+    return result
+
+
+def _payload(size: int) -> dict:
+    return {"text": "x" * size}
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Silence the bus's per-message logging while timing (it goes to /dev/null, not the terminal)."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _rate(count: int, elapsed: float) -> float:
+    return round(count / elapsed, 1) if elapsed > 0 else None
+
+
+def bench_codec(sizes=DEFAULT_SIZES, iterations: int = 20000) -> list:
+    """Envelope -> JSON -> Envelope round trips per second, per payload size (no Redis)."""
+    results = []
+    for size in sizes:
+        env = Envelope(role="bench", content=_payload(size), agent_name="bench", user_id="bench")
+        start = time.perf_counter()
+        for _ in range(iterations):
+            data = json.dumps(env.to_dict())
+        encode_s = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(iterations):
+            Envelope.from_dict(json.loads(data))
+        decode_s = time.perf_counter() - start
+        results.append({
+            "payload_bytes": size,
+            "encoded_bytes": len(data),
+            "encode_per_s": _rate(iterations, encode_s),
+            "decode_per_s": _rate(iterations, decode_s),
+        })
+    return results
+
+
+async def bench_publish(redis, sizes=DEFAULT_SIZES, messages: int = 2000) -> list:
+    """Sequential publish_envelope throughput and per-call latency, per payload size."""
+    results = []
+    for size in sizes:
+        stream = f"AG1:bench:publish:{uuid.uuid4().hex[:8]}"
+        env = Envelope(role="bench", content=_payload(size))
+        samples = []
+        try:
+            with _quiet():
+                start = time.perf_counter()
+                for _ in range(messages):
+                    t0 = time.perf_counter()
+                    await publish_envelope(redis, stream, env)
+                    samples.append((time.perf_counter() - t0) * 1000)
+                elapsed = time.perf_counter() - start
+        finally:
+            await redis.delete(stream)
+        result = {"payload_bytes": size, "messages": messages, "per_s": _rate(messages, elapsed)}
+        result.update(percentiles(samples))
+        results.append(result)
+    return results
+
+
+async def bench_subscribe(redis, sizes=DEFAULT_SIZES, messages: int = 2000) -> list:
+    """Consumer-group subscribe() throughput over a pre-filled stream, per payload size."""
+    results = []
+    for size in sizes:
+        stream = f"AG1:bench:subscribe:{uuid.uuid4().hex[:8]}"
+        data = json.dumps(Envelope(role="bench", content=_payload(size)).to_dict())
+        pipe = redis.pipeline(transaction=False)
+        for _ in range(messages):
+            pipe.xadd(stream, {"data": data})
+        await pipe.execute()
+
+        seen = 0
+        done = asyncio.Event()
+
+        async def on_env(env):
+            nonlocal seen
+            seen += 1
+            if seen >= messages:
+                done.set()
+
+        try:
+            with _quiet():
+                start = time.perf_counter()
+                reader = asyncio.create_task(subscribe(redis, stream, on_env, group="bench", block_ms=100))
+                await asyncio.wait_for(done.wait(), timeout=120)
+                elapsed = time.perf_counter() - start
+                reader.cancel()
+                await asyncio.gather(reader, return_exceptions=True)
+        finally:
+            await redis.delete(stream)
+        results.append({"payload_bytes": size, "messages": messages, "per_s": _rate(messages, elapsed)})
+    return results
+
+
+async def bench_rpc(redis, calls: int = 500, timeout: float = 2.0) -> dict:
+    """bus_rpc_envelope round trips against an in-process echo responder."""
+    target = f"AG1:bench:rpc:{uuid.uuid4().hex[:8]}:inbox"
+
+    async def echo(env: Envelope):
+        reply = Envelope(role="bench", content=env.content, correlation_id=env.correlation_id)
+        await publish_envelope(redis, env.reply_to, reply)
+
+    samples, failures = [], 0
+    reply_streams = []
+    with _quiet():
+        responder = asyncio.create_task(subscribe(redis, target, echo, group="bench_echo", block_ms=100))
+        try:
+            await asyncio.sleep(0.1)
+            for i in range(calls):
+                req = Envelope(role="bench", content={"i": i}, agent_name="bench",
+                               correlation_id=uuid.uuid4().hex)
+                req.reply_to = f"AG1:rpc_reply:bench:{req.correlation_id}"
+                reply_streams.append(req.reply_to)
+                t0 = time.perf_counter()
+                resp = await bus_rpc_envelope(redis, target, req, timeout=timeout)
+                if isinstance(resp, Envelope):
+                    samples.append((time.perf_counter() - t0) * 1000)
+                else:
+                    failures += 1
+
+            # the same calls without reply_to go through the shared reply listener
+            mux_samples, mux_failures = [], 0
+            for i in range(calls):
+                req = Envelope(role="bench", content={"i": i}, agent_name="bench")
+                t0 = time.perf_counter()
+                resp = await bus_rpc_envelope(redis, target, req, timeout=timeout)
+                if isinstance(resp, Envelope):
+                    mux_samples.append((time.perf_counter() - t0) * 1000)
+                else:
+                    mux_failures += 1
+            t0 = time.perf_counter()
+            concurrent = await asyncio.gather(*(
+                bus_rpc_envelope(redis, target, Envelope(role="bench", content={"i": i}), timeout=timeout)
+                for i in range(calls)
+            ))
+            concurrent_elapsed = time.perf_counter() - t0
+        finally:
+            responder.cancel()
+            await asyncio.gather(responder, return_exceptions=True)
+            await close_reply_mux(redis)
+            await redis.delete(target, *reply_streams)
+    result = {"calls": calls, "failures": failures, "timeout_s": timeout}
+    result.update(percentiles(samples))
+    result["mux"] = {"failures": mux_failures, **percentiles(mux_samples)}
+    result["mux_concurrent"] = {
+        "failures": sum(1 for r in concurrent if not isinstance(r, Envelope)),
+        "per_s": _rate(calls, concurrent_elapsed),
+    }
+    return result
+
+
+async def bench_priority(redis, messages: int = 200, backlog: int = 2000, handler_ms: float = 1.0) -> dict:
+    """
+    High-priority delivery latency with the low lane idle vs. saturated, and
+    the same saturated load on a single lane-less inbox for comparison.
+    """
+    async def run(case: str) -> dict:
+        inbox = f"AG1:bench:priority:{uuid.uuid4().hex[:8]}:inbox"
+        samples = []
+        low = Envelope(role="bench", content={}, headers={"priority": "low"})
+
+        async def on_env(env: Envelope):
+            await asyncio.sleep(handler_ms / 1000)
+            if env.headers.get("priority") == "high":
+                samples.append((time.perf_counter() - env.content["t"]) * 1000)
+
+        with _quiet():
+            if case == "single_stream":
+                reader = asyncio.create_task(subscribe(redis, inbox, on_env, group="bench", block_ms=100))
+            else:
+                reader = asyncio.create_task(subscribe_priority(redis, inbox, on_env, group="bench", block_ms=100))
+            try:
+                await asyncio.sleep(0.1)
+                if case != "idle":
+                    target = inbox if case == "single_stream" else f"{inbox}:low"
+                    data = json.dumps(low.to_dict())
+                    pipe = redis.pipeline(transaction=False)
+                    for _ in range(backlog):
+                        pipe.xadd(target, {"data": data})
+                    await pipe.execute()
+                for _ in range(messages):
+                    env = Envelope(role="bench", content={"t": time.perf_counter()}, headers={"priority": "high"})
+                    await publish_envelope(redis, inbox, env)
+                    await asyncio.sleep(handler_ms * 2 / 1000)
+                deadline = time.perf_counter() + 60
+                while len(samples) < messages and time.perf_counter() < deadline:
+                    await asyncio.sleep(0.01)
+            finally:
+                reader.cancel()
+                await asyncio.gather(reader, return_exceptions=True)
+                await redis.delete(inbox, f"{inbox}:high", f"{inbox}:low")
+        result = {"case": case, "messages": messages, "low_backlog": 0 if case == "idle" else backlog}
+        result.update(percentiles(samples))
+        return result
+
+    return {"handler_ms": handler_ms, "cases": [await run(case) for case in ("idle", "saturated", "single_stream")]}
+
+
+async def bench_fanout(redis, fanouts=(1, 10, 100), size: int = 1024, rounds: int = 50) -> list:
+    """Cost of delivering one envelope to N streams with sequential publish_envelope calls."""
+    results = []
+    env = Envelope(role="bench", content=_payload(size))
+    for fanout in fanouts:
+        streams = [f"AG1:bench:fanout:{uuid.uuid4().hex[:8]}" for _ in range(fanout)]
+        samples = []
+        try:
+            with _quiet():
+                for _ in range(rounds):
+                    t0 = time.perf_counter()
+                    for stream in streams:
+                        await publish_envelope(redis, stream, env)
+                    samples.append((time.perf_counter() - t0) * 1000)
+        finally:
+            await redis.delete(*streams)
+        result = {"fanout": fanout, "payload_bytes": size, "rounds": rounds}
+        result.update(percentiles(samples))
+        results.append(result)
+    return results
+
+
+def connection_variants(url: str, socket_path: str = None) -> dict:
+    """name -> (url, Redis.from_url kwargs) for each connection option worth comparing."""
+    parsed = urlparse(url)
+    variants = {}
+    if parsed.scheme == "unix":
+        socket_path = socket_path or parsed.path
+    else:
+        variants["tcp"] = (url, {"protocol": 2})
+        variants["tcp+keepalive+resp3"] = (url, redis_connection_kwargs(url, protocol=3, keepalive=True))
+    if socket_path:
+        unix_url = unix_socket_url(socket_path, unquote(parsed.username or ""), unquote(parsed.password or ""))
+        variants["unix"] = (unix_url, {"protocol": 2})
+        variants["unix+resp3"] = (unix_url, redis_connection_kwargs(unix_url, protocol=3))
+    return variants
+
+
+async def bench_connections(url: str, socket_path: str = None, size: int = 1024,
+                            messages: int = 2000, calls: int = 500, timeout: float = 2.0) -> dict:
+    """Publish and RPC latency over TCP vs unix socket, RESP2 vs RESP3, against the same server."""
+    results = {}
+    for name, (variant_url, kwargs) in connection_variants(url, socket_path).items():
+        redis = Redis.from_url(variant_url, **kwargs)
+        try:
+            await redis.ping()
+            results[name] = {
+                "publish": (await bench_publish(redis, [size], messages))[0],
+                "rpc": await bench_rpc(redis, calls, timeout),
+            }
+        except Exception as e:
+            results[name] = {"error": str(e)}
+        finally:
+            await redis.aclose()
+    return results
+
+
+@contextlib.contextmanager
+def local_redis_server():
+    """Start a throwaway redis-server on a free port and a unix socket; yields (url, socket_path)."""
+    binary = shutil.which("redis-server")
+    if not binary:
+        raise RuntimeError("--spawn needs redis-server on PATH")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    workdir = tempfile.mkdtemp(prefix="aetherbus-bench-")
+    socket_path = os.path.join(workdir, "redis.sock")
+    proc = subprocess.Popen(
+        [binary, "--port", str(port), "--bind", "127.0.0.1", "--save", "", "--appendonly", "no", "--dir", workdir,
+         "--unixsocket", socket_path, "--unixsocketperm", "700"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.time() + 10
+        while True:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                    break
+            except OSError:
+                if time.time() > deadline or proc.poll() is not None:
+                    raise RuntimeError("redis-server did not start")
+                time.sleep(0.05)
+        yield f"redis://127.0.0.1:{port}", socket_path
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def _environment(redis) -> dict:
+    info = await redis.info("server")
+    return {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "redis_version": info.get("redis_version"),
+        "event_loop": type(asyncio.get_running_loop()).__module__,
+    }
+
+
+async def run_suite(url: str, names, args, socket_path: str = None) -> dict:
+    results = {}
+    if "codec" in names:
+        results["codec"] = bench_codec(args.sizes, args.codec_iterations)
+    redis_names = [n for n in names if n != "codec"]
+    if not redis_names:
+        return {"results": results}
+    if "connections" in redis_names and not (url or "").startswith("memory://"):
+        url = url or build_redis_url()
+    redis = create_redis_client(url)
+    try:
+        env_info = await _environment(redis)
+        if "publish" in redis_names:
+            results["publish"] = await bench_publish(redis, args.sizes, args.messages)
+        if "subscribe" in redis_names:
+            results["subscribe"] = await bench_subscribe(redis, args.sizes, args.messages)
+        if "rpc" in redis_names:
+            results["rpc"] = await bench_rpc(redis, args.calls, args.rpc_timeout)
+        if "fanout" in redis_names:
+            results["fanout"] = await bench_fanout(redis)
+        if "priority" in redis_names:
+            results["priority"] = await bench_priority(redis, min(args.messages, 500))
+        if "subscribe-latency" in redis_names:
+            results["subscribe_latency"] = {
+                "before": await bench_subscribe_latency(redis, args.messages, args.interval_ms, legacy=True),
+                "after": await bench_subscribe_latency(redis, args.messages, args.interval_ms, low_latency=True),
+            }
+        if "connections" in redis_names and not url.startswith("memory://"):
+            results["connections"] = await bench_connections(
+                url, socket_path or args.socket, args.sizes[0], args.messages, args.calls, args.rpc_timeout
+            )
+    finally:
+        await redis.aclose()
+    return {"environment": env_info, "results": results}
+
+
+BENCHMARKS = ("codec", "publish", "subscribe", "rpc", "fanout", "subscribe-latency", "connections", "priority")
+
+
+def build_parser(prog: str = "AG1_AetherBus.bench") -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog=prog, description="AetherBus benchmark suite")
+    parser.add_argument("benchmarks", nargs="*", default=["all"],
+                        help=f"Any of: all, {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--url", help="Redis URL (defaults to build_redis_url()); memory:// runs against the in-process transport")
+    parser.add_argument("--spawn", action="store_true", help="Start a throwaway local redis-server")
+    parser.add_argument("--socket", default=os.getenv("REDIS_SOCKET_PATH"),
+                        help="Unix socket of the same server, for the connections benchmark (default REDIS_SOCKET_PATH)")
+    parser.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=list(DEFAULT_SIZES),
+                        help="Comma-separated payload sizes in bytes")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--calls", type=int, default=500, help="RPC round trips")
+    parser.add_argument("--rpc-timeout", type=float, default=2.0)
+    parser.add_argument("--interval-ms", type=float, default=1.0, help="Publish interval for subscribe-latency")
+    parser.add_argument("--codec-iterations", type=int, default=20000)
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    return parser
+
+
+def main(argv=None, prog: str = "AG1_AetherBus.bench") -> int:
+    args = build_parser(prog).parse_args(argv)
+    names = list(BENCHMARKS) if "all" in args.benchmarks else args.benchmarks
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        print(f"Unknown benchmark(s): {', '.join(unknown)}")
+        return 2
+    try:
+        if args.spawn:
+            with local_redis_server() as (url, socket_path):
+                result = runtime.run(run_suite(url, names, args, socket_path))
+        else:
+            result = runtime.run(run_suite(args.url, names, args))
+    except Exception:
+        traceback.print_exc()
+        return 1
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -9,21 +9,40 @@ from AG1_AetherBus.envelope import Envelope
 import os
 from redis.asyncio import Redis
 from redis.exceptions import ResponseError
-from AG1_AetherBus.keys import StreamKeyBuilder
+from AG1_AetherBus.keys import StreamKeyBuilder, PRIORITY_LANES, DEFAULT_LANE, lane_stream
+from AG1_AetherBus.backpressure import InFlightWindow, WINDOWS
+from AG1_AetherBus.retention import DEFAULT_MAXLEN, expire_seconds, xadd_kwargs
+from AG1_AetherBus.metrics import REGISTRY, SubscriptionMetrics, record_publish, stream_label
+from AG1_AetherBus.latency import queue_delay_ms
+from AG1_AetherBus.dedup import DedupCache
+from AG1_AetherBus.scheduler import schedule_envelope
 
 
 import asyncio
 import inspect
+import socket
+import time
 import traceback 
+from typing import List, Tuple
 
 # --- Configurable Redis connection ---
 REDIS_HOST = os.getenv("REDIS_HOST", "forge.evasworld.net")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 8081))
 REDIS_USERNAME = os.getenv("REDIS_USERNAME","admin")
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "UltraSecretRoot123")
-
-STREAM_MAXLEN = int(os.getenv("BUS_STREAM_MAXLEN", 10000))  # For dev/demo, tune as needed
+# Local fast path: connect over a unix socket instead of TCP when Redis runs on this host
+REDIS_SOCKET_PATH = os.getenv("REDIS_SOCKET_PATH")
+REDIS_PROTOCOL = int(os.getenv("REDIS_PROTOCOL", 2))  # 3 = RESP3
+REDIS_SOCKET_KEEPALIVE = os.getenv("REDIS_SOCKET_KEEPALIVE", "1") != "0"
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+# "redis" (default) or "memory": in-process streams for single-node deployments and tests
+BUS_TRANSPORT = os.getenv("BUS_TRANSPORT", "redis").lower()
+
+STREAM_MAXLEN = DEFAULT_MAXLEN  # BUS_STREAM_MAXLEN; per key-class policies live in retention.py
+DISCOVERY_STREAM = "user.discovery"
 ENVELOPE_SIZE_LIMIT = 128 * 1024  # 128 KB
+# Clock-skew allowance before an envelope's headers["deadline"] counts as passed
+DEADLINE_GRACE_SECONDS = float(os.getenv("BUS_DEADLINE_GRACE", 0.5))
 
 key_builder = StreamKeyBuilder()
 
@@ -46,7 +65,12 @@ async def ensure_group(redis, channel: str, group: str):
 
 
 # --- Envelope Publisher (with Discovery + Size Guard) ---
-async def publish_envelope(redis, channel: str, env: Envelope):
+async def publish_envelope(redis, channel: str, env: Envelope, deliver_at: float = None, delay: float = None):
+    """
+    XADD `env` to `channel`. With `deliver_at` (unix time) or `delay`
+    (seconds) in the future, the envelope is handed to the scheduler instead
+    and lands on the stream when due (see scheduler.py).
+    """
     data = json.dumps(env.to_dict())
 
     # Enforce payload size limit
@@ -55,11 +79,27 @@ async def publish_envelope(redis, channel: str, env: Envelope):
             f"Envelope exceeds {ENVELOPE_SIZE_LIMIT} bytes. Offload large payloads to object storage."
         )
 
-    # Check if stream exists *before* publishing
-    stream_exists = await redis.exists(channel)
-
-    # Publish the envelope to Redis stream
-    await redis.xadd(channel, {"data": data}, maxlen=STREAM_MAXLEN)
+    if deliver_at is not None or delay is not None:
+        due = deliver_at if deliver_at is not None else time.time() + delay
+        if due > time.time():
+            # lane routing, discovery and metrics happen at delivery (publish_envelopes)
+            await schedule_envelope(redis, channel, data, due, env.envelope_id)
+            return
+
+    # Priority lanes: route to the requested lane if the inbox's reader listens on lanes
+    channel = await _route_to_lane(redis, channel, env)
+
+    # Check if stream exists *before* publishing; both commands share one round trip
+    started = time.perf_counter()
+    pipe = redis.pipeline(transaction=False)
+    pipe.exists(channel)
+    # Publish the envelope to Redis stream, trimmed per its key class (see retention.py)
+    pipe.xadd(channel, {"data": data}, **xadd_kwargs(channel))
+    ttl = expire_seconds(channel)
+    if ttl:
+        pipe.expire(channel, ttl)  # ephemeral reply streams expire once idle
+    stream_exists = (await pipe.execute())[0]
+    record_publish(channel, (time.perf_counter() - started) * 1000)
 
     # Trigger discovery if this is a new stream
     if not stream_exists:
@@ -71,10 +111,212 @@ async def publish_envelope(redis, channel: str, env: Envelope):
             agent_name="bus_discovery",
             envelope_type="discovery"
         )
-        await redis.xadd("user.discovery", {"data": json.dumps(discovery_env.to_dict())})
+        await redis.xadd(DISCOVERY_STREAM, {"data": json.dumps(discovery_env.to_dict())}, **xadd_kwargs(DISCOVERY_STREAM))
+
+async def publish_envelopes(redis, items: List[Tuple[str, Envelope]]):
+    """
+    Publish several (channel, envelope) pairs in one pipelined round trip.
+    Same size guard, lane routing and retention as publish_envelope; no
+    delayed delivery.
+    """
+    encoded = []
+    for channel, env in items:
+        data = json.dumps(env.to_dict())
+        if len(data.encode("utf-8")) > ENVELOPE_SIZE_LIMIT:
+            raise ValueError(
+                f"Envelope exceeds {ENVELOPE_SIZE_LIMIT} bytes. Offload large payloads to object storage."
+            )
+        encoded.append((await _route_to_lane(redis, channel, env), env, data))
+    if not encoded:
+        return
+
+    started = time.perf_counter()
+    pipe = redis.pipeline(transaction=False)
+    exists_at, queued = [], 0
+    for channel, _, data in encoded:
+        exists_at.append(queued)
+        pipe.exists(channel)
+        pipe.xadd(channel, {"data": data}, **xadd_kwargs(channel))
+        queued += 2
+        ttl = expire_seconds(channel)
+        if ttl:
+            pipe.expire(channel, ttl)
+            queued += 1
+    results = await pipe.execute()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    for channel, _, _ in encoded:
+        record_publish(channel, elapsed_ms / len(encoded))
+
+    # Trigger discovery for streams that didn't exist yet
+    new_streams = {}
+    for (channel, env, _), index in zip(encoded, exists_at):
+        stream_exists = results[index]
+        if not stream_exists and channel not in new_streams:
+            new_streams[channel] = Envelope(
+                role="user",
+                content={"stream": channel},
+                user_id=env.user_id or "unknown",
+                agent_name="bus_discovery",
+                envelope_type="discovery"
+            )
+    if new_streams:
+        pipe = redis.pipeline(transaction=False)
+        for discovery_env in new_streams.values():
+            pipe.xadd(DISCOVERY_STREAM, {"data": json.dumps(discovery_env.to_dict())}, **xadd_kwargs(DISCOVERY_STREAM))
+        await pipe.execute()
+
+async def _route_to_lane(redis, channel: str, env: Envelope) -> str:
+    """
+    Lane stream for an inbox envelope carrying headers["priority"]. Lane
+    streams are created by subscribe_priority, so if one doesn't exist the
+    reader isn't lane-aware and the envelope stays on the inbox itself.
+    """
+    lane = (env.headers or {}).get("priority")
+    if not lane or lane == DEFAULT_LANE or lane not in PRIORITY_LANES or not channel.endswith(":inbox"):
+        return channel
+    candidate = lane_stream(channel, lane)
+    return candidate if await redis.exists(candidate) else channel
+
+def deadline_passed(env: Envelope, stream: str, group: str = "") -> bool:
+    """
+    Handler-side deadline check for work that waited after subscribe()'s own
+    check (queued behind other requests, or before a slow step). Uses the
+    same BUS_DEADLINE_GRACE as subscribe() and counts drops in
+    bus_expired_total for (stream, group).
+    """
+    if not env.expired(grace=DEADLINE_GRACE_SECONDS):
+        return False
+    REGISTRY.counter(
+        "bus_expired_total", "Envelopes dropped because their deadline had passed",
+        stream=stream_label(stream), group=group or "",
+    ).inc()
+    return True
 
 # --- Core Subscriber (Consumer Group Model) ---
 
+async def _process_entry(redis, channel, group, msg_id, fields, callback, retry_counts, dead_letter_max_retries, metrics, dedup=None):
+    """Decode one stream entry, run the callback and ack it."""
+    #raw = fields.get("data") or fields.get(b"data")
+    raw = fields.get("envelope") or fields.get("data") or fields.get(b"envelope") or fields.get(b"data")
+    print(f"Received messages in stream results: {str(raw)[:90]}")
+    if not raw:
+        return
+
+
+    # --- START DIAGNOSTIC CHANGES ---
+    json_string_to_parse = None
+    if isinstance(raw, bytes):
+        try:
+            # Try decoding as UTF-8 first
+            json_string_to_parse = raw.decode('utf-8').strip()
+            # If successful, check for unexpected null bytes that print() might hide
+            if '\x00' in json_string_to_parse:
+                print(f"[BUS][WARN] Decoded string contains NULL bytes. Original len: {len(raw)}, Decoded len: {len(json_string_to_parse)}")
+                # Optionally, replace or escape null bytes if that's desired,
+                # though this usually indicates a deeper data corruption issue.
+                # json_string_to_parse = json_string_to_parse.replace('\x00', '[NULL_BYTE]')
+        except UnicodeDecodeError as ude:
+            print(f"[BUS][ERROR][Subscribe] UnicodeDecodeError for raw bytes: {ude}")
+            print(f"  Problematic raw bytes (first 100): {raw[:100]}")
+            # Attempt to decode with 'latin-1' or 'replace' to see the content if UTF-8 fails
+            try:
+                fallback_str = raw.decode('latin-1', errors='replace')
+                print(f"  Fallback decoded (latin-1, replace errors) (first 100): {fallback_str[:100]}")
+            except:
+                pass # Fallback decoding also failed
+            # For now, let it fall through so json.loads() fails and we see the problematic string
+            # If it's not valid UTF-8, json.loads(raw) (if raw is bytes) would also fail.
+            # We need to ensure json_string_to_parse is set for the next block if we want to attempt parsing.
+            # If we can't decode, we probably shouldn't try to json.loads it.
+            # Let's make json_string_to_parse the raw bytes representation for logging if decode fails.
+            json_string_to_parse = str(raw) # So it's not None and gets logged by the except block
+
+    elif isinstance(raw, str): 
+        json_string_to_parse = raw.strip()
+        if '\x00' in json_string_to_parse:
+            print(f"[BUS][WARN] Raw string contains NULL bytes. Len: {len(json_string_to_parse)}")
+            # json_string_to_parse = json_string_to_parse.replace('\x00', '[NULL_BYTE]')
+    else:
+        print(f"[BUS][ERROR][Subscribe] 'raw' data is of unexpected type: {type(raw)}")
+        return 
+
+    # This debug print should now be more revealing if there are hidden chars
+    print(f"[BUS][DEBUG] String to parse. Len: {len(json_string_to_parse)}. Data (repr): '{repr(json_string_to_parse[:120])}'...") # Use repr()
+
+    if json_string_to_parse is None: 
+        print(f"[BUS][WARN] json_string_to_parse is None after processing 'raw'. Skipping.")
+        return
+    # --- END DIAGNOSTIC CHANGES ---
+
+
+
+    claimed = None
+    try:
+        t0 = time.perf_counter()
+        payload_dict = json.loads(json_string_to_parse)
+        env = Envelope.from_dict(payload_dict) #json.loads(raw)
+        t1 = time.perf_counter()
+        metrics.decode_ms.observe((t1 - t0) * 1000)
+        if env.expired(grace=DEADLINE_GRACE_SECONDS):
+            print(f"[BUS][DEADLINE] Envelope {env.envelope_id} on {channel} is {-env.time_remaining():.1f}s past its deadline; acking without handling.")
+            metrics.expired.inc()
+            await redis.xack(channel, group, msg_id)
+            return
+        hedge_of = (env.headers or {}).get("hedge_of") if dedup is not None else None
+        if hedge_of and await dedup.is_done(hedge_of):
+            print(f"[BUS][DEDUP] Hedge {env.envelope_id} on {channel}: original {hedge_of} already handled; acking without handling.")
+            metrics.dedup_hits.inc()
+            await redis.xack(channel, group, msg_id)
+            return
+        if dedup is not None and payload_dict.get("envelope_id"):
+            if not await dedup.claim(env.envelope_id, msg_id):
+                print(f"[BUS][DEDUP] Duplicate envelope {env.envelope_id} on {channel} (entry {msg_id}); acking without handling.")
+                metrics.dedup_hits.inc()
+                await redis.xack(channel, group, msg_id)
+                return
+            metrics.dedup_misses.inc()
+            claimed = env.envelope_id
+        # Optional: Add tracing hop
+        env.add_hop("bus_subscribe")
+        print(f"In subscribes: {msg_id}")
+        queued_ms = queue_delay_ms(msg_id)
+        await callback(env)
+        t2 = time.perf_counter()
+        handler_ms = (t2 - t1) * 1000
+        metrics.handler_ms.observe(handler_ms)
+        metrics.latency.record(queued_ms, handler_ms)
+        await redis.xack(channel, group, msg_id)
+        metrics.ack_ms.observe((time.perf_counter() - t2) * 1000)
+        metrics.consumed.inc()
+        if claimed:
+            await dedup.complete(claimed)
+        if hedge_of:
+            await dedup.complete(hedge_of)
+        if msg_id in retry_counts:
+            del retry_counts[msg_id]
+    except json.JSONDecodeError as e: # Catch specifically JSONDecodeError
+        metrics.errors.inc()
+        print(f"[BUS][ERROR][Subscribe] Malformed envelope (JSONDecodeError) on {channel}: {e}")
+        print(f"--- PROBLEMATIC JSON STRING (Len: {len(json_string_to_parse)}) ---")
+        print(json_string_to_parse) # PRINT THE ENTIRE STRING
+        print(f"--- END PROBLEMATIC JSON STRING ---")
+    except Exception as e:
+        print(f"[BUS][ERROR][Subsribe] Malformed envelope on {channel}: {e}")
+        traceback.print_exc()
+        metrics.errors.inc()
+        if claimed:
+            await dedup.release(claimed)
+
+
+        retry_counts[msg_id] = retry_counts.get(msg_id, 0) + 1
+        if retry_counts[msg_id] > dead_letter_max_retries:
+            print(f"[BUS][DEAD] Giving up on {msg_id} after {dead_letter_max_retries} retries.")
+            await redis.xack(channel, group, msg_id)
+            retry_counts.pop(msg_id)
+            metrics.dead_lettered.inc()
+
+
+
 async def subscribe(
     redis,
     channel: str,
@@ -82,120 +324,179 @@ async def subscribe(
     group: str = "corebus",
     consumer: str = None,
     block_ms: int = 1000,
-    dead_letter_max_retries: int = 3
+    dead_letter_max_retries: int = 3,
+    max_in_flight: int = 1,
+    stop_event: asyncio.Event = None,
+    drain_timeout: float = None,
+    dedup: DedupCache = None,
 ):
     """
     Subscribes to a Redis Stream using a consumer group.
     Messages are passed to the callback as deserialized Envelope objects.
     Handles retries and acknowledges messages.
+
+    max_in_flight bounds how many callbacks may run at once. When the window
+    is full no XREADGROUP is issued until a callback finishes, so bursts stay
+    in Redis (visible to other consumers of the group) rather than in memory.
+    The default of 1 handles entries inline and in order.
+
+    stop_event requests a graceful stop: no new XREADGROUP is issued (the
+    current one returns within block_ms), entries already read are still
+    handled, and in-flight callbacks get up to `drain_timeout` seconds (None =
+    no limit) to finish and ack before the function returns. Callbacks still
+    running after that are cancelled and their entries stay pending.
+
+    dedup (a dedup.DedupCache) makes consumption idempotent per envelope_id:
+    an envelope already handled (here or, with a Redis-backed cache, by any
+    replica) is acked without calling the callback.
+
+    Envelopes whose headers["deadline"] (set by the RPC helpers) has passed
+    are acked without calling the callback: the caller has stopped waiting.
     """
     
     await ensure_group(redis, channel, group)
     consumer = consumer or f"{group}-default"
     print(f"[BUS][subscribe]")
     retry_counts = {}
+    window = InFlightWindow(max_in_flight, channel=channel, group=group)
+    metrics = SubscriptionMetrics(channel, group, dedup=dedup is not None)
 
-    while True:
-        try:
-            #print('x')
-            results = await redis.xreadgroup(
-                group, consumer, streams={channel: '>'}, count=1, block=block_ms
-            )
-            #print(f"subscribe: results={results}")
-            if not results:
-                continue
-            
-            for stream, messages in results:
-                #print(f"Received messages from stream: {stream} messages {messages}")
-                for msg_id, fields in messages:
-                    #print(f"Received messages in stream results id: {msg_id}")
-                    
-                    #raw = fields.get("data") or fields.get(b"data")
-                    raw = fields.get("envelope") or fields.get("data") or fields.get(b"envelope") or fields.get(b"data")
-                    print(f"Received messages in stream results: {str(raw)[:90]}")
-                    if not raw:
-                        continue
-
-
-                    # --- START DIAGNOSTIC CHANGES ---
-                    json_string_to_parse = None
-                    if isinstance(raw, bytes):
-                        try:
-                            # Try decoding as UTF-8 first
-                            json_string_to_parse = raw.decode('utf-8').strip()
-                            # If successful, check for unexpected null bytes that print() might hide
-                            if '\x00' in json_string_to_parse:
-                                print(f"[BUS][WARN] Decoded string contains NULL bytes. Original len: {len(raw)}, Decoded len: {len(json_string_to_parse)}")
-                                # Optionally, replace or escape null bytes if that's desired,
-                                # though this usually indicates a deeper data corruption issue.
-                                # json_string_to_parse = json_string_to_parse.replace('\x00', '[NULL_BYTE]')
-                        except UnicodeDecodeError as ude:
-                            print(f"[BUS][ERROR][Subscribe] UnicodeDecodeError for raw bytes: {ude}")
-                            print(f"  Problematic raw bytes (first 100): {raw[:100]}")
-                            # Attempt to decode with 'latin-1' or 'replace' to see the content if UTF-8 fails
-                            try:
-                                fallback_str = raw.decode('latin-1', errors='replace')
-                                print(f"  Fallback decoded (latin-1, replace errors) (first 100): {fallback_str[:100]}")
-                            except:
-                                pass # Fallback decoding also failed
-                            # For now, let it fall through so json.loads() fails and we see the problematic string
-                            # If it's not valid UTF-8, json.loads(raw) (if raw is bytes) would also fail.
-                            # We need to ensure json_string_to_parse is set for the next block if we want to attempt parsing.
-                            # If we can't decode, we probably shouldn't try to json.loads it.
-                            # Let's make json_string_to_parse the raw bytes representation for logging if decode fails.
-                            json_string_to_parse = str(raw) # So it's not None and gets logged by the except block
-
-                    elif isinstance(raw, str): 
-                        json_string_to_parse = raw.strip()
-                        if '\x00' in json_string_to_parse:
-                            print(f"[BUS][WARN] Raw string contains NULL bytes. Len: {len(json_string_to_parse)}")
-                            # json_string_to_parse = json_string_to_parse.replace('\x00', '[NULL_BYTE]')
-                    else:
-                        print(f"[BUS][ERROR][Subscribe] 'raw' data is of unexpected type: {type(raw)}")
-                        continue 
-
-                    # This debug print should now be more revealing if there are hidden chars
-                    print(f"[BUS][DEBUG] String to parse. Len: {len(json_string_to_parse)}. Data (repr): '{repr(json_string_to_parse[:120])}'...") # Use repr()
-
-                    if json_string_to_parse is None: 
-                        print(f"[BUS][WARN] json_string_to_parse is None after processing 'raw'. Skipping.")
-                        continue
-                    # --- END DIAGNOSTIC CHANGES ---
-
-
-
-                    try:
-                        payload_dict = json.loads(json_string_to_parse)
-                        env = Envelope.from_dict(payload_dict) #json.loads(raw)
-                        # Optional: Add tracing hop
-                        env.add_hop("bus_subscribe")
-                        print(f"In subscribes: {msg_id}")
-                        await callback(env)
-                        await redis.xack(channel, group, msg_id)
-                        if msg_id in retry_counts:
-                            del retry_counts[msg_id]
-                    except json.JSONDecodeError as e: # Catch specifically JSONDecodeError
-                        print(f"[BUS][ERROR][Subscribe] Malformed envelope (JSONDecodeError) on {channel}: {e}")
-                        print(f"--- PROBLEMATIC JSON STRING (Len: {len(json_string_to_parse)}) ---")
-                        print(json_string_to_parse) # PRINT THE ENTIRE STRING
-                        print(f"--- END PROBLEMATIC JSON STRING ---")
-                    except Exception as e:
-                        print(f"[BUS][ERROR][Subsribe] Malformed envelope on {channel}: {e}")
-                        traceback.print_exc()
-
-
-                        retry_counts[msg_id] = retry_counts.get(msg_id, 0) + 1
-                        if retry_counts[msg_id] > dead_letter_max_retries:
-                            print(f"[BUS][DEAD] Giving up on {msg_id} after {dead_letter_max_retries} retries.")
-                            await redis.xack(channel, group, msg_id)
-                            retry_counts.pop(msg_id)
-
-        except Exception as err:
-            print(f"[BUS][ERROR] Subscribe error on {channel}: {err}")
-            traceback.print_exc()
+    try:
+        while stop_event is None or not stop_event.is_set():
+            try:
+                await window.wait_for_capacity()
+                if stop_event is not None and stop_event.is_set():
+                    break
+                results = await redis.xreadgroup(
+                    group, consumer, streams={channel: '>'}, count=window.available, block=block_ms
+                )
+                #print(f"subscribe: results={results}")
+                if not results:
+                    continue
+
+                for stream, messages in read_batches(results):
+                    #print(f"Received messages from stream: {stream} messages {messages}")
+                    for msg_id, fields in messages:
+                        await window.run(_process_entry(
+                            redis, channel, group, msg_id, fields, callback,
+                            retry_counts, dead_letter_max_retries, metrics, dedup
+                        ))
+
+            except Exception as err:
+                print(f"[BUS][ERROR] Subscribe error on {channel}: {err}")
+                traceback.print_exc()
+
+        print(f"[BUS][subscribe] Stopping {channel} ({group}): draining {window.in_flight} in-flight handler(s).")
+        if not await window.join(drain_timeout):
+            abandoned = window.cancel()
+            print(f"[BUS][subscribe][WARN] Drain timeout on {channel} ({group}): cancelled {abandoned} handler(s); their entries stay pending.")
+    except asyncio.CancelledError:
+        if stop_event is not None and stop_event.is_set():
+            # The caller gave up waiting for the drain; don't leave handlers running behind it
+            window.cancel()
+        raise
+    finally:
+        if WINDOWS.get((channel, group)) is window:
+            WINDOWS.pop((channel, group), None)
 
 
 # Simple non-group subscriber
+DEFAULT_LANE_WEIGHTS = {"high": 16, "normal": 8, "low": 2}
+
+
+async def subscribe_priority(
+    redis,
+    inbox: str,
+    callback,
+    group: str = "corebus",
+    consumer: str = None,
+    weights: dict = None,
+    block_ms: int = 1000,
+    dead_letter_max_retries: int = 3,
+    max_in_flight: int = 1,
+    stop_event: asyncio.Event = None,
+    drain_timeout: float = None,
+    dedup: DedupCache = None,
+):
+    """
+    Consumer-group reader for an inbox and its priority lanes (see keys.py).
+
+    Each round reads up to weights[lane] entries from every lane, highest
+    lane first, with non-blocking XREADGROUPs; only when all lanes are empty
+    does it block, on all of them at once. A saturated low lane therefore
+    gets weights["low"] entries per round, and a high-priority envelope waits
+    at most one round's worth of lower-lane handlers, never the low backlog.
+
+    Creating the lane groups (MKSTREAM) is what tells publish_envelope that
+    this inbox is lane-aware. max_in_flight, stop_event and drain_timeout
+    work as in subscribe(), with one window shared by all lanes (reported
+    under the inbox name); the default of 1 runs handlers one at a time, in
+    order per lane.
+    """
+    weights = {**DEFAULT_LANE_WEIGHTS, **(weights or {})}
+    consumer = consumer or f"{group}-default"
+    lanes = [(lane, lane_stream(inbox, lane), max(1, int(weights[lane]))) for lane in PRIORITY_LANES]
+    window = InFlightWindow(max_in_flight, channel=inbox, group=group)
+    state = {}
+    for lane, stream, _ in lanes:
+        await ensure_group(redis, stream, group)
+        state[stream] = (
+            SubscriptionMetrics(stream, group, dedup=dedup is not None),
+            {},  # retry counts
+        )
+    print(f"[BUS][subscribe_priority] {inbox} lanes={[(lane, w) for lane, _, w in lanes]} max_in_flight={window.limit}")
+
+    async def handle(results) -> int:
+        handled = 0
+        for stream, messages in read_batches(results):
+            stream = stream.decode() if isinstance(stream, bytes) else stream
+            metrics, retry_counts = state[stream]
+            for msg_id, fields in messages:
+                await window.run(_process_entry(
+                    redis, stream, group, msg_id, fields, callback,
+                    retry_counts, dead_letter_max_retries, metrics, dedup
+                ))
+                handled += 1
+        return handled
+
+    def stopping() -> bool:
+        return stop_event is not None and stop_event.is_set()
+
+    try:
+        while not stopping():
+            try:
+                handled = 0
+                for lane, stream, weight in lanes:
+                    await window.wait_for_capacity()
+                    if stopping():
+                        break
+                    handled += await handle(await redis.xreadgroup(
+                        group, consumer, streams={stream: '>'}, count=min(weight, window.available)
+                    ))
+                if handled or stopping():
+                    continue
+                # Idle: park on every lane; count=1 so a wake-up never grabs a low batch
+                await handle(await redis.xreadgroup(
+                    group, consumer, streams={stream: '>' for _, stream, _ in lanes}, count=1, block=block_ms
+                ))
+            except Exception as err:
+                print(f"[BUS][ERROR] subscribe_priority error on {inbox}: {err}")
+                traceback.print_exc()
+                await asyncio.sleep(1)
+
+        print(f"[BUS][subscribe_priority] Stopping {inbox} ({group}): draining {window.in_flight} in-flight handler(s).")
+        if not await window.join(drain_timeout):
+            abandoned = window.cancel()
+            print(f"[BUS][subscribe_priority][WARN] Drain timeout on {inbox} ({group}): cancelled {abandoned} handler(s); their entries stay pending.")
+    except asyncio.CancelledError:
+        if stopping():
+            window.cancel()
+        raise
+    finally:
+        if WINDOWS.get((inbox, group)) is window:
+            WINDOWS.pop((inbox, group), None)
+
+
 async def PREDEBUGsubscribe_simple(redis, stream: str, callback, poll_delay=1):
     print(f'subscibe {redis} stream {stream}')
     last_id = "$"  # Only get new messages
@@ -218,42 +519,83 @@ async def PREDEBUGsubscribe_simple(redis, stream: str, callback, poll_delay=1):
         except Exception as e:
             print(f"[BUS][ERROR] Failed to read from {stream}: {e}")
 
-async def subscribe_simple(redis, stream: str, callback, poll_delay: int = 1, start_id: str = "$"):
-    print(f"[BUS][subscribe_simple] ENTERING for stream '{stream}', start_id '{start_id}'")
-    last_id = start_id
-    loop_count = 0
-    while True:
-        loop_count += 1
-        #print(f"  [BUS][subscribe_simple][{stream}] Loop iteration {loop_count}. last_id: '{last_id}'. Attempting XREAD...")
+async def stream_tail_id(redis, stream: str) -> str:
+    """ID of the newest entry in `stream`, or "0-0" if it is empty or missing."""
+    entries = await redis.xrevrange(stream, count=1)
+    if not entries:
+        return "0-0"
+    entry_id = entries[0][0]
+    return entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+
+
+SIMPLE_MIN_COUNT = 1
+SIMPLE_MAX_COUNT = 512
+SIMPLE_LOW_LATENCY_MAX_COUNT = 16
+
+
+async def subscribe_simple(
+    redis,
+    stream: str,
+    callback,
+    poll_delay: int = 1,
+    start_id: str = "$",
+    low_latency: bool = False,
+    max_count: int = None,
+    stop_event: asyncio.Event = None,
+):
+    """
+    Non-group subscriber: XREAD BLOCK from `start_id` and pass each Envelope
+    to `callback` in stream order.
+
+    The loop never sleeps between reads. XREAD BLOCK returns as soon as an
+    entry lands, so delivery latency is one round trip plus handler time;
+    `poll_delay` only bounds how long an idle read may park on the server.
+    The batch size adapts to traffic: it doubles while reads come back full
+    (catching up on a backlog) and halves when they come back mostly empty.
+
+    low_latency=True is meant for relay and RPC-style waiters: per-message
+    logging is turned off and batches are capped at
+    SIMPLE_LOW_LATENCY_MAX_COUNT so the cursor never lags far behind a
+    burst. Set `max_count` to override either cap.
+
+    Setting `stop_event` ends the loop after the current read and batch.
+    """
+    print(f"[BUS][subscribe_simple] ENTERING for stream '{stream}', start_id '{start_id}', low_latency={low_latency}")
+    # Pin "$" to a concrete ID once; re-sending "$" after an empty read would
+    # skip anything that landed between two XREAD calls.
+    last_id = await stream_tail_id(redis, stream) if start_id == "$" else start_id
+    block_ms = max(1, int(poll_delay * 1000))
+    count_cap = max_count or (SIMPLE_LOW_LATENCY_MAX_COUNT if low_latency else SIMPLE_MAX_COUNT)
+    count = min(10, count_cap)
+    verbose = not low_latency
+    while stop_event is None or not stop_event.is_set():
         try:
             response = await redis.xread(
                 streams={stream: last_id},
-                count=10,
-                block=poll_delay * 1000
+                count=count,
+                block=block_ms
             )
-            # print(f"  [BUS][subscribe_simple][{stream}] XREAD response: {response}") # Can be very verbose
 
             if not response:
-                # print(f"  [BUS][subscribe_simple][{stream}] XREAD timed out (no new messages). Continuing loop.")
-                await asyncio.sleep(0.01) # Tiny sleep to prevent tight loop on continuous timeouts
                 continue
 
-            print(f"  [BUS][subscribe_simple][{stream}] XREAD got {len(response[0][1]) if response else 0} message(s).")
-            for stream_name_bytes, messages_in_stream in response:
+            received = 0
+            for stream_name_bytes, messages_in_stream in read_batches(response):
+                received += len(messages_in_stream)
+                if verbose:
+                    print(f"  [BUS][subscribe_simple][{stream}] XREAD got {len(messages_in_stream)} message(s).")
                 for message_id_bytes, message_data_dict_bytes in messages_in_stream:
-                    current_message_id = message_id_bytes.decode('utf-8')
-                    print(f"    [BUS][subscribe_simple][{stream}] Processing message_id: {current_message_id}")
+                    current_message_id = message_id_bytes.decode('utf-8') if isinstance(message_id_bytes, bytes) else message_id_bytes
                     last_id = current_message_id # Update last_id for the next XREAD
 
-                    envelope_json_bytes = message_data_dict_bytes.get(b'data')
+                    envelope_json_bytes = message_data_dict_bytes.get(b'data') or message_data_dict_bytes.get('data')
                     if envelope_json_bytes:
                         try:
-                            envelope_json_str = envelope_json_bytes.decode('utf-8')
-                            env_dict = json.loads(envelope_json_str)
-                            env = Envelope.from_dict(env_dict)
-                            print(f"      [BUS][subscribe_simple][{stream}] Calling callback for {current_message_id}...")
+                            envelope_json_str = envelope_json_bytes.decode('utf-8') if isinstance(envelope_json_bytes, bytes) else envelope_json_bytes
+                            env = Envelope.from_dict(json.loads(envelope_json_str))
+                            if verbose:
+                                print(f"      [BUS][subscribe_simple][{stream}] Calling callback for {current_message_id}...")
                             await callback(env)
-                            print(f"      [BUS][subscribe_simple][{stream}] Callback finished for {current_message_id}.")
                         except json.JSONDecodeError as e_json:
                             print(f"      [BUS][subscribe_simple][ERROR][{stream}] JSONDecodeError for msg {current_message_id}: {e_json}")
                             print(f"        Problematic data: {envelope_json_bytes[:200]}")
@@ -262,8 +604,12 @@ async def subscribe_simple(redis, stream: str, callback, poll_delay: int = 1, st
                             traceback.print_exc()
                     else:
                         print(f"    [BUS][subscribe_simple][WARN][{stream}] Message {current_message_id} has no 'data' field (b'data'). Fields: {message_data_dict_bytes}")
-            
-            await asyncio.sleep(0.01) # Slight pause after processing a batch
+
+            # Adapt the batch size: grow while we are draining a backlog, shrink when idle-ish
+            if received >= count:
+                count = min(count * 2, count_cap)
+            elif received * 4 < count:
+                count = max(count // 2, SIMPLE_MIN_COUNT)
 
         except ConnectionError as e_conn:
             print(f"  [BUS][subscribe_simple][ERROR][{stream}] Redis ConnectionError: {e_conn}. Retrying in 5s...")
@@ -278,6 +624,9 @@ async def subscribe_simple(redis, stream: str, callback, poll_delay: int = 1, st
 def build_redis_url():
     user = REDIS_USERNAME
     pwd = REDIS_PASSWORD
+    if REDIS_SOCKET_PATH:
+        print(f'Build url {user}  unix:{REDIS_SOCKET_PATH}')
+        return unix_socket_url(REDIS_SOCKET_PATH, user, pwd)
     print(f'Build url {user}  {REDIS_HOST} {REDIS_PORT}')
     if user and pwd:
         return f"redis://{user}:{pwd}@{REDIS_HOST}:{REDIS_PORT}"
@@ -286,6 +635,58 @@ def build_redis_url():
     else:
         return f"redis://{REDIS_HOST}:{REDIS_PORT}"
 
+def unix_socket_url(path: str, user: str = None, pwd: str = None) -> str:
+    """unix:// URL for a local Redis socket, e.g. unix://admin:secret@/var/run/redis/redis.sock"""
+    if user and pwd:
+        return f"unix://{user}:{pwd}@{path}"
+    elif pwd:
+        return f"unix://:{pwd}@{path}"
+    return f"unix://{path}"
+
+# --- Helper: Connection tuning for Redis.from_url ---
+def redis_connection_kwargs(url: str, protocol: int = None, keepalive: bool = None) -> dict:
+    """
+    Extra Redis.from_url() arguments: RESP protocol (REDIS_PROTOCOL), a health
+    check on idle pooled connections and, for TCP, keepalive probes so dead
+    peers are noticed. redis-py already sets TCP_NODELAY on every TCP socket,
+    so small commands are never held back by Nagle's algorithm.
+    """
+    kwargs = {
+        "protocol": REDIS_PROTOCOL if protocol is None else protocol,
+        "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+    }
+    keepalive = REDIS_SOCKET_KEEPALIVE if keepalive is None else keepalive
+    if keepalive and not url.startswith("unix://"):
+        kwargs["socket_keepalive"] = True
+        kwargs["socket_keepalive_options"] = {
+            opt: value for name, value in (("TCP_KEEPIDLE", 60), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3))
+            if (opt := getattr(socket, name, None)) is not None
+        }
+    return kwargs
+
+def read_batches(response):
+    """
+    XREAD / XREADGROUP reply as [(stream, entries), ...]. RESP2 returns that
+    list already; RESP3 returns a {stream: [entries]} map.
+    """
+    if isinstance(response, dict):
+        return [(stream, value[0] if value else []) for stream, value in response.items()]
+    return response or []
+
+# --- Helper: Client for the configured transport ---
+def create_redis_client(url: str = None):
+    """
+    Return the client the bus helpers should be given. With BUS_TRANSPORT=memory
+    (or a memory:// url) this is the process-wide InMemoryRedis, so every agent
+    in the process shares the same streams; otherwise a Redis client for `url`
+    (default build_redis_url()) tuned by redis_connection_kwargs().
+    """
+    if (url or "").startswith("memory://") or (url is None and BUS_TRANSPORT == "memory"):
+        from AG1_AetherBus.memory_transport import shared
+        return shared()
+    url = url or build_redis_url()
+    return Redis.from_url(url, **redis_connection_kwargs(url))
+
 async def main():
     print(f'Host : {REDIS_HOST}')
     #redis = await aioredis.from_url(build_redis_url())
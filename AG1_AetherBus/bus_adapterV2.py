@@ -3,9 +3,14 @@ from typing import Callable, Dict, List
 import sys
 import uuid
 from AG1_AetherBus.agent_bus import AgentBus  # core AgentBus engine
-from AG1_AetherBus.bus import publish_envelope  # low-level xadd helper
+from AG1_AetherBus.bus import publish_envelope, read_batches  # low-level xadd helper
 from AG1_AetherBus.envelope import Envelope
 from AG1_AetherBus.agent_bus_minimal import start_bus_subscriptions
+from AG1_AetherBus.backpressure import flow_stats
+from AG1_AetherBus.circuit import BREAKERS, TRANSPORT_ERRORS, BreakerRegistry, CircuitOpenError
+from AG1_AetherBus.dedup import DedupCache
+from AG1_AetherBus.reply_mux import ReplyMux
+from AG1_AetherBus.rpc_cache import ResponseCache
 import json
 # Redis specific imports
 from redis.asyncio import Redis as AsyncRedis # For type hinting and explicit async Redis client
@@ -27,16 +32,29 @@ class BusAdapterV2:
         core_handler: Callable[[Envelope, AsyncRedis], None],
         redis_client : AsyncRedis,
         patterns: List[str] = None,
-        group: str = None
+        group: str = None,
+        max_in_flight: int = 1,
+        dedup: DedupCache = None,
+        priority_weights: Dict[str, int] = None
     ):
         self.agent_id = agent_id
         self.core     = core_handler
         self.redis : AsyncRedis    = redis_client
         self.group    = group or agent_id
         self.patterns = patterns or []
+        # per-subscription bound on concurrently running handlers (see backpressure.py)
+        self.max_in_flight = max_in_flight
+        # optional envelope_id dedup shared by all of this adapter's subscriptions (see dedup.py)
+        self.dedup = dedup
+        # read inboxes as weighted priority lanes, e.g. {"high": 16, "normal": 8, "low": 2} (see subscribe_priority)
+        self.priority_weights = priority_weights
         # pattern -> handler mapping
         self._registry: Dict[str, Callable] = {}
         self._running_subscription_tasks: Dict[str, asyncio.Task] = {}
+        # set by stop(): subscriptions stop reading and drain their in-flight handlers
+        self._stop_event = asyncio.Event()
+        # reply_to stream -> persistent reply listener used by request_response
+        self._reply_routers: Dict[str, ReplyMux] = {}
 
     async def start(self):
         """
@@ -74,7 +92,11 @@ class BusAdapterV2:
                 redis=self.redis,
                 patterns=[pattern],
                 group=self.group,
-                handler=callback
+                handler=callback,
+                max_in_flight=self.max_in_flight,
+                stop_event=self._stop_event,
+                dedup=self.dedup,
+                priority_weights=self.priority_weights
             )
         )
         self._running_subscription_tasks[pattern] = task
@@ -110,10 +132,53 @@ class BusAdapterV2:
                 except Exception as e: 
                     print(f"[BusAdapterV2] Error awaiting cancelled task for '{pattern}': {type(e).__name__} - {e}")   
 
+    async def stop(self, drain_timeout: float = 30.0, close_redis: bool = False) -> bool:
+        """
+        Graceful shutdown: stop reading new entries on every subscription, let
+        in-flight handlers finish and ack for up to `drain_timeout` seconds,
+        then cancel whatever is left (those entries stay pending and are
+        redelivered to the group). Publishes are awaited inline, so there is
+        no publish buffer to flush. With close_redis=True the client's
+        connection pool is closed afterwards.
+
+        Returns True if everything drained within the timeout.
+        """
+        tasks = {p: t for p, t in self._running_subscription_tasks.items() if not t.done()}
+        print(f"[BusAdapterV2] Stopping {len(tasks)} subscription(s) for '{self.agent_id}' (drain timeout {drain_timeout}s).")
+        self._stop_event.set()
+        drained = True
+        if tasks:
+            done, pending = await asyncio.wait(tasks.values(), timeout=drain_timeout)
+            if pending:
+                drained = False
+                stuck = [p for p, t in tasks.items() if t in pending]
+                print(f"[BusAdapterV2][WARN] Drain timed out for {stuck}; cancelling.")
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+        self._running_subscription_tasks.clear()
+        self._registry.clear()
+        for router in self._reply_routers.values():
+            await router.close(delete_stream=False)
+        self._reply_routers.clear()
+        # allow start() again after a stop
+        self._stop_event = asyncio.Event()
+        if close_redis:
+            await self.redis.aclose()
+        print(f"[BusAdapterV2] Stopped '{self.agent_id}' (drained={drained}).")
+        return drained
+
     def list_subscriptions(self) -> List[str]:
         """Return all currently registered patterns."""
         return list(self._registry.keys())
 
+    def flow_stats(self) -> List[Dict]:
+        """
+        Backpressure metrics for every stream this adapter's group is reading:
+        in-flight depth, peak depth and time the reader spent paused.
+        """
+        return flow_stats(self.group)
+
     async def publish(self, stream: str, env: Envelope):
         """
         Publish an Envelope to a Redis stream.
@@ -124,35 +189,94 @@ class BusAdapterV2:
         self,
         stream: str,
         req_env: Envelope,
-        timeout: float = 5.0
+        timeout: float = 5.0,
+        coalesce_key=None,
+        coalesce_shared: bool = False,
+        cache: ResponseCache = None,
+        cache_ttl: float = None,
+        circuit=None,
     ) -> Envelope:
         """
         Send req_env to `stream` then await a single response on req_env.reply_to
         matching correlation_id. Returns the responding Envelope.
+
+        coalesce_key (a string, or True to key on stream + type + content) makes
+        identical concurrent requests share one round trip; see singleflight.py.
+        cache (a rpc_cache.ResponseCache) answers repeated lookups locally;
+        see bus_rpc_envelope for cache_ttl. circuit (True, or a
+        circuit.BreakerRegistry) raises CircuitOpenError without sending while
+        the target's breaker is open after repeated timeouts.
+
+        Replies are routed by one persistent listener per reply_to stream
+        (a ReplyMux, see reply_mux.py), so a call costs the request XADD plus
+        the shared read. Raises asyncio.TimeoutError if no reply arrives.
         """
-        import uuid
-        import asyncio
+        if cache is not None:
+            cached = await cache.get(stream, req_env)
+            if cached is not None:
+                cached.correlation_id = req_env.correlation_id or cached.correlation_id
+                return cached
+            resp_env = await self.request_response(stream, req_env, timeout, coalesce_key, coalesce_shared, circuit=circuit)
+            await cache.put(stream, req_env, resp_env, cache_ttl)
+            return resp_env
+        if circuit:
+            return await self._guarded_request(stream, req_env, timeout, coalesce_key, coalesce_shared, circuit)
+        if coalesce_key:
+            return await self._coalesced_request(stream, req_env, timeout, coalesce_key, coalesce_shared)
         # prepare reply_to and correlation_id
         reply_to = req_env.reply_to or f"{self.agent_id}:outbox"
         req_env.reply_to = reply_to
         req_env.correlation_id = req_env.correlation_id or str(uuid.uuid4())
+        req_env.set_deadline(timeout)
+
+        router = self._reply_router(reply_to)
+        future = router.expect(req_env.correlation_id)
+        try:
+            await router.ready()
+            await self.publish(stream, req_env)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            router.unregister(req_env.correlation_id)
 
-        # use a Future for one-off reply
-        loop = asyncio.get_running_loop()
-        future = loop.create_future()
-
-        async def _collector(env: Envelope, redis_client):
-            if env.correlation_id == req_env.correlation_id and not future.done():
-                future.set_result(env)
-
-        # subscribe to reply stream
-        await self.add_subscription(reply_to, _collector)
-        # publish request
-        await self.publish(stream, req_env)
-        # wait for response
-        resp_env = await asyncio.wait_for(future, timeout)
-        # clean up
-        await self.remove_subscription(reply_to)
+    def _reply_router(self, reply_to: str) -> ReplyMux:
+        router = self._reply_routers.get(reply_to)
+        if router is None:
+            router = self._reply_routers[reply_to] = ReplyMux(self.redis, stream=reply_to)
+        return router
+
+    async def _guarded_request(self, stream, req_env, timeout, coalesce_key, coalesce_shared, circuit):
+        breakers = circuit if isinstance(circuit, BreakerRegistry) else BREAKERS
+        if not await breakers.allow(self.redis, stream):
+            raise CircuitOpenError(f"Circuit open for {stream}")
+        breaker = breakers.get(stream)
+        started = time.perf_counter()
+        try:
+            resp_env = await self.request_response(stream, req_env, timeout, coalesce_key, coalesce_shared)
+        except TRANSPORT_ERRORS:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.release()  # cancelled, or the caller's own error
+            raise
+        breaker.record_success((time.perf_counter() - started) * 1000)
+        return resp_env
+
+    async def _coalesced_request(self, stream, req_env, timeout, coalesce_key, shared):
+        import copy
+        from AG1_AetherBus.singleflight import FLIGHTS, content_key
+
+        if not isinstance(coalesce_key, str):
+            coalesce_key = content_key(stream, req_env.envelope_type, req_env.content)
+        resp_env = await FLIGHTS.do(
+            f"request:{coalesce_key}",
+            lambda: self.request_response(stream, req_env, timeout),
+            redis=self.redis if shared else None,
+            timeout=timeout,
+            encode=lambda env: json.dumps(env.to_dict()),
+            decode=lambda raw: Envelope.from_dict(json.loads(raw)),
+        )
+        resp_env = copy.deepcopy(resp_env)
+        resp_env.correlation_id = req_env.correlation_id or resp_env.correlation_id
         return resp_env
 
     def dump_wiring(self) -> List[Dict[str, str]]:
@@ -191,7 +315,7 @@ class BusAdapterV2:
             if not result:
                 continue
 
-            for _, messages in result:
+            for _, messages in read_batches(result):
                 for msg_id, fields in messages:
                     last_id = msg_id
                     raw = fields.get("data")
@@ -42,11 +42,14 @@ class BusConnector:
         # start the adapter in its own task so start() doesn’t block forever
         self._task = asyncio.create_task(self._adapter.start())
 
-    async def stop(self):
-        """Cancel the background subscription."""
-        if self._task:
-            self._task.cancel()
-        await self._adapter.stop()
+    async def stop(self, drain_timeout: float = 30.0, close_redis: bool = False) -> bool:
+        """
+        Stop reading, let in-flight handlers finish (up to drain_timeout
+        seconds) and optionally close the Redis pool. See BusAdapterV2.stop.
+        """
+        if self._task and not self._task.done():
+            await self._task  # start() only spawns the subscription tasks
+        return await self._adapter.stop(drain_timeout, close_redis=close_redis)
 
     async def _on_message(self, env: Envelope, redis: Redis):
         # call your handler (you can catch/log exceptions here)
@@ -0,0 +1,220 @@
+# AG1_AetherBus/circuit.py
+"""
+Per-target circuit breakers and health scores for bus RPCs.
+
+If a target inbox has no live consumers, every caller blocks for its full
+timeout (10-60 s for MCP tools and the relay). A breaker per target stream
+fails those calls fast instead:
+
+    reply = await bus_rpc_envelope(redis, inbox, env, timeout=30, circuit=True)
+    # -> {"error": "Circuit open for AG1:agent:muse:inbox"} while the target is down
+
+    closed      calls go through; `failure_threshold` consecutive timeouts,
+                error replies or transport errors (TRANSPORT_ERRORS) open
+                the breaker; other exceptions are the caller's and don't count
+    open        calls fail immediately for `reset_timeout` seconds
+    half_open   up to `half_open_probes` calls go through as probes; one
+                success closes the breaker, one failure opens it again
+
+Each breaker also keeps a health score in [0, 1]: an exponentially weighted
+success rate, scaled down when the weighted reply latency exceeds
+`slow_ms`. States and scores are exported as the gauges bus_circuit_state
+(0 closed, 1 half open, 2 open) and bus_target_health, and trips are
+counted in bus_circuit_open_total.
+
+With check_liveness=True the registry also asks Redis whether any consumer
+of the target stream has been active within `max_idle_ms` (XINFO GROUPS /
+XINFO CONSUMERS, cached for `liveness_ttl` seconds). A target with no live
+consumer is treated as a failure without sending anything.
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+
+from redis.exceptions import ConnectionError as RedisConnectionError, ResponseError, TimeoutError as RedisTimeoutError
+
+from AG1_AetherBus.metrics import REGISTRY, MetricsRegistry, stream_label
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Exceptions that say the call didn't get through. Anything else (a
+# ValueError for an oversized envelope, an encoding error) is the caller's
+# bug and must not open the breaker of a healthy target.
+TRANSPORT_ERRORS = (asyncio.TimeoutError, RedisConnectionError, RedisTimeoutError, OSError)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised (by request_response) when a target's breaker is open."""
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _field(info: dict, name: str):
+    value = info.get(name)
+    return info.get(name.encode()) if value is None else value
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        target: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_probes: int = 1,
+        slow_ms: float = 5000.0,
+        alpha: float = 0.2,
+    ):
+        self.target = target
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.slow_ms = slow_ms
+        self.alpha = alpha
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.success_rate = 1.0
+        self.latency_ms: Optional[float] = None
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (claims a probe slot when half open)."""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            self.probes_in_flight = 0
+        if self.state == HALF_OPEN:
+            if self.probes_in_flight >= self.half_open_probes:
+                return False
+            self.probes_in_flight += 1
+        return True
+
+    def release(self):
+        """Give back a probe slot for a call that ended without an outcome (cancelled, caller error)."""
+        if self.state == HALF_OPEN and self.probes_in_flight > 0:
+            self.probes_in_flight -= 1
+
+    def record_success(self, latency_ms: float):
+        self.success_rate += self.alpha * (1.0 - self.success_rate)
+        self.latency_ms = latency_ms if self.latency_ms is None else self.latency_ms + self.alpha * (latency_ms - self.latency_ms)
+        self.consecutive_failures = 0
+        if self.state == HALF_OPEN:
+            print(f"[BUS][CIRCUIT] {self.target}: probe succeeded, closing.")
+        self.state = CLOSED
+
+    def record_failure(self):
+        self.success_rate -= self.alpha * self.success_rate
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.trip()
+
+    def trip(self):
+        if self.state != OPEN:
+            print(f"[BUS][CIRCUIT] {self.target}: opening after {self.consecutive_failures} consecutive failure(s); failing fast for {self.reset_timeout}s.")
+            REGISTRY.counter("bus_circuit_open_total", "Times a target's breaker opened", target=stream_label(self.target)).inc()
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    @property
+    def health(self) -> float:
+        score = self.success_rate
+        if self.latency_ms is not None and self.latency_ms > self.slow_ms:
+            score *= self.slow_ms / self.latency_ms
+        return round(score, 4)
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "health": self.health,
+            "consecutive_failures": self.consecutive_failures,
+            "latency_ms": None if self.latency_ms is None else round(self.latency_ms, 3),
+        }
+
+
+class BreakerRegistry:
+    def __init__(
+        self,
+        check_liveness: bool = False,
+        max_idle_ms: int = 60000,
+        liveness_ttl: float = 5.0,
+        registry: Optional[MetricsRegistry] = None,
+        **breaker_kwargs,
+    ):
+        self.check_liveness = check_liveness
+        self.max_idle_ms = max_idle_ms
+        self.liveness_ttl = liveness_ttl
+        self.breaker_kwargs = breaker_kwargs
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._liveness: Dict[str, tuple] = {}
+        # only registries given a metrics registry export gauges; close() stops it
+        self._registry = registry
+        if registry is not None:
+            registry.register_collector(self._collect)
+
+    def close(self):
+        """Stop exporting this registry's gauges and drop their series."""
+        if self._registry is None:
+            return
+        self._registry.unregister_collector(self._collect)
+        for target in self._breakers:
+            for name in ("bus_circuit_state", "bus_target_health"):
+                self._registry.remove(name, target=stream_label(target))
+        self._registry = None
+
+    def get(self, target: str) -> CircuitBreaker:
+        breaker = self._breakers.get(target)
+        if breaker is None:
+            breaker = self._breakers[target] = CircuitBreaker(target, **self.breaker_kwargs)
+        return breaker
+
+    async def allow(self, redis, target: str) -> bool:
+        """Breaker check plus, if enabled, the consumer liveness check."""
+        breaker = self.get(target)
+        if not breaker.allow():
+            return False
+        if self.check_liveness and not await self.has_live_consumer(redis, target):
+            print(f"[BUS][CIRCUIT] {target}: no consumer active within {self.max_idle_ms} ms.")
+            breaker.record_failure()
+            return False
+        return True
+
+    async def has_live_consumer(self, redis, target: str) -> bool:
+        cached = self._liveness.get(target)
+        if cached is not None and time.monotonic() - cached[1] < self.liveness_ttl:
+            return cached[0]
+        live = await consumer_is_live(redis, target, self.max_idle_ms)
+        self._liveness[target] = (live, time.monotonic())
+        return live
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {target: breaker.snapshot() for target, breaker in self._breakers.items()}
+
+    def _collect(self, registry: MetricsRegistry):
+        for target, breaker in self._breakers.items():
+            label = stream_label(target)
+            registry.gauge("bus_circuit_state", "Breaker state per target (0 closed, 1 half open, 2 open)", target=label).set(STATE_VALUES[breaker.state])
+            registry.gauge("bus_target_health", "Target health score (0-1)", target=label).set(breaker.health)
+
+
+async def consumer_is_live(redis, stream: str, max_idle_ms: int) -> bool:
+    """True if any consumer of any group on `stream` was active within max_idle_ms."""
+    try:
+        groups = await redis.xinfo_groups(stream)
+    except ResponseError:
+        return False  # no such stream: nobody has ever subscribed
+    for group in groups:
+        name = _decode(_field(group, "name"))
+        for consumer in await redis.xinfo_consumers(stream, name):
+            # Redis 7.2+ reports "inactive" (time since last read attempt); older versions only "idle"
+            inactive = _field(consumer, "inactive")
+            idle = _field(consumer, "idle") if inactive is None or inactive == -1 else inactive
+            if idle is not None and int(idle) <= max_idle_ms:
+                return True
+    return False
+
+
+BREAKERS = BreakerRegistry(registry=REGISTRY)
@@ -0,0 +1,85 @@
+# AG1_AetherBus/cli.py
+"""
+`aetherbus` command line entry point (see [tool.poetry.scripts]).
+
+    aetherbus latency [--stream AG1:agent:muse:inbox] [--json]
+    aetherbus reap-replies [--idle SECONDS]
+    aetherbus bench [all|publish|subscribe|rpc|fanout|codec|subscribe-latency] [--spawn] [--output FILE]
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from AG1_AetherBus.bus import create_redis_client
+from AG1_AetherBus import bench, latency, trimming
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.2f}"
+
+
+async def _latency(args) -> int:
+    redis = create_redis_client(args.url)
+    try:
+        result = await latency.fetch_report(redis, args.stream)
+    finally:
+        await redis.aclose()
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+    if not result:
+        print("No latency data exported yet (services must run latency.run_exporter).")
+        return 0
+    header = f"{'stream':<48} {'count':>8}  {'queue p50/p95/p99 ms':>24}  {'handler p50/p95/p99 ms':>24}  {'total p50/p95/p99 ms':>24}"
+    print(header)
+    print("-" * len(header))
+    for stream, s in result.items():
+        cols = [
+            "/".join(_fmt(s[part][p]) for p in ("p50", "p95", "p99"))
+            for part in ("queue_ms", "handler_ms", "total_ms")
+        ]
+        print(f"{stream:<48} {s['count']:>8}  {cols[0]:>24}  {cols[1]:>24}  {cols[2]:>24}")
+    return 0
+
+
+async def _reap_replies(args) -> int:
+    redis = create_redis_client(args.url)
+    try:
+        counts = await trimming.reap_reply_streams(redis, args.pattern, args.idle)
+    finally:
+        await redis.aclose()
+    print(f"Deleted {counts['deleted']} orphaned reply stream(s); {counts['expiring']} more given a TTL.")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="aetherbus", description="AG1 AetherBus tools")
+    parser.add_argument("--url", help="Redis URL (defaults to build_redis_url())")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    lat = sub.add_parser("latency", help="p50/p95/p99 queueing, handler and end-to-end latency per stream")
+    lat.add_argument("--stream", help="Only this stream")
+    lat.add_argument("--json", action="store_true", help="Machine-readable output")
+    lat.set_defaults(runner=_latency)
+
+    reap = sub.add_parser("reap-replies", help="Delete or expire per-call reply streams left without a TTL")
+    reap.add_argument("--pattern", default=trimming.REPLY_STREAM_PATTERN)
+    reap.add_argument("--idle", type=float, default=trimming.REPLY_TTL_SECONDS, help="Delete streams idle this long (s)")
+    reap.set_defaults(runner=_reap_replies)
+
+    # Options are parsed by bench.build_parser(); see `aetherbus bench --help`
+    sub.add_parser("bench", help="Benchmark suite against a local Redis", add_help=False)
+    return parser
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] == "bench":
+        return bench.main(argv[1:], prog="aetherbus bench")
+    args = build_parser().parse_args(argv)
+    return asyncio.run(args.runner(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
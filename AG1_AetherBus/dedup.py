@@ -0,0 +1,133 @@
+# AG1_AetherBus/dedup.py
+"""
+Envelope-ID deduplication for subscribe().
+
+The same envelope can reach a handler twice: an edge re-publishes it
+(Telegram re-polling, client retries), or an entry is redelivered after a
+reclaim. DedupCache remembers which envelope_ids have been handled so the
+second copy is acked and skipped instead of redoing LLM/MCP work:
+
+    dedup = DedupCache(redis, ttl_seconds=3600)      # shared across replicas
+    await subscribe(redis, inbox, handler, group="muse", dedup=dedup)
+
+Two layers, both bounded:
+
+    local   an LRU of at most `max_entries` ids per process (always on)
+    redis   optional SET NX EX key per id, so replicas in the same group
+            also see each other's envelopes; keys expire after `ttl_seconds`
+
+A claim stores the stream entry ID it was made for. A redelivery of that
+same entry (retry or reclaim after a crash) is therefore let through, while
+a different entry carrying an already-seen envelope_id is a duplicate.
+Failed handlers release their claim so the retry is not mistaken for one.
+
+Hedged requests (hedging.py) carry headers["hedge_of"]: the hedge is
+skipped if the original envelope has already been handled, and handling the
+hedge marks the original as done.
+"""
+import time
+from collections import OrderedDict
+from typing import Optional
+
+DEDUP_KEY_PREFIX = "AG1:dedup:"
+DONE = "done"
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class DedupCache:
+    def __init__(
+        self,
+        redis=None,
+        max_entries: int = 10000,
+        ttl_seconds: float = 3600.0,
+        namespace: str = "default",
+    ):
+        self.redis = redis
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        # envelope_id -> (entry ID it was claimed for, or DONE; expiry monotonic time)
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, envelope_id: str) -> str:
+        return f"{DEDUP_KEY_PREFIX}{self.namespace}:{envelope_id}"
+
+    def _remember(self, envelope_id: str, state: str):
+        self._local[envelope_id] = (state, time.monotonic() + self.ttl_seconds)
+        self._local.move_to_end(envelope_id)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+            self.evictions += 1
+
+    def _local_state(self, envelope_id: str) -> Optional[str]:
+        record = self._local.get(envelope_id)
+        if record is None:
+            return None
+        state, expires = record
+        if time.monotonic() >= expires:
+            del self._local[envelope_id]
+            return None
+        self._local.move_to_end(envelope_id)
+        return state
+
+    async def claim(self, envelope_id: str, entry_id="") -> bool:
+        """
+        True if this envelope should be handled (first sighting, or a
+        redelivery of the entry that claimed it); False if it is a duplicate.
+        """
+        entry_id = _decode(entry_id) or ""
+        state = self._local_state(envelope_id)
+        if state is not None and state != entry_id:
+            self.hits += 1
+            return False
+        if self.redis is not None and state is None:
+            key = self._key(envelope_id)
+            if not await self.redis.set(key, entry_id or DONE, nx=True, ex=int(self.ttl_seconds)):
+                holder = _decode(await self.redis.get(key))
+                if holder is not None and holder != entry_id:
+                    self._remember(envelope_id, holder)
+                    self.hits += 1
+                    return False
+        self._remember(envelope_id, entry_id)
+        self.misses += 1
+        return True
+
+    async def is_done(self, envelope_id: str) -> bool:
+        """True if envelope_id has been handled (not merely claimed)."""
+        if self._local_state(envelope_id) == DONE:
+            return True
+        if self.redis is not None and _decode(await self.redis.get(self._key(envelope_id))) == DONE:
+            self._remember(envelope_id, DONE)
+            return True
+        return False
+
+    async def complete(self, envelope_id: str):
+        """Mark the envelope as handled; any later copy is a duplicate."""
+        self._remember(envelope_id, DONE)
+        if self.redis is not None:
+            await self.redis.set(self._key(envelope_id), DONE, ex=int(self.ttl_seconds))
+
+    async def release(self, envelope_id: str):
+        """Forget a claim after the handler failed, so a retry is handled normally."""
+        self._local.pop(envelope_id, None)
+        if self.redis is not None:
+            await self.redis.delete(self._key(envelope_id))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "size": len(self._local),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
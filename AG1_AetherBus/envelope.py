@@ -4,6 +4,9 @@ import uuid
 from datetime import datetime
 import time
 
+# headers["deadline"]: absolute unix time after which the sender no longer wants a reply
+DEADLINE_HEADER = "deadline"
+
 @dataclass
 class Envelope:
     role: str
@@ -37,3 +40,25 @@ class Envelope:
 
     def add_hop(self, who: str):
         self.trace.append(f"{who}:{int(time.time())}")
+
+    def set_deadline(self, timeout: float):
+        """Stamp an absolute deadline `timeout` seconds from now (set by the RPC helpers)."""
+        if self.headers is None:
+            self.headers = {}
+        self.headers[DEADLINE_HEADER] = f"{time.time() + timeout:.3f}"
+
+    def deadline(self) -> float | None:
+        value = (self.headers or {}).get(DEADLINE_HEADER)
+        try:
+            return float(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    def time_remaining(self) -> float | None:
+        """Seconds until the deadline (negative once passed), or None without one."""
+        deadline = self.deadline()
+        return None if deadline is None else deadline - time.time()
+
+    def expired(self, grace: float = 0.0) -> bool:
+        remaining = self.time_remaining()
+        return remaining is not None and remaining < -grace
@@ -31,6 +31,7 @@ load_dotenv()
 
 # Import bus utilities
 try:
+    from AG1_AetherBus import runtime
     from AG1_AetherBus.bus import subscribe, publish_envelope, build_redis_url
     from AG1_AetherBus.envelope import Envelope
     from AG1_AetherBus.keys import StreamKeyBuilder
@@ -568,4 +569,4 @@ async def main():
         await redis_client.aclose()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    runtime.run(main)
@@ -12,7 +12,8 @@ import argparse # Added for main execution block
 import datetime # For registration timestamp
 
 # Assuming your AG1_AetherBus is in a discoverable path
-from AG1_AetherBus.bus import publish_envelope, build_redis_url, subscribe
+from AG1_AetherBus import runtime
+from AG1_AetherBus.bus import publish_envelope, build_redis_url, read_batches, stream_tail_id, subscribe
 from AG1_AetherBus.keys import StreamKeyBuilder # Make sure this is correctly importable
 from AG1_AetherBus.envelope import Envelope
 
@@ -374,23 +375,26 @@ async def send_message_oneway(request):
     except Exception as e:
         return web.Response(status=500, text=f"Error: {str(e)}")
 
-async def wait_for_reply(redis_client, correlation_id, reply_to_stream, timeout=3):
+async def wait_for_reply(redis_client, correlation_id, reply_to_stream, timeout=3, since_id="$"):
+    # Plain XREAD from since_id (the stream's tail before the request was sent), so
+    # no consumer group is left behind on the reply stream.
     print(f"[RelayWaiter] Waiting for reply: correlation_id={correlation_id}, reply_to={reply_to_stream}")
-    q = asyncio.Queue()
-    async def handler(envelope):
-        if hasattr(envelope, "correlation_id") and envelope.correlation_id == correlation_id:
-            await q.put(envelope.to_dict())
-    # CORRECTED: Pass handler positionally
-    listener_task = asyncio.create_task(subscribe(redis_client, reply_to_stream, handler))
-    try:
-        reply = await asyncio.wait_for(q.get(), timeout=timeout)
-        return reply
-    except asyncio.TimeoutError:
-        return None
-    finally:
-        listener_task.cancel()
-        try: await listener_task
-        except asyncio.CancelledError: pass
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    last_id = since_id
+    while (remaining := deadline - loop.time()) > 0:
+        results = await redis_client.xread({reply_to_stream: last_id}, count=50, block=max(1, int(remaining * 1000)))
+        for _, entries in read_batches(results):
+            for entry_id, fields in entries:
+                last_id = entry_id
+                raw = fields.get(b"data") or fields.get("data")
+                try:
+                    reply = json.loads(raw)
+                except (TypeError, ValueError):
+                    continue
+                if reply.get("correlation_id") == correlation_id:
+                    return reply
+    return None
 
 async def send_message(request): # HTTP endpoint for request-response
     if request.headers.get("Authorization") != f"Bearer {API_KEY}":
@@ -418,11 +422,12 @@ async def send_message(request): # HTTP endpoint for request-response
         content={"text": text}, envelope_type="message"
     )
     
+    since_id = await stream_tail_id(request.app['redis_pool'], reply_to)
+    envelope.set_deadline(10)
     await publish_envelope(request.app['redis_pool'], target_stream, envelope)
     
     print(f"[RELAY][HTTP-Send] Sent to {target_stream}, waiting on {reply_to} (CID: {correlation_id})")
-    # CORRECTED: Pass handler positionally
-    result = await wait_for_reply(request.app['redis_pool'], correlation_id, reply_to, timeout=10)
+    result = await wait_for_reply(request.app['redis_pool'], correlation_id, reply_to, timeout=10, since_id=since_id)
 
     if result:
         return web.json_response(result)
@@ -589,7 +594,7 @@ if __name__ == "__main__":
         await asyncio.Future()
 
     try:
-        asyncio.run(start_all_services())
+        runtime.run(start_all_services)
     except KeyboardInterrupt:
         print("\n[AETHERDECK_HANDLER] Server shutting down (KeyboardInterrupt received).")
         # aiohttp's runner.cleanup() handles closing connections etc. implicitly on shutdown.
@@ -5,10 +5,12 @@ import argparse
 from dotenv import load_dotenv
 from redis.asyncio import Redis
 
-from AG1_AetherBus.bus import build_redis_url, publish_envelope
+from AG1_AetherBus import runtime
+from AG1_AetherBus.bus import build_redis_url, deadline_passed, publish_envelope
 from AG1_AetherBus.agent_bus_minimal import start_bus_subscriptions
 from AG1_AetherBus.envelope import Envelope
 from AG1_AetherBus.keys import StreamKeyBuilder
+from AG1_AetherBus.rpc import reply_stream
 import time
 from openai import AzureOpenAI
 
@@ -53,6 +55,33 @@ def print_timing(start_time: float, step_name: str):
     print(f"[TIMING] {step_name} took {elapsed:.2f}ms")
 
 
+async def stream_completion(env: Envelope, redis: Redis, cfg: dict, prompt: str):
+    """Stream completion tokens to env.reply_to as stream_chunk envelopes, ending with stream_end."""
+    loop = asyncio.get_running_loop()
+    tokens: asyncio.Queue = asyncio.Queue()
+
+    def produce():
+        try:
+            for chunk in client.chat.completions.create(
+                model=cfg["deployment"],
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=env.content.get("max_tokens", 500),
+                temperature=env.content.get("temperature", 0.7),
+                top_p=env.content.get("top_p", 0.95),
+                stream=True,
+            ):
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    loop.call_soon_threadsafe(tokens.put_nowait, delta)
+        finally:
+            loop.call_soon_threadsafe(tokens.put_nowait, None)
+
+    async def chunks():
+        while (token := await tokens.get()) is not None:
+            yield {"text": token}
+
+    await asyncio.gather(asyncio.to_thread(produce), reply_stream(redis, env, chunks(), agent_name="llm_edge"))
+
 async def handle_llm_request(env: Envelope, redis: Redis, cfg: dict):
     """Process incoming LLM requests and publish responses."""
     total_start = time.time()
@@ -89,9 +118,20 @@ async def handle_llm_request(env: Envelope, redis: Redis, cfg: dict):
     reply_to = env.reply_to or keys.edge_response("llm", getattr(env, 'user_id', env.agent_name))
     print(f"Will reply to: {reply_to}")
 
+    # The caller's RPC deadline (headers["deadline"]) may have passed while this waited
+    if deadline_passed(env, REQUEST_STREAM, "llm_edge"):
+        print(f"Skipping LLM call: caller deadline passed {-env.time_remaining():.1f}s ago")
+        return
+
     # Make API call
     api_start = time.time()
     try:
+        if env.content.get("stream"):
+            # Token streaming for bus_rpc_stream callers
+            env.reply_to = reply_to
+            await stream_completion(env, redis, cfg, prompt)
+            print_timing(api_start, "Azure OpenAI streamed call")
+            return
         print("Sending request to Azure OpenAI...")
         response = await asyncio.to_thread(
             client.chat.completions.create,
@@ -163,6 +203,6 @@ def parse_args() -> argparse.Namespace:
 if __name__ == "__main__":
     args = parse_args()
     try:
-        asyncio.run(main(args.config))
+        runtime.run(main(args.config))
     except KeyboardInterrupt:
         pass
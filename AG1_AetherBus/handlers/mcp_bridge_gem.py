@@ -45,7 +45,8 @@ import yaml
 from bs4 import BeautifulSoup
 from typing import List, Dict, Any, Optional
 
-from AG1_AetherBus.bus import subscribe, publish_envelope, REDIS_HOST, REDIS_PORT # Assuming REDIS_HOST, REDIS_PORT are defined in bus.py
+from AG1_AetherBus import runtime
+from AG1_AetherBus.bus import deadline_passed, subscribe, publish_envelope, REDIS_HOST, REDIS_PORT # Assuming REDIS_HOST, REDIS_PORT are defined in bus.py
 from AG1_AetherBus.envelope import Envelope
 from mcp.client.sse import sse_client
 import aiohttp
@@ -69,6 +70,8 @@ SMITHERY_API_KEY = os.getenv("SMITHERY_API_KEY", "98879696-3205-4ae2-b2e4-76c22c
 
 INBOX_CHANNEL = os.getenv("MCP_BRIDGE_INBOX", "AG1:edge:mcp:main:inbox")
 OUTBOX_CHANNEL = os.getenv("MCP_BRIDGE_OUTBOX", "AG1:edge:mcp:main:outbox")
+# Requests handled concurrently, so a batch of discovery queries (bus_rpc_batch) runs in parallel
+MAX_IN_FLIGHT = int(os.getenv("MCP_BRIDGE_MAX_IN_FLIGHT", "8"))
 
 async def _call_smithery_registry_api(
     endpoint_url: str, 
@@ -878,6 +881,11 @@ async def handle_execution_request(request_content: dict, redis_client: aioredis
     if not all([protocol, endpoint_id, tool_name, api_key_for_gateway is not None]): # api_key can be empty string for local
         error_response_content = {"status": "error", "error": "Missing required parameters for execution (protocol, endpoint_id, tool_name, or api_key_for_gateway)"}
     
+    if not error_response_content and deadline_passed(original_envelope, INBOX_CHANNEL, "mcp_bridge"):
+        # The caller's RPC deadline passed while this request was queued; nobody is waiting for the result
+        print(f"[BridgeExecutionHandler] Skipping '{tool_name}': caller deadline passed {-original_envelope.time_remaining():.1f}s ago")
+        return
+
     if error_response_content:
         exec_result_payload = error_response_content
     else:
@@ -1282,7 +1290,7 @@ async def main():
     # Ensure your 'subscribe' function correctly parses the JSON from Redis into an Envelope object
     # before passing it to handle_envelope_wrapper. The log "Received Envelope: Envelope(...)"
     # suggests this is already happening.
-    await subscribe(redis, INBOX_CHANNEL, handle_envelope_wrapper, group="mcp_bridge", consumer="mcp_bridge_consumer")
+    await subscribe(redis, INBOX_CHANNEL, handle_envelope_wrapper, group="mcp_bridge", consumer="mcp_bridge_consumer", max_in_flight=MAX_IN_FLIGHT)
     # subscribe is a blocking call (while True loop), so aclose might not be reached unless subscribe exits
     # Consider try/finally if subscribe can exit.
     # await redis.aclose() # This line might not be reached if subscribe runs forever
@@ -1418,11 +1426,11 @@ if __name__ == "__main__":
     
     #sys.exit()
     # REMOVE ALL RUN_..._TEST blocks or ensure only one is active for focused testing.
-    # For deploying the bridge, this __main__ should ONLY call asyncio.run(main())
+    # For deploying the bridge, this __main__ should ONLY call runtime.run(main)
 
     # Example: To run the bridge as an AetherBus service:
     print("Starting MCP Bridge AetherBus service...")
-    asyncio.run(main())
+    runtime.run(main)
 
     # To run a specific test (ensure only one of these test env vars is true at a time):
     # if os.getenv("RUN_GITHUB_FETCH_TEST") == "true":
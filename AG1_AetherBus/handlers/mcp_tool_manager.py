@@ -46,6 +46,7 @@ import os
 # Assuming these are accessible from this new file's location
 from AG1_AetherBus.envelope import Envelope
 from AG1_AetherBus.bus_adapterV2 import BusAdapterV2 # For making request_response calls
+from AG1_AetherBus.rpc import bus_rpc_batch
 from autogen_core.tools import FunctionTool
 import functools
 
@@ -114,6 +115,11 @@ class McpToolFactory:
             print("[McpToolFactory][discover_and_build_tools] No initial tool queries defined in config.")
             return []
 
+        # One pipelined batch for all queries. The bridge handles up to MCP_BRIDGE_MAX_IN_FLIGHT requests at
+        # once, so discovery takes about as long as the slowest query. The 300s timeout covers the whole
+        # batch (each query must be answered within 300s of sending), not 300s per query in turn.
+        bridge_inbox = self.mcp_config.get('bridge_inbox', MCP_BRIDGE_INBOX_DEFAULT)
+        requests = []
         for search_term in initial_tool_queries:
             print(f"[McpToolFactory][discover_and_build_tools] Discovering tools for query: '{search_term}'")
             discovery_request_content = {
@@ -124,27 +130,27 @@ class McpToolFactory:
                 "service_api_keys": self.mcp_config.get('service_api_keys', {}) 
             }
             request_env = Envelope(role="Agent", content=discovery_request_content, agent_name=self.agent_name)
-            
-            try:
-                response_env = await self.mcp_bridge_client_adapter.request_response(
-                    self.mcp_config.get('bridge_inbox', MCP_BRIDGE_INBOX_DEFAULT), 
-                    request_env, 
-                    timeout=300.0 
-                )
-                if response_env and response_env.content and response_env.content.get("status") == "success":
-                    blueprints = response_env.content.get("tool_blueprints", [])
-                    print(f"[McpToolFactory][discover_and_build_tools] Received {len(blueprints)} tool blueprints for query '{search_term}'.")
-                    all_blueprints.extend(blueprints)
-                # ... (error logging for failed discovery as in MuseAgent.async_mcp_setup) ...
-                elif response_env and response_env.content:
-                    error_detail = response_env.content.get('error', 'Unknown error')
-                    print(f"[McpToolFactory][discover_and_build_tools] Discovery for '{search_term}' failed. Status: {response_env.content.get('status')}, Error: {str(error_detail)[:500]}...")
-                else:
-                    print(f"[McpToolFactory][discover_and_build_tools] No valid response from bridge for query '{search_term}'.")
-            except asyncio.TimeoutError:
-                print(f"[McpToolFactory][discover_and_build_tools] Timeout discovering for '{search_term}'.")
-            except Exception as e:
-                print(f"[McpToolFactory][discover_and_build_tools] Exception discovering for '{search_term}': {e}")
+            requests.append((bridge_inbox, request_env))
+
+        try:
+            responses = await bus_rpc_batch(self.mcp_bridge_client_adapter.redis, requests, timeout=300.0)
+        except Exception as e:
+            print(f"[McpToolFactory][discover_and_build_tools] Exception sending discovery batch: {e}")
+            responses = []
+
+        for search_term, response_env in zip(initial_tool_queries, responses):
+            if isinstance(response_env, dict):
+                print(f"[McpToolFactory][discover_and_build_tools] No response discovering for '{search_term}': {response_env.get('error')}.")
+            elif response_env and response_env.content and response_env.content.get("status") == "success":
+                blueprints = response_env.content.get("tool_blueprints", [])
+                print(f"[McpToolFactory][discover_and_build_tools] Received {len(blueprints)} tool blueprints for query '{search_term}'.")
+                all_blueprints.extend(blueprints)
+            # ... (error logging for failed discovery as in MuseAgent.async_mcp_setup) ...
+            elif response_env and response_env.content:
+                error_detail = response_env.content.get('error', 'Unknown error')
+                print(f"[McpToolFactory][discover_and_build_tools] Discovery for '{search_term}' failed. Status: {response_env.content.get('status')}, Error: {str(error_detail)[:500]}...")
+            else:
+                print(f"[McpToolFactory][discover_and_build_tools] No valid response from bridge for query '{search_term}'.")
         
         if all_blueprints:
             return self._create_tools_from_server_blueprints(all_blueprints)
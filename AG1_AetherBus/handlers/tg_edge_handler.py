@@ -6,6 +6,7 @@ from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.client.default import DefaultBotProperties
 
 from redis.asyncio import Redis
+from AG1_AetherBus import runtime
 from AG1_AetherBus.envelope import Envelope
 from AG1_AetherBus.keys import StreamKeyBuilder
 from AG1_AetherBus.bus import publish_envelope, subscribe, build_redis_url
@@ -273,5 +274,5 @@ if __name__ == "__main__":
         # Keep the process alive (should never exit)
         #await asyncio.Event().wait()
 
-    asyncio.run(main())
+    runtime.run(main)
 
@@ -0,0 +1,168 @@
+# AG1_AetherBus/hedging.py
+"""
+Hedged bus RPCs: cut tail latency when one replica stalls.
+
+    reply = await bus_rpc_hedged(redis, "AG1:agent:muse:inbox", env, timeout=10)
+
+The request is sent once. If no reply has arrived after the target's
+observed p95 round trip (HedgePolicy.percentile), a second copy goes to the
+same stream, where the consumer group hands it to another replica, and
+whichever reply comes first wins. Both copies share the correlation_id, so
+the process-wide reply mux resolves the call on the first reply and ignores
+the second.
+
+Load is bounded by a budget: every request earns `budget` hedge tokens
+(0.1 = at most ~10% extra requests, plus a small burst) and a hedge spends
+one. Until a target has `min_samples` round trips the hedge delay is
+`default_delay`. Percentiles come from per-target HDR histograms
+(latency.HdrHistogram) rotated every `window_seconds`, so the delay follows
+recent latency.
+
+The hedge copy has its own envelope_id and carries headers["hedge_of"] =
+the original envelope_id. A subscriber with a DedupCache skips the hedge
+once the original has been handled, and marks the original done when the
+hedge is handled first. Hedge only idempotent requests, or targets that
+subscribe with dedup.
+"""
+import asyncio
+import copy
+import time
+import uuid
+from typing import Dict, Optional
+
+from AG1_AetherBus.bus import publish_envelope
+from AG1_AetherBus.envelope import Envelope
+from AG1_AetherBus.latency import HdrHistogram
+from AG1_AetherBus.metrics import REGISTRY, stream_label
+from AG1_AetherBus.reply_mux import get_reply_mux, record_rpc_latency
+
+HEDGE_OF_HEADER = "hedge_of"
+
+
+class _TargetStats:
+    __slots__ = ("current", "previous", "rotated_at", "delay", "stale")
+
+    def __init__(self):
+        self.current = HdrHistogram()
+        self.previous = None
+        self.rotated_at = time.monotonic()
+        self.delay = None
+        self.stale = True
+
+
+class HedgePolicy:
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        default_delay: float = 1.0,
+        min_delay: float = 0.01,
+        budget: float = 0.1,
+        max_burst: float = 10.0,
+        min_samples: int = 20,
+        window_seconds: float = 60.0,
+    ):
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.budget = budget
+        self.max_burst = max_burst
+        self.min_samples = min_samples
+        self.window_seconds = window_seconds
+        self._tokens = max_burst
+        self._targets: Dict[str, _TargetStats] = {}
+
+    def _stats(self, target: str) -> _TargetStats:
+        stats = self._targets.get(target)
+        if stats is None:
+            stats = self._targets[target] = _TargetStats()
+        if time.monotonic() - stats.rotated_at >= self.window_seconds:
+            stats.previous, stats.current = stats.current, HdrHistogram()
+            stats.rotated_at = time.monotonic()
+            stats.stale = True
+        return stats
+
+    def record(self, target: str, elapsed_ms: float):
+        stats = self._stats(target)
+        stats.current.record(elapsed_ms)
+        stats.stale = True
+
+    def delay_for(self, target: str) -> float:
+        """Seconds to wait for a reply before hedging."""
+        stats = self._stats(target)
+        if stats.stale:
+            hist = stats.current
+            if hist.count < self.min_samples and stats.previous is not None:
+                hist = HdrHistogram(stats.current.counts).merge(stats.previous)
+            if hist.count < self.min_samples:
+                stats.delay = self.default_delay
+            else:
+                key = f"p{int(self.percentile * 100)}"
+                stats.delay = max(self.min_delay, hist.percentiles((self.percentile,))[key] / 1000)
+            stats.stale = False
+        return stats.delay
+
+    def earn(self):
+        self._tokens = min(self.max_burst, self._tokens + self.budget)
+
+    def try_spend(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+DEFAULT_HEDGE_POLICY = HedgePolicy()
+
+
+async def bus_rpc_hedged(
+    redis,
+    target: str,
+    request_envelope: Envelope,
+    timeout: float = 10.0,
+    policy: Optional[HedgePolicy] = None,
+) -> Optional[Envelope]:
+    """Send request_envelope to target, hedging once per the policy; the first reply, or None on timeout."""
+    policy = policy or DEFAULT_HEDGE_POLICY
+    mux = get_reply_mux(redis)
+    env = request_envelope
+    env.correlation_id = env.correlation_id or str(uuid.uuid4())
+    env.reply_to = mux.stream
+    env.set_deadline(timeout)
+    label = stream_label(target)
+
+    future = mux.expect(env.correlation_id)
+    started = time.perf_counter()
+    try:
+        await mux.ready()
+        await publish_envelope(redis, target, env)
+        policy.earn()
+        delay = policy.delay_for(target)
+        if delay < timeout:
+            try:
+                return await _finish(policy, target, started, asyncio.wait_for(asyncio.shield(future), delay))
+            except asyncio.TimeoutError:
+                pass
+            if policy.try_spend():
+                hedge = copy.deepcopy(env)
+                hedge.envelope_id = str(uuid.uuid4())
+                hedge.headers[HEDGE_OF_HEADER] = env.envelope_id
+                await publish_envelope(redis, target, hedge)
+                REGISTRY.counter("bus_rpc_hedges_total", "Hedge requests sent", target=label).inc()
+            else:
+                REGISTRY.counter("bus_rpc_hedges_denied_total", "Hedges skipped because the budget was spent", target=label).inc()
+        remaining = timeout - (time.perf_counter() - started)
+        return await _finish(policy, target, started, asyncio.wait_for(future, max(0.0, remaining)))
+    except asyncio.TimeoutError:
+        mux.timeouts.inc()
+        print(f"[BUS][RPC][WARN] No reply from {target} within {timeout}s (CID {env.correlation_id}, hedged)")
+        return None
+    finally:
+        mux.unregister(env.correlation_id)
+
+
+async def _finish(policy: HedgePolicy, target: str, started: float, waiter) -> Envelope:
+    reply = await waiter
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    policy.record(target, elapsed_ms)
+    record_rpc_latency(target, elapsed_ms)
+    return reply
@@ -1,4 +1,19 @@
 # keys.py
+
+# Priority lanes of an inbox. "normal" is the inbox stream itself, so senders and
+# readers that know nothing about lanes keep working; the others are sub-streams
+# (e.g. AG1:agent:muse:inbox:high). Publishers choose one with headers["priority"].
+PRIORITY_LANES = ("high", "normal", "low")
+DEFAULT_LANE = "normal"
+
+
+def lane_stream(stream: str, lane: str) -> str:
+    """Key of `lane` for a lane-capable stream (the stream itself for the normal lane)."""
+    if lane not in PRIORITY_LANES:
+        raise ValueError(f"Unknown priority lane '{lane}' (expected one of {PRIORITY_LANES})")
+    return stream if lane == DEFAULT_LANE else f"{stream}:{lane}"
+
+
 class StreamKeyBuilder:
     def __init__(self, namespace="AG1"):
         self.ns = namespace
@@ -18,6 +33,10 @@ class StreamKeyBuilder:
     def agent_inbox(self, agent_id):
         return f"{self.ns}:agent:{agent_id}:inbox"
 
+    def agent_inbox_lane(self, agent_id, lane):
+        """Priority lane of an agent inbox; 'normal' is agent_inbox() itself."""
+        return lane_stream(self.agent_inbox(agent_id), lane)
+
     def session_stream(self, session_code):
         return f"{self.ns}:session:{session_code}:stream"
 
@@ -0,0 +1,233 @@
+# AG1_AetherBus/latency.py
+"""
+End-to-end latency tracking for subscriptions.
+
+The publish time of an entry is taken from its stream entry ID, which Redis
+assigns from its own clock and keeps monotonic per stream, so publishers'
+clocks don't matter and the envelope needs no extra field. For each
+envelope subscribe() records:
+
+    queue_ms    entry ID time -> handler start (time spent sitting in the stream)
+    handler_ms  handler start -> handler end
+    total_ms    entry ID time -> handler end
+
+queue_ms (and so total_ms) compares the Redis server's clock, via the entry
+ID, with the consumer host's time.time(). Any skew between the two shifts
+every queue figure by the skew: a consumer 20 ms ahead of Redis reports
+20 ms too much, one behind reports too little (clamped at 0). Keep consumer
+hosts NTP-synced with the Redis host. handler_ms uses only the local clock
+and is unaffected.
+
+into per-stream HDR-style (log-linear) histograms. Histograms are plain
+bucket-count lists, so merging replicas or computing percentiles is
+element-wise list arithmetic (map/accumulate), with no per-sample storage.
+
+Local report:        latency.report()
+Cross-process:       asyncio.create_task(latency.run_exporter(redis))  # in each service
+                     await latency.fetch_report(redis)                 # or: aetherbus latency
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from bisect import bisect_left
+from itertools import accumulate
+from operator import add
+from typing import Dict, Iterable
+
+LATENCY_KEY_PREFIX = "AG1:bus:latency:"
+EXPORT_TTL_SECONDS = 300
+
+SUB_BUCKET_BITS = 5                   # 32 sub-buckets per power of two -> ~3% relative error
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_VALUE_US = 3600 * 1_000_000       # values above one hour are clamped
+NUM_BUCKETS = SUB_BUCKETS * (MAX_VALUE_US.bit_length() - SUB_BUCKET_BITS + 1)
+PERCENTILES = (0.50, 0.95, 0.99)
+
+
+def _bucket_index(value_us: int) -> int:
+    if value_us < SUB_BUCKETS:
+        return value_us
+    shift = value_us.bit_length() - SUB_BUCKET_BITS - 1
+    return SUB_BUCKETS * (shift + 1) + (value_us >> shift) - SUB_BUCKETS
+
+
+def _bucket_upper_us(index: int) -> int:
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+    return ((mantissa + 1) << shift) - 1
+
+
+class HdrHistogram:
+    """Log-linear histogram of millisecond values, stored in microsecond buckets."""
+
+    __slots__ = ("counts", "count", "max_us")
+
+    def __init__(self, counts=None):
+        self.counts = list(counts) if counts is not None else [0] * NUM_BUCKETS
+        self.count = sum(self.counts)
+        self.max_us = 0
+
+    def record(self, value_ms: float):
+        value_us = min(MAX_VALUE_US, max(0, int(value_ms * 1000)))
+        self.counts[_bucket_index(value_us)] += 1
+        self.count += 1
+        if value_us > self.max_us:
+            self.max_us = value_us
+
+    def merge(self, other: "HdrHistogram") -> "HdrHistogram":
+        self.counts = list(map(add, self.counts, other.counts))
+        self.count += other.count
+        self.max_us = max(self.max_us, other.max_us)
+        return self
+
+    def percentiles(self, qs: Iterable[float] = PERCENTILES) -> Dict[str, float]:
+        """{'p50': ms, 'p95': ms, ...}; each value is the upper edge of its bucket."""
+        if not self.count:
+            return {f"p{int(q * 100)}": None for q in qs}
+        cumulative = list(accumulate(self.counts))
+        out = {}
+        for q in qs:
+            rank = max(1, math.ceil(q * self.count))
+            index = bisect_left(cumulative, rank)
+            out[f"p{int(q * 100)}"] = round(_bucket_upper_us(index) / 1000, 3)
+        return out
+
+    def to_dict(self) -> dict:
+        """Sparse form for export: {bucket_index: count}."""
+        return {"buckets": {str(i): c for i, c in enumerate(self.counts) if c}, "max_us": self.max_us}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HdrHistogram":
+        counts = [0] * NUM_BUCKETS
+        for index, c in data.get("buckets", {}).items():
+            counts[int(index)] = c
+        hist = cls(counts)
+        hist.max_us = data.get("max_us", 0)
+        return hist
+
+
+class StreamLatency:
+    """The three histograms kept for one stream."""
+
+    __slots__ = ("queue", "handler", "total")
+
+    def __init__(self):
+        self.queue = HdrHistogram()
+        self.handler = HdrHistogram()
+        self.total = HdrHistogram()
+
+    def record(self, queue_ms: float, handler_ms: float):
+        self.queue.record(queue_ms)
+        self.handler.record(handler_ms)
+        self.total.record(queue_ms + handler_ms)
+
+    def merge(self, other: "StreamLatency") -> "StreamLatency":
+        self.queue.merge(other.queue)
+        self.handler.merge(other.handler)
+        self.total.merge(other.total)
+        return self
+
+    def summary(self) -> dict:
+        return {
+            "count": self.total.count,
+            "queue_ms": self.queue.percentiles(),
+            "handler_ms": self.handler.percentiles(),
+            "total_ms": self.total.percentiles(),
+            "max_total_ms": round(self.total.max_us / 1000, 3),
+        }
+
+    def to_dict(self) -> dict:
+        return {"queue": self.queue.to_dict(), "handler": self.handler.to_dict(), "total": self.total.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "StreamLatency":
+        sl = cls()
+        sl.queue = HdrHistogram.from_dict(data.get("queue", {}))
+        sl.handler = HdrHistogram.from_dict(data.get("handler", {}))
+        sl.total = HdrHistogram.from_dict(data.get("total", {}))
+        return sl
+
+
+class LatencyTracker:
+    def __init__(self):
+        self.streams: Dict[str, StreamLatency] = {}
+
+    def for_stream(self, stream: str) -> StreamLatency:
+        sl = self.streams.get(stream)
+        if sl is None:
+            sl = self.streams[stream] = StreamLatency()
+        return sl
+
+    def report(self, stream: str = None) -> Dict[str, dict]:
+        return {
+            name: sl.summary() for name, sl in self.streams.items()
+            if stream is None or name == stream
+        }
+
+
+TRACKER = LatencyTracker()
+
+
+def entry_id_ms(entry_id) -> int:
+    """Millisecond timestamp part of a stream entry ID."""
+    entry_id = entry_id.decode() if isinstance(entry_id, bytes) else str(entry_id)
+    return int(entry_id.split("-", 1)[0])
+
+
+def queue_delay_ms(entry_id, now: float = None) -> float:
+    """How long an entry has been in its stream, by the entry ID's timestamp (Redis clock vs. ours)."""
+    now = time.time() if now is None else now
+    return max(0.0, now * 1000 - entry_id_ms(entry_id))
+
+
+def report(stream: str = None) -> Dict[str, dict]:
+    """p50/p95/p99 for this process's subscriptions."""
+    return TRACKER.report(stream)
+
+
+async def export_once(redis, source: str = None, tracker: LatencyTracker = TRACKER):
+    """Write this process's histograms to AG1:bus:latency:<stream> (hash field per process)."""
+    source = source or f"{os.uname().nodename}:{os.getpid()}"
+    pipe = redis.pipeline(transaction=False)
+    for stream, sl in list(tracker.streams.items()):
+        key = LATENCY_KEY_PREFIX + stream
+        pipe.hset(key, source, json.dumps(sl.to_dict()))
+        pipe.expire(key, EXPORT_TTL_SECONDS)
+    await pipe.execute()
+
+
+async def run_exporter(redis, interval: float = 15.0, source: str = None):
+    """Export histograms every `interval` seconds so `aetherbus latency` can see them."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await export_once(redis, source)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[BUS][LATENCY][ERROR] Export failed: {e}")
+
+
+async def fetch_report(redis, stream: str = None) -> Dict[str, dict]:
+    """Merge exported histograms from every process and summarise per stream."""
+    merged: Dict[str, StreamLatency] = {}
+    pattern = LATENCY_KEY_PREFIX + (stream or "*")
+    cursor = "0"
+    while True:
+        cursor, keys = await redis.scan(cursor=cursor, match=pattern)
+        for key in keys:
+            key = key.decode() if isinstance(key, bytes) else key
+            name = key[len(LATENCY_KEY_PREFIX):]
+            for raw in (await redis.hgetall(key)).values():
+                sl = StreamLatency.from_dict(json.loads(raw))
+                if name in merged:
+                    merged[name].merge(sl)
+                else:
+                    merged[name] = sl
+        if cursor in (0, "0", b"0"):
+            break
+    return {name: sl.summary() for name, sl in sorted(merged.items())}
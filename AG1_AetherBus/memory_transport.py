@@ -0,0 +1,559 @@
+# AG1_AetherBus/memory_transport.py
+"""
+In-process transport: Redis streams, consumer groups and acks on asyncio
+primitives.
+
+The bus never talks to Redis directly; every helper (publish_envelope,
+subscribe, subscribe_simple, the rpc functions, SafeTrimmer, ...) takes a
+client object and calls the redis.asyncio command methods on it.
+InMemoryRedis implements that same command surface over in-process data
+structures, so co-located agents exchange envelopes with no network hop,
+and integration tests run without a Redis server:
+
+    redis = InMemoryRedis()
+    asyncio.create_task(subscribe(redis, "AG1:agent:a:inbox", handler, group="a"))
+    await publish_envelope(redis, "AG1:agent:a:inbox", env)
+
+Set BUS_TRANSPORT=memory to make bus.create_redis_client() hand out one
+shared instance per process.
+
+Replies use redis-py's default (decode_responses=False) shapes: keys, IDs
+and field names/values come back as bytes.
+"""
+import asyncio
+import fnmatch
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from redis.exceptions import ResponseError
+
+IdTuple = Tuple[int, int]
+MAX_ID: IdTuple = (2 ** 64 - 1, 2 ** 64 - 1)
+
+
+def _b(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, (bytearray, memoryview)):
+        return bytes(value)
+    return str(value).encode()
+
+
+def _s(value) -> str:
+    return value.decode() if isinstance(value, (bytes, bytearray)) else str(value)
+
+
+def _parse_id(value, default_seq: int = 0) -> IdTuple:
+    value = _s(value)
+    if value == "-":
+        return (0, 0)
+    if value == "+":
+        return MAX_ID
+    ms, sep, seq = value.partition("-")
+    return int(ms), int(seq) if sep else default_seq
+
+
+def _fmt_id(entry_id: IdTuple) -> bytes:
+    return f"{entry_id[0]}-{entry_id[1]}".encode()
+
+
+class _Group:
+    __slots__ = ("last_delivered", "entries_read", "pel", "consumers")
+
+    def __init__(self, last_delivered: IdTuple):
+        self.last_delivered = last_delivered
+        self.entries_read = 0
+        # id -> [consumer, delivery time (ms), delivery count]
+        self.pel: "OrderedDict[IdTuple, list]" = OrderedDict()
+        # consumer -> last seen (monotonic seconds)
+        self.consumers: Dict[str, float] = {}
+
+
+class _Stream:
+    __slots__ = ("ids", "entries", "last_id", "groups")
+
+    def __init__(self):
+        self.ids: List[IdTuple] = []
+        self.entries: List[dict] = []
+        self.last_id: IdTuple = (0, 0)
+        self.groups: Dict[str, _Group] = {}
+
+    def after(self, entry_id: IdTuple, count: Optional[int]) -> list:
+        start = bisect_right(self.ids, entry_id)
+        stop = len(self.ids) if not count else min(len(self.ids), start + count)
+        return [(self.ids[i], self.entries[i]) for i in range(start, stop)]
+
+    def trim_to(self, keep_from: int) -> int:
+        """Drop the first `keep_from` entries; returns how many were removed."""
+        if keep_from <= 0:
+            return 0
+        del self.ids[:keep_from]
+        del self.entries[:keep_from]
+        return keep_from
+
+
+class InMemoryPipeline:
+    """Queues commands and runs them in order on execute() (no network, so no batching needed)."""
+
+    def __init__(self, client: "InMemoryRedis"):
+        self._client = client
+        self._calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        def queue(*args, **kwargs):
+            self._calls.append((method, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self, raise_on_error: bool = True):
+        calls, self._calls = self._calls, []
+        results = []
+        for method, args, kwargs in calls:
+            try:
+                results.append(await method(*args, **kwargs))
+            except ResponseError as e:
+                if raise_on_error:
+                    raise
+                results.append(e)
+        return results
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._calls = []
+
+    def reset(self):
+        self._calls = []
+
+
+class InMemoryRedis:
+    """The subset of redis.asyncio.Redis used by the bus, kept in process memory."""
+
+    def __init__(self):
+        self._streams: Dict[str, _Stream] = {}
+        self._strings: Dict[str, bytes] = {}
+        self._hashes: Dict[str, Dict[bytes, bytes]] = {}
+        self._zsets: Dict[str, Dict[bytes, float]] = {}
+        self._expiry: Dict[str, float] = {}
+        self._waiters: Dict[str, set] = {}
+
+    # --- housekeeping -------------------------------------------------
+
+    def _expire_if_needed(self, key: str):
+        deadline = self._expiry.get(key)
+        if deadline is not None and time.monotonic() >= deadline:
+            self._drop(key)
+
+    def _drop(self, key: str) -> bool:
+        self._expiry.pop(key, None)
+        found = False
+        for store in (self._streams, self._strings, self._hashes, self._zsets):
+            if store.pop(key, None) is not None:
+                found = True
+        return found
+
+    def _keys(self) -> List[str]:
+        keys = set(self._streams) | set(self._strings) | set(self._hashes) | set(self._zsets)
+        for key in list(keys):
+            self._expire_if_needed(key)
+        return [k for k in keys if self._type(k) is not None]
+
+    def _present(self, key: str) -> bool:
+        """Whether key exists (and hasn't expired); O(1), unlike _keys()."""
+        self._expire_if_needed(key)
+        return self._type(key) is not None
+
+    def _type(self, key: str) -> Optional[str]:
+        if key in self._streams:
+            return "stream"
+        if key in self._strings:
+            return "string"
+        if key in self._hashes:
+            return "hash"
+        if key in self._zsets:
+            return "zset"
+        return None
+
+    def _stream(self, name, create: bool = False) -> Optional[_Stream]:
+        key = _s(name)
+        self._expire_if_needed(key)
+        stream = self._streams.get(key)
+        if stream is None and create:
+            stream = self._streams[key] = _Stream()
+        return stream
+
+    def _wake(self, key: str):
+        for fut in self._waiters.pop(key, ()):
+            if not fut.done():
+                fut.set_result(True)
+
+    async def _wait_for_data(self, keys: List[str], block: int):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        for key in keys:
+            self._waiters.setdefault(key, set()).add(fut)
+        try:
+            await asyncio.wait_for(fut, timeout=None if block == 0 else block / 1000)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for key in keys:
+                waiters = self._waiters.get(key)
+                if waiters is not None:
+                    waiters.discard(fut)
+                    if not waiters:
+                        self._waiters.pop(key, None)
+
+    # --- connection-ish -------------------------------------------------
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> InMemoryPipeline:
+        return InMemoryPipeline(self)
+
+    async def ping(self, **kwargs):
+        return True
+
+    async def info(self, section=None, **kwargs):
+        return {"redis_version": "in-memory", "transport": "memory"}
+
+    async def aclose(self, close_connection_pool=None):
+        return None
+
+    close = aclose
+
+    # --- keys -------------------------------------------------------------
+
+    async def exists(self, *names) -> int:
+        return sum(1 for n in names if self._present(_s(n)))
+
+    async def delete(self, *names) -> int:
+        return sum(1 for n in names if self._drop(_s(n)))
+
+    async def expire(self, name, time_seconds, **kwargs) -> bool:
+        key = _s(name)
+        if not self._present(key):
+            return False
+        seconds = time_seconds.total_seconds() if hasattr(time_seconds, "total_seconds") else time_seconds
+        self._expiry[key] = time.monotonic() + seconds
+        return True
+
+    async def ttl(self, name) -> int:
+        key = _s(name)
+        if not self._present(key):
+            return -2
+        deadline = self._expiry.get(key)
+        return -1 if deadline is None else max(0, int(deadline - time.monotonic()))
+
+    async def type(self, name) -> bytes:
+        self._expire_if_needed(_s(name))
+        return _b(self._type(_s(name)) or "none")
+
+    async def scan(self, cursor=0, match=None, count=None, _type=None, **kwargs):
+        keys = self._keys()
+        if match is not None:
+            keys = [k for k in keys if fnmatch.fnmatchcase(k, _s(match))]
+        if _type is not None:
+            keys = [k for k in keys if self._type(k) == _s(_type).lower()]
+        return 0, [_b(k) for k in sorted(keys)]
+
+    # --- strings / hashes / sorted sets ----------------------------------
+
+    async def get(self, name):
+        self._expire_if_needed(_s(name))
+        return self._strings.get(_s(name))
+
+    async def set(self, name, value, ex=None, px=None, nx=False, xx=False, **kwargs):
+        key = _s(name)
+        self._expire_if_needed(key)
+        exists = key in self._strings
+        if (nx and exists) or (xx and not exists):
+            return None
+        self._drop(key)
+        self._strings[key] = _b(value)
+        if ex is not None:
+            self._expiry[key] = time.monotonic() + (ex.total_seconds() if hasattr(ex, "total_seconds") else ex)
+        elif px is not None:
+            self._expiry[key] = time.monotonic() + (px.total_seconds() if hasattr(px, "total_seconds") else px / 1000)
+        return True
+
+    async def hset(self, name, key=None, value=None, mapping=None, **kwargs) -> int:
+        h = self._hashes.setdefault(_s(name), {})
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        added = 0
+        for k, v in items.items():
+            added += _b(k) not in h
+            h[_b(k)] = _b(v)
+        return added
+
+    async def hmget(self, name, keys, *args) -> list:
+        self._expire_if_needed(_s(name))
+        h = self._hashes.get(_s(name), {})
+        fields = (list(keys) if isinstance(keys, (list, tuple)) else [keys]) + list(args)
+        return [h.get(_b(k)) for k in fields]
+
+    async def hdel(self, name, *keys) -> int:
+        h = self._hashes.get(_s(name), {})
+        removed = sum(1 for k in keys if h.pop(_b(k), None) is not None)
+        if not h:
+            self._hashes.pop(_s(name), None)
+        return removed
+
+    async def hgetall(self, name) -> dict:
+        self._expire_if_needed(_s(name))
+        return dict(self._hashes.get(_s(name), {}))
+
+    async def zadd(self, name, mapping, nx=False, **kwargs) -> int:
+        z = self._zsets.setdefault(_s(name), {})
+        added = 0
+        for member, score in mapping.items():
+            member = _b(member)
+            if nx and member in z:
+                continue
+            added += member not in z
+            z[member] = float(score)
+        return added
+
+    async def zrem(self, name, *values) -> int:
+        z = self._zsets.get(_s(name), {})
+        removed = sum(1 for v in values if z.pop(_b(v), None) is not None)
+        if not z:
+            self._zsets.pop(_s(name), None)
+        return removed
+
+    async def zcard(self, name) -> int:
+        return len(self._zsets.get(_s(name), {}))
+
+    async def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False, **kwargs):
+        lo = float("-inf") if _s(min) == "-inf" else float(min)
+        hi = float("inf") if _s(max) == "+inf" else float(max)
+        members = sorted(
+            ((score, member) for member, score in self._zsets.get(_s(name), {}).items() if lo <= score <= hi)
+        )
+        if start is not None and num is not None:
+            members = members[start:start + num]
+        if withscores:
+            return [(member, score) for score, member in members]
+        return [member for _, member in members]
+
+    # --- streams ----------------------------------------------------------
+
+    def _next_id(self, stream: _Stream, requested) -> IdTuple:
+        if _s(requested) == "*":
+            now_ms = int(time.time() * 1000)
+            last_ms, last_seq = stream.last_id
+            return (now_ms, 0) if now_ms > last_ms else (last_ms, last_seq + 1)
+        entry_id = _parse_id(requested)
+        if entry_id <= stream.last_id:
+            raise ResponseError("ERR The ID specified in XADD is equal or smaller than the target stream top item")
+        return entry_id
+
+    def _trim(self, stream: _Stream, maxlen=None, minid=None) -> int:
+        if maxlen is not None:
+            return stream.trim_to(len(stream.ids) - int(maxlen))
+        if minid is not None:
+            return stream.trim_to(bisect_left(stream.ids, _parse_id(minid)))
+        return 0
+
+    async def xadd(self, name, fields, id="*", maxlen=None, approximate=True,
+                   nomkstream=False, minid=None, limit=None) -> Optional[bytes]:
+        key = _s(name)
+        stream = self._stream(key, create=not nomkstream)
+        if stream is None:
+            return None
+        entry_id = self._next_id(stream, id)
+        stream.ids.append(entry_id)
+        stream.entries.append({_b(k): _b(v) for k, v in fields.items()})
+        stream.last_id = entry_id
+        self._trim(stream, maxlen, minid)
+        self._wake(key)
+        return _fmt_id(entry_id)
+
+    async def xlen(self, name) -> int:
+        stream = self._stream(name)
+        return len(stream.ids) if stream else 0
+
+    async def xtrim(self, name, maxlen=None, approximate=True, minid=None, limit=None) -> int:
+        stream = self._stream(name)
+        return self._trim(stream, maxlen, minid) if stream else 0
+
+    async def xrange(self, name, min="-", max="+", count=None) -> list:
+        stream = self._stream(name)
+        if not stream:
+            return []
+        lo, hi = _parse_id(min), _parse_id(max, default_seq=2 ** 64 - 1)
+        out = [(_fmt_id(i), dict(e)) for i, e in zip(stream.ids, stream.entries) if lo <= i <= hi]
+        return out[:count] if count else out
+
+    async def xrevrange(self, name, max="+", min="-", count=None) -> list:
+        stream = self._stream(name)
+        if not stream:
+            return []
+        lo, hi = _parse_id(min), _parse_id(max, default_seq=2 ** 64 - 1)
+        out = [(_fmt_id(i), dict(e)) for i, e in zip(reversed(stream.ids), reversed(stream.entries)) if lo <= i <= hi]
+        return out[:count] if count else out
+
+    async def xread(self, streams: dict, count=None, block=None) -> list:
+        cursors = {}
+        for name, last in streams.items():
+            stream = self._stream(name)
+            if _s(last) == "$":
+                cursors[_s(name)] = stream.last_id if stream else (0, 0)
+            else:
+                cursors[_s(name)] = _parse_id(last)
+        deadline = None if block in (None, 0) else time.monotonic() + block / 1000
+        while True:
+            out = []
+            for key, cursor in cursors.items():
+                stream = self._stream(key)
+                if stream:
+                    entries = stream.after(cursor, count)
+                    if entries:
+                        out.append([_b(key), [(_fmt_id(i), dict(e)) for i, e in entries]])
+            if out or block is None:
+                return out
+            remaining = 0 if deadline is None else int((deadline - time.monotonic()) * 1000)
+            if deadline is not None and remaining <= 0:
+                return []
+            await self._wait_for_data(list(cursors), remaining)
+
+    async def xgroup_create(self, name, groupname, id="$", mkstream=False, entries_read=None) -> bool:
+        stream = self._stream(name, create=mkstream)
+        if stream is None:
+            raise ResponseError("ERR The XGROUP subcommand requires the key to exist. Note that for CREATE you may want to use the MKSTREAM option to create an empty stream automatically.")
+        group = _s(groupname)
+        if group in stream.groups:
+            raise ResponseError("BUSYGROUP Consumer Group name already exists")
+        start = stream.last_id if _s(id) == "$" else _parse_id(id)
+        stream.groups[group] = _Group(start)
+        return True
+
+    async def xgroup_destroy(self, name, groupname) -> int:
+        stream = self._stream(name)
+        if not stream:
+            return 0
+        return 1 if stream.groups.pop(_s(groupname), None) is not None else 0
+
+    def _group(self, name, groupname) -> Tuple[_Stream, _Group]:
+        stream = self._stream(name)
+        group = stream.groups.get(_s(groupname)) if stream else None
+        if group is None:
+            raise ResponseError(f"NOGROUP No such key '{_s(name)}' or consumer group '{_s(groupname)}'")
+        return stream, group
+
+    async def xreadgroup(self, groupname, consumername, streams: dict, count=None, block=None, noack=False) -> list:
+        consumer = _s(consumername)
+        for name in streams:
+            self._group(name, groupname)  # raise NOGROUP up front, like Redis
+        deadline = None if block in (None, 0) else time.monotonic() + block / 1000
+        while True:
+            out = []
+            now_ms = int(time.time() * 1000)
+            for name, last in streams.items():
+                stream, group = self._group(name, groupname)
+                group.consumers[consumer] = time.monotonic()
+                if _s(last) == ">":
+                    entries = stream.after(group.last_delivered, count)
+                    if entries:
+                        group.last_delivered = entries[-1][0]
+                        group.entries_read += len(entries)
+                        if not noack:
+                            for entry_id, _ in entries:
+                                group.pel[entry_id] = [consumer, now_ms, 1]
+                        out.append([_b(name), [(_fmt_id(i), dict(e)) for i, e in entries]])
+                else:
+                    # History: this consumer's pending entries after the given ID
+                    start = _parse_id(last)
+                    history = []
+                    for entry_id, record in group.pel.items():
+                        if record[0] == consumer and entry_id > start:
+                            idx = bisect_left(stream.ids, entry_id)
+                            present = idx < len(stream.ids) and stream.ids[idx] == entry_id
+                            history.append((_fmt_id(entry_id), dict(stream.entries[idx]) if present else None))
+                            if count and len(history) >= count:
+                                break
+                    out.append([_b(name), history])
+                    return out
+            if out or block is None:
+                return out
+            remaining = 0 if deadline is None else int((deadline - time.monotonic()) * 1000)
+            if deadline is not None and remaining <= 0:
+                return []
+            await self._wait_for_data([_s(n) for n in streams], remaining)
+
+    async def xack(self, name, groupname, *ids) -> int:
+        try:
+            _, group = self._group(name, groupname)
+        except ResponseError:
+            return 0
+        return sum(1 for i in ids if group.pel.pop(_parse_id(i), None) is not None)
+
+    async def xpending(self, name, groupname) -> dict:
+        _, group = self._group(name, groupname)
+        if not group.pel:
+            return {"pending": 0, "min": None, "max": None, "consumers": []}
+        per_consumer: Dict[str, int] = {}
+        for consumer, _, _ in group.pel.values():
+            per_consumer[consumer] = per_consumer.get(consumer, 0) + 1
+        ids = sorted(group.pel)
+        return {
+            "pending": len(ids),
+            "min": _fmt_id(ids[0]),
+            "max": _fmt_id(ids[-1]),
+            "consumers": [{"name": _b(c), "pending": n} for c, n in per_consumer.items()],
+        }
+
+    async def xinfo_groups(self, name) -> list:
+        stream = self._stream(name)
+        if stream is None:
+            raise ResponseError("ERR no such key")
+        out = []
+        for group_name, group in stream.groups.items():
+            out.append({
+                "name": _b(group_name),
+                "consumers": len(group.consumers),
+                "pending": len(group.pel),
+                "last-delivered-id": _fmt_id(group.last_delivered),
+                "entries-read": group.entries_read,
+                "lag": len(stream.ids) - bisect_right(stream.ids, group.last_delivered),
+            })
+        return out
+
+    async def xinfo_consumers(self, name, groupname) -> list:
+        _, group = self._group(name, groupname)
+        now = time.monotonic()
+        pending: Dict[str, int] = {}
+        for consumer, _, _ in group.pel.values():
+            pending[consumer] = pending.get(consumer, 0) + 1
+        return [
+            {"name": _b(c), "pending": pending.get(c, 0), "idle": int((now - seen) * 1000)}
+            for c, seen in group.consumers.items()
+        ]
+
+    async def xinfo_stream(self, name) -> dict:
+        stream = self._stream(name)
+        if stream is None:
+            raise ResponseError("ERR no such key")
+        return {
+            "length": len(stream.ids),
+            "groups": len(stream.groups),
+            "last-generated-id": _fmt_id(stream.last_id),
+            "first-entry": (_fmt_id(stream.ids[0]), dict(stream.entries[0])) if stream.ids else None,
+            "last-entry": (_fmt_id(stream.ids[-1]), dict(stream.entries[-1])) if stream.ids else None,
+        }
+
+
+_SHARED: Optional[InMemoryRedis] = None
+
+
+def shared() -> InMemoryRedis:
+    """The process-wide instance handed out when BUS_TRANSPORT=memory."""
+    global _SHARED
+    if _SHARED is None:
+        _SHARED = InMemoryRedis()
+    return _SHARED
@@ -0,0 +1,339 @@
+# AG1_AetherBus/metrics.py
+"""
+In-process metrics for the bus: counters, gauges and latency histograms,
+labelled by stream and consumer group.
+
+The bus instruments itself against the module-level REGISTRY:
+
+    bus_publish_total / bus_publish_ms            publish_envelope
+    bus_consume_total / bus_handler_errors_total  subscribe
+    bus_decode_ms / bus_handler_ms / bus_ack_ms   subscribe
+    bus_in_flight / bus_reader_blocked_seconds    backpressure windows
+    bus_pending / bus_group_lag                   StreamGaugePoller (XINFO GROUPS)
+    bus_trim_safe_total / bus_trim_forced_total   trimming.SafeTrimmer
+    bus_dedup_hits_total / bus_dedup_misses_total subscribe(dedup=...)
+    bus_expired_total                             subscribe (past headers["deadline"])
+
+Recording is a dict lookup plus an add (histograms add a bisect), so it is
+safe to leave on in production; set BUS_METRICS=0 to turn it off entirely.
+
+Export either as Prometheus text (start_metrics_server / render_prometheus)
+or as periodic snapshot envelopes on a bus stream (publish_snapshots).
+"""
+import asyncio
+import json
+import os
+import time
+import traceback
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+from AG1_AetherBus.backpressure import WINDOWS
+from AG1_AetherBus.envelope import Envelope
+from AG1_AetherBus.latency import TRACKER
+from AG1_AetherBus.retention import classify_stream, xadd_kwargs
+
+ENABLED = os.getenv("BUS_METRICS", "1") != "0"
+METRICS_STREAM = "AG1:bus:metrics"
+# Latency buckets in milliseconds
+DEFAULT_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+# Guard against unbounded label cardinality (e.g. one stream per RPC call)
+MAX_SERIES_PER_METRIC = int(os.getenv("BUS_METRICS_MAX_SERIES", 2000))
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def stream_label(stream) -> str:
+    """
+    Label value for a stream. Per-call reply streams are collapsed into their
+    key class so they don't create a new series per RPC.
+    """
+    stream = stream.decode() if isinstance(stream, bytes) else str(stream)
+    if classify_stream(stream) in ("rpc_reply", "ephemeral_reply"):
+        return "<rpc_reply>"
+    return stream
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def sample(self):
+        return self.value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def sample(self):
+        return self.value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def sample(self):
+        return {
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+            "sum": round(self.sum, 3),
+            "count": self.count,
+        }
+
+
+class _NullMetric:
+    """Returned when metrics are disabled or a metric is over its series cap."""
+    kind = "null"
+    value = 0
+
+    def inc(self, amount: float = 1.0):
+        pass
+
+    def dec(self, amount: float = 1.0):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+
+NULL_METRIC = _NullMetric()
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        # name -> (kind, help, {label_key: metric})
+        self._families: Dict[str, Tuple[str, str, Dict[LabelKey, object]]] = {}
+        self._collectors: List[Callable[["MetricsRegistry"], None]] = []
+
+    def _get(self, factory, name: str, help: str, labels: dict):
+        if not self.enabled:
+            return NULL_METRIC
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (factory.kind, help, {})
+        series = family[2]
+        key = tuple(sorted(labels.items()))
+        metric = series.get(key)
+        if metric is None:
+            if len(series) >= MAX_SERIES_PER_METRIC:
+                return NULL_METRIC
+            metric = series[key] = factory()
+        return metric
+
+    def counter(self, name: str, help: str = "", **labels) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str = "", **labels) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str = "", **labels) -> Histogram:
+        return self._get(Histogram, name, help, labels)
+
+    def register_collector(self, collector: Callable[["MetricsRegistry"], None]):
+        """Register a callable that refreshes gauges right before export."""
+        self._collectors.append(collector)
+
+    def remove(self, name: str, **labels):
+        """Drop one series (e.g. a gauge whose source has gone away)."""
+        family = self._families.get(name)
+        if family is not None:
+            family[2].pop(tuple(sorted(labels.items())), None)
+
+    def unregister_collector(self, collector: Callable[["MetricsRegistry"], None]):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def collect(self):
+        for collector in self._collectors:
+            try:
+                collector(self)
+            except Exception:
+                traceback.print_exc()
+
+    def snapshot(self) -> dict:
+        """JSON-friendly view of every series."""
+        self.collect()
+        out = {}
+        for name, (kind, help, series) in self._families.items():
+            out[name] = {
+                "type": kind,
+                "series": [{"labels": dict(key), "value": metric.sample()} for key, metric in series.items()],
+            }
+        return out
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (v0.0.4)."""
+        self.collect()
+        lines = []
+        for name, (kind, help, series) in sorted(self._families.items()):
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in series.items():
+                if kind == "histogram":
+                    cumulative = 0
+                    for bound, count in zip(list(metric.buckets) + ["+Inf"], metric.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_fmt_labels(key + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_sum{_fmt_labels(key)} {metric.sum}")
+                    lines.append(f"{name}_count{_fmt_labels(key)} {metric.count}")
+                else:
+                    lines.append(f"{name}{_fmt_labels(key)} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+REGISTRY = MetricsRegistry(enabled=ENABLED)
+
+
+def _collect_flow_windows(registry: MetricsRegistry):
+    for (channel, group), window in list(WINDOWS.items()):
+        labels = {"stream": stream_label(channel), "group": group or ""}
+        stats = window.stats()
+        registry.gauge("bus_in_flight", "Envelopes currently being handled", **labels).set(stats["in_flight"])
+        registry.gauge("bus_reader_blocked_seconds", "Time the reader spent paused on a full window", **labels).set(stats["blocked_seconds"])
+
+
+REGISTRY.register_collector(_collect_flow_windows)
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+async def collect_group_gauges(redis, stream: str, registry: MetricsRegistry = REGISTRY):
+    """Refresh bus_pending / bus_group_lag for every consumer group on `stream`."""
+    for info in await redis.xinfo_groups(stream):
+        labels = {"stream": stream_label(stream), "group": _decode(info["name"])}
+        registry.gauge("bus_pending", "Entries delivered but not yet acked (PEL size)", **labels).set(info.get("pending") or 0)
+        if info.get("lag") is not None:  # Redis >= 7
+            registry.gauge("bus_group_lag", "Entries not yet delivered to the group", **labels).set(info["lag"])
+
+
+class StreamGaugePoller:
+    """
+    Background task polling PEL size and group lag. Polls the given streams
+    plus every stream with a live subscription in this process.
+    """
+
+    def __init__(self, redis, streams: List[str] = None, interval: float = 15.0, registry: MetricsRegistry = REGISTRY):
+        self.redis = redis
+        self.streams = list(streams or [])
+        self.interval = interval
+        self.registry = registry
+
+    async def run(self):
+        while True:
+            streams = set(self.streams) | {channel for channel, _ in list(WINDOWS)}
+            for stream in streams:
+                try:
+                    await collect_group_gauges(self.redis, stream, self.registry)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"[BUS][METRICS][WARN] Could not read group info for '{stream}': {e}")
+            await asyncio.sleep(self.interval)
+
+
+async def publish_snapshots(redis, stream: str = METRICS_STREAM, interval: float = 60.0,
+                            source: str = None, registry: MetricsRegistry = REGISTRY):
+    """Publish registry.snapshot() as a metrics_snapshot envelope every `interval` seconds."""
+    source = source or f"{os.uname().nodename}:{os.getpid()}"
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            env = Envelope(
+                role="system",
+                agent_name="bus_metrics",
+                envelope_type="metrics_snapshot",
+                content={"source": source, "at": time.time(), "metrics": registry.snapshot()},
+            )
+            await redis.xadd(stream, {"data": json.dumps(env.to_dict())}, **xadd_kwargs(stream))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[BUS][METRICS][ERROR] Snapshot publish to '{stream}' failed: {e}")
+
+
+async def start_metrics_server(host: str = "0.0.0.0", port: int = 9464, registry: MetricsRegistry = REGISTRY):
+    """
+    Serve GET /metrics in Prometheus text format. Returns the aiohttp
+    AppRunner; call `await runner.cleanup()` to stop it.
+    """
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=registry.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"[BUS][METRICS] Prometheus endpoint on http://{host}:{port}/metrics")
+    return runner
+
+
+class SubscriptionMetrics:
+    """Series for one (stream, group) subscription, resolved once so the hot path skips label lookups."""
+
+    def __init__(self, stream: str, group: str, registry: MetricsRegistry = REGISTRY, dedup: bool = False):
+        labels = {"stream": stream_label(stream), "group": group or ""}
+        self.consumed = registry.counter("bus_consume_total", "Envelopes handled successfully", **labels)
+        self.errors = registry.counter("bus_handler_errors_total", "Handler or decode failures", **labels)
+        self.dead_lettered = registry.counter("bus_dead_lettered_total", "Entries acked after exhausting retries", **labels)
+        self.expired = registry.counter("bus_expired_total", "Envelopes dropped because their deadline had passed", **labels)
+        self.decode_ms = registry.histogram("bus_decode_ms", "JSON decode + Envelope build time (ms)", **labels)
+        self.handler_ms = registry.histogram("bus_handler_ms", "Handler execution time (ms)", **labels)
+        self.ack_ms = registry.histogram("bus_ack_ms", "XACK round trip (ms)", **labels)
+        # queue / handler / end-to-end HDR histograms (see latency.py)
+        self.latency = TRACKER.for_stream(labels["stream"])
+        if dedup:
+            self.dedup_hits = registry.counter("bus_dedup_hits_total", "Duplicate envelopes acked without running the handler", **labels)
+            self.dedup_misses = registry.counter("bus_dedup_misses_total", "Envelopes that passed the dedup check", **labels)
+
+
+def record_publish(stream: str, elapsed_ms: float, registry: MetricsRegistry = REGISTRY):
+    labels = {"stream": stream_label(stream)}
+    registry.counter("bus_publish_total", "Envelopes published", **labels).inc()
+    registry.histogram("bus_publish_ms", "publish_envelope round trip (ms)", **labels).observe(elapsed_ms)
@@ -0,0 +1,186 @@
+# AG1_AetherBus/reply_mux.py
+"""
+One reply listener per process for bus RPCs.
+
+bus_rpc_call starts its own XREAD on the caller's reply stream for every
+call, so each concurrent call holds a blocking connection, and a reply that
+lands before that first XREAD has to be found again by ID. ReplyMux gives
+the process a single reply stream
+
+    AG1:rpc_reply:mux:<host>:<pid>:<random>
+
+and one long-lived task reading it. Calls register their correlation_id in
+a table before publishing; the listener resolves the matching future when
+the reply arrives:
+
+    mux = get_reply_mux(redis)
+    reply = await mux.call("AG1:agent:muse:inbox", env, timeout=10)   # Envelope or None
+
+The listener only ever moves forward from the last entry ID it has seen
+(starting at 0-0 on its own fresh stream), never from "$", so a fast reply
+cannot be missed. Thousands of concurrent calls share one blocking read.
+bus_rpc_envelope uses the mux whenever the request has no reply_to.
+
+A mux can also listen on an existing, shared reply stream (BusAdapterV2
+keeps one per reply_to). It then starts from the stream's tail ID, read
+once before the first call publishes, and ignores replies meant for others.
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import traceback
+import uuid
+import weakref
+from typing import Callable, Dict, Optional
+
+from AG1_AetherBus.bus import publish_envelope, read_batches, stream_tail_id
+from AG1_AetherBus.envelope import Envelope
+from AG1_AetherBus.metrics import REGISTRY, stream_label
+
+REPLY_BLOCK_MS = 5000
+REPLY_BATCH_SIZE = 100
+
+
+def reply_stream_name() -> str:
+    return f"AG1:rpc_reply:mux:{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def record_rpc_latency(target: str, elapsed_ms: float):
+    REGISTRY.histogram("bus_rpc_ms", "RPC round trip (ms)", target=stream_label(target)).observe(elapsed_ms)
+
+
+class ReplyMux:
+    def __init__(self, redis, stream: str = None, block_ms: int = REPLY_BLOCK_MS, batch_size: int = REPLY_BATCH_SIZE):
+        self.redis = redis
+        # our own fresh stream is read from the start; a shared one from its current tail
+        self._last_id = None if stream else "0-0"
+        self.stream = stream or reply_stream_name()
+        self.block_ms = block_ms
+        self.batch_size = batch_size
+        self._waiters: Dict[str, Callable[[Envelope], None]] = {}
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._loop = None
+        self.unmatched = REGISTRY.counter("bus_rpc_unmatched_replies_total", "Replies with no waiting caller (late or unknown)")
+        self.timeouts = REGISTRY.counter("bus_rpc_timeouts_total", "RPC calls that got no reply in time")
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._waiters)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.create_task(self._listen())
+
+    async def ready(self):
+        """Wait until the listener knows where to read from; publish requests after this."""
+        self.start()
+        if not self._ready.is_set():
+            await self._ready.wait()
+
+    def register(self, correlation_id: str, callback: Callable[[Envelope], None]):
+        """Route replies carrying correlation_id to callback (until unregistered)."""
+        self.start()
+        self._waiters[correlation_id] = callback
+
+    def unregister(self, correlation_id: str):
+        self._waiters.pop(correlation_id, None)
+
+    def expect(self, correlation_id: str) -> asyncio.Future:
+        """Future resolved with the first reply for correlation_id."""
+        future = asyncio.get_running_loop().create_future()
+
+        def resolve(env: Envelope):
+            if not future.done():
+                future.set_result(env)
+
+        self.register(correlation_id, resolve)
+        return future
+
+    async def call(self, target: str, env: Envelope, timeout: float = 10.0) -> Optional[Envelope]:
+        """Publish env to target with reply_to set to the mux stream; the reply Envelope or None on timeout."""
+        env.correlation_id = env.correlation_id or str(uuid.uuid4())
+        env.reply_to = self.stream
+        env.set_deadline(timeout)
+        future = self.expect(env.correlation_id)
+        started = time.perf_counter()
+        try:
+            await self.ready()
+            await publish_envelope(self.redis, target, env)
+            reply = await asyncio.wait_for(future, timeout)
+            record_rpc_latency(target, (time.perf_counter() - started) * 1000)
+            return reply
+        except asyncio.TimeoutError:
+            self.timeouts.inc()
+            print(f"[BUS][RPC][WARN] No reply from {target} within {timeout}s (CID {env.correlation_id})")
+            return None
+        finally:
+            self.unregister(env.correlation_id)
+
+    def _dispatch(self, entry_id, fields):
+        raw = fields.get(b"data") or fields.get("data")
+        try:
+            env = Envelope.from_dict(json.loads(_decode(raw)))
+        except (TypeError, ValueError) as e:
+            print(f"[BUS][RPC][WARN] Unreadable reply {_decode(entry_id)} on {self.stream}: {e}")
+            return
+        callback = self._waiters.get(env.correlation_id)
+        if callback is None:
+            self.unmatched.inc()
+            return
+        callback(env)
+
+    async def _listen(self):
+        while True:
+            try:
+                if self._last_id is None:
+                    self._last_id = await stream_tail_id(self.redis, self.stream)
+                self._ready.set()
+                response = await self.redis.xread(
+                    {self.stream: self._last_id}, count=self.batch_size, block=self.block_ms
+                )
+                for _, entries in read_batches(response):
+                    for entry_id, fields in entries:
+                        self._last_id = _decode(entry_id)
+                        self._dispatch(entry_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[BUS][RPC][ERROR] Reply listener on {self.stream} failed: {e}")
+                traceback.print_exc()
+                await asyncio.sleep(1)
+
+    async def close(self, delete_stream: bool = True):
+        """Stop the listener and (by default) delete the reply stream."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._waiters.clear()
+        if delete_stream:
+            await self.redis.delete(self.stream)
+
+
+_MUXES: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_reply_mux(redis) -> ReplyMux:
+    """The process-wide ReplyMux for this Redis client (one per event loop)."""
+    mux = _MUXES.get(redis)
+    loop = asyncio.get_running_loop()
+    if mux is None or (mux._loop is not None and mux._loop is not loop):
+        mux = _MUXES[redis] = ReplyMux(redis)
+    return mux
+
+
+async def close_reply_mux(redis):
+    mux = _MUXES.pop(redis, None)
+    if mux is not None:
+        await mux.close()
@@ -0,0 +1,162 @@
+# AG1_AetherBus/retention.py
+"""
+Stream retention policies, keyed by key class.
+
+Every writer (publish_envelope, the discovery announcement, rpc helpers)
+asks this module how to trim the stream it is about to XADD to, so one
+table decides how long inboxes, reply streams, session flows and register
+channels keep their history.
+
+Policies can be overridden per class from the environment:
+
+    BUS_RETENTION_INBOX=maxlen:20000     # approximate length cap (XADD MAXLEN ~)
+    BUS_RETENTION_SESSION=age:86400      # time-based (XADD MINID ~ now-86400s)
+    BUS_RETENTION_REGISTER=none          # never trim on write
+    BUS_RETENTION_OUTBOX=safe:50000      # never trim on write; SafeTrimmer trims
+                                         # consumed entries, 50000 is the hard cap
+    BUS_RETENTION_EPHEMERAL_REPLY=maxlen:1000,ttl:600
+                                         # ...and EXPIRE the key 600s after its last write
+
+Per-call reply streams (AG1:rpc_reply:...) form the "ephemeral_reply" class:
+each write refreshes a key TTL (BUS_REPLY_TTL, default 600s), so streams
+left behind by finished RPCs, and their consumer groups, disappear on their
+own. Long-lived shared reply streams (...:response) keep no TTL.
+"""
+import os
+import re
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_MAXLEN = int(os.getenv("BUS_STREAM_MAXLEN", 10000))
+REPLY_TTL_SECONDS = int(os.getenv("BUS_REPLY_TTL", 600))
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """
+    How a stream is trimmed when written to. Set at most one of `maxlen`
+    (keep roughly the newest N entries) or `max_age_seconds` (drop entries
+    older than that, using the entry ID's millisecond timestamp). Neither
+    means the stream is never trimmed on write.
+
+    consumer_safe=True hands trimming to trimming.SafeTrimmer instead: writers
+    leave the stream alone and the trimmer only removes entries every consumer
+    group has already consumed, falling back to `hard_maxlen` as a last resort.
+
+    expire_seconds additionally sets a key TTL, refreshed by every write, so
+    the whole stream goes away once nobody writes to it any more.
+    """
+    maxlen: Optional[int] = None
+    max_age_seconds: Optional[float] = None
+    approximate: bool = True
+    consumer_safe: bool = False
+    hard_maxlen: Optional[int] = None
+    expire_seconds: Optional[int] = None
+
+    def __post_init__(self):
+        if self.maxlen is not None and self.max_age_seconds is not None:
+            raise ValueError("RetentionPolicy takes maxlen or max_age_seconds, not both")
+        if self.consumer_safe and (self.maxlen is not None or self.max_age_seconds is not None):
+            raise ValueError("consumer_safe policies trim via SafeTrimmer; use hard_maxlen instead of maxlen/max_age_seconds")
+
+    def min_id(self, now_ms: int = None) -> Optional[str]:
+        """Oldest entry ID to keep under a time-based policy."""
+        if self.max_age_seconds is None:
+            return None
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        return f"{max(0, now_ms - int(self.max_age_seconds * 1000))}-0"
+
+    def xadd_kwargs(self) -> dict:
+        """Trimming arguments for redis-py's xadd()."""
+        if self.consumer_safe:
+            return {}
+        if self.maxlen is not None:
+            return {"maxlen": self.maxlen, "approximate": self.approximate}
+        if self.max_age_seconds is not None:
+            return {"minid": self.min_id(), "approximate": self.approximate}
+        return {}
+
+
+# Ordered: the first matching pattern wins.
+KEY_CLASSES: List[Tuple[str, "re.Pattern"]] = [
+    ("discovery", re.compile(r"^user\.discovery$")),
+    ("ephemeral_reply", re.compile(r":rpc_reply:")),
+    ("rpc_reply", re.compile(r":response$|:a2a:response:")),
+    ("inbox", re.compile(r":inbox(:(high|low))?$")),
+    ("outbox", re.compile(r":outbox$")),
+    ("register", re.compile(r":register$")),
+    ("session", re.compile(r":session:[^:]+:stream$|:flow:[^:]+:(input|output)$|:a2a:stream:")),
+]
+
+RETENTION_POLICIES: Dict[str, RetentionPolicy] = {
+    "inbox": RetentionPolicy(maxlen=DEFAULT_MAXLEN),
+    "outbox": RetentionPolicy(maxlen=DEFAULT_MAXLEN),
+    "rpc_reply": RetentionPolicy(maxlen=1000),
+    "ephemeral_reply": RetentionPolicy(maxlen=1000, expire_seconds=REPLY_TTL_SECONDS),
+    "session": RetentionPolicy(max_age_seconds=24 * 3600),
+    "register": RetentionPolicy(maxlen=1000),
+    "discovery": RetentionPolicy(maxlen=DEFAULT_MAXLEN),
+    "default": RetentionPolicy(maxlen=DEFAULT_MAXLEN),
+}
+
+
+def parse_policy(spec: str) -> RetentionPolicy:
+    """
+    Parse 'maxlen:N', 'age:SECONDS', 'safe[:HARD_MAXLEN]' or 'none' (as used
+    by BUS_RETENTION_*), optionally followed by ',ttl:SECONDS'.
+    """
+    spec, _, ttl = spec.strip().lower().partition(",ttl:")
+    policy = _parse_trim(spec)
+    return replace(policy, expire_seconds=int(ttl)) if ttl else policy
+
+
+def _parse_trim(spec: str) -> RetentionPolicy:
+    spec = spec.strip()
+    if spec in ("", "none", "off"):
+        return RetentionPolicy()
+    kind, _, value = spec.partition(":")
+    if kind == "maxlen":
+        return RetentionPolicy(maxlen=int(value))
+    if kind == "age":
+        return RetentionPolicy(max_age_seconds=float(value))
+    if kind == "safe":
+        return RetentionPolicy(consumer_safe=True, hard_maxlen=int(value) if value else None)
+    raise ValueError(f"Unrecognised retention policy '{spec}' (expected maxlen:N, age:SECONDS, safe[:N] or none)")
+
+
+def _load_env_overrides():
+    for key_class in list(RETENTION_POLICIES):
+        spec = os.getenv(f"BUS_RETENTION_{key_class.upper()}")
+        if spec is not None:
+            RETENTION_POLICIES[key_class] = parse_policy(spec)
+
+
+_load_env_overrides()
+
+
+def classify_stream(stream: str) -> str:
+    """Return the key class of a stream name ('default' if nothing matches)."""
+    for key_class, pattern in KEY_CLASSES:
+        if pattern.search(stream):
+            return key_class
+    return "default"
+
+
+def policy_for(stream: str) -> RetentionPolicy:
+    return RETENTION_POLICIES.get(classify_stream(stream), RETENTION_POLICIES["default"])
+
+
+def set_policy(key_class: str, policy: RetentionPolicy):
+    """Replace the policy for a key class at runtime."""
+    RETENTION_POLICIES[key_class] = policy
+
+
+def xadd_kwargs(stream: str) -> dict:
+    """Trimming arguments to pass to xadd() for `stream`."""
+    return policy_for(stream).xadd_kwargs()
+
+
+def expire_seconds(stream: str) -> Optional[int]:
+    """Key TTL to (re)set after writing to `stream`, if its class has one."""
+    return policy_for(stream).expire_seconds
@@ -1,57 +1,138 @@
 # AG1_AetherBus/rpc.py
 
+import copy
 import json, time
 import asyncio
 
 import uuid
+import traceback
 
 from typing import Any, Dict, Optional, Union
 from redis.asyncio import Redis
 from AG1_AetherBus.envelope import Envelope
 from AG1_AetherBus.agent_bus_minimal import publish_envelope
-from typing import AsyncIterator
+from AG1_AetherBus.bus import ENVELOPE_SIZE_LIMIT, publish_envelopes, read_batches, stream_tail_id
+from AG1_AetherBus.circuit import BREAKERS, TRANSPORT_ERRORS, BreakerRegistry
+from AG1_AetherBus.hedging import HedgePolicy, bus_rpc_hedged
+from AG1_AetherBus.rpc_cache import ResponseCache
+from AG1_AetherBus.reply_mux import get_reply_mux, record_rpc_latency
+from typing import AsyncIterator, List, Tuple
+
+# envelope_type of the envelope a streaming responder sends after its last chunk
+STREAM_CHUNK_TYPE = "stream_chunk"
+STREAM_END_TYPE = "stream_end"
+
 
 async def bus_rpc_stream(
     redis: Redis,
     target_stream: str,
     request_env: Envelope,
     timeout: float = 5.0,
-    max_responses: int = 10
+    max_responses: Optional[int] = None,
+    first_chunk_timeout: Optional[float] = None,
+    chunk_timeout: Optional[float] = None,
+    queue_size: int = 64,
 ) -> AsyncIterator[Envelope]:
     """
-    Publish request_env → target_stream, then stream back every reply
-    on request_env.reply_to until timeout.
+    Publish request_env -> target_stream and yield the replies carrying its
+    correlation_id as they arrive, until the responder sends an envelope of
+    type "stream_end" (see reply_stream), `max_responses` replies have been
+    yielded, or a timeout passes:
+
+        async for chunk in bus_rpc_stream(redis, inbox, env, first_chunk_timeout=30, chunk_timeout=5):
+            ...
+
+    first_chunk_timeout bounds the wait for the first reply and chunk_timeout
+    the gap between replies (both default to `timeout`).
+
+    Replies are read from request_env.reply_to, or from a fresh reply stream
+    deleted afterwards, by a reader task that fills a queue of `queue_size`.
+    When the consumer falls behind, the queue fills, the reader stops
+    reading and the backlog stays in Redis instead of in memory. This is why
+    streams don't use the shared reply mux: one slow consumer would hold up
+    every other call's replies.
     """
-    # ensure we have a reply_to
-    if not request_env.reply_to:
-        request_env.reply_to = f"AG1:agent:{request_env.user_id}:outbox"
+    first_chunk_timeout = timeout if first_chunk_timeout is None else first_chunk_timeout
+    chunk_timeout = timeout if chunk_timeout is None else chunk_timeout
+    request_env.correlation_id = request_env.correlation_id or str(uuid.uuid4())
+    own_stream = not request_env.reply_to
+    if own_stream:
+        request_env.reply_to = f"AG1:rpc_reply:stream:{request_env.correlation_id}"
 
-    # 1) push the request  
-    await redis.xadd(target_stream, {"data": request_env.json()})
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    last_id = await stream_tail_id(redis, request_env.reply_to)
+    reader = asyncio.create_task(_read_stream_replies(
+        redis, request_env.reply_to, last_id, request_env.correlation_id, queue,
+        max(1, int(min(first_chunk_timeout, chunk_timeout, 5.0) * 1000)),  # block=0 would mean forever
+    ))
+    try:
+        await publish_envelope(redis, target_stream, request_env)
+        received, wait = 0, first_chunk_timeout
+        while max_responses is None or received < max_responses:
+            try:
+                item = await asyncio.wait_for(queue.get(), wait)
+            except asyncio.TimeoutError:
+                print(f"[RPC][bus_rpc_stream][WARN] No {'first ' if not received else ''}reply within {wait}s for CID {request_env.correlation_id}; ending stream.")
+                break
+            if isinstance(item, Exception):
+                raise item
+            if item.envelope_type == STREAM_END_TYPE:
+                break
+            received += 1
+            wait = chunk_timeout
+            yield item
+    finally:
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        if own_stream:
+            await redis.delete(request_env.reply_to)
 
-    # 2) repeatedly read one at a time until timeout  
-    block_ms = int(timeout * 1000)
-    last_id  = "$"
-    while True:
-        try:
-            results = await redis.xread(
-                {request_env.reply_to: last_id},
-                count=1,
-                block=block_ms
-            )
-        except TimeoutError:
-            break
-        if not results:
-            break
 
-        stream_key, entries = results[0]
-        entry_id, fields   = entries[0]
-        last_id = entry_id  # advance the cursor
+async def _read_stream_replies(redis, reply_to, last_id, correlation_id, queue, block_ms):
+    try:
+        while True:
+            count = max(1, queue.maxsize - queue.qsize())
+            results = await redis.xread({reply_to: last_id}, count=count, block=block_ms)
+            for _, entries in read_batches(results):
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    raw = fields.get(b"data") or fields.get("data")
+                    try:
+                        env = Envelope.from_dict(json.loads(raw.decode() if isinstance(raw, bytes) else raw))
+                    except (AttributeError, TypeError, ValueError):
+                        continue
+                    if env.correlation_id != correlation_id:
+                        continue  # shared reply stream: someone else's reply
+                    await queue.put(env)  # blocks while the consumer is behind
+                    if env.envelope_type == STREAM_END_TYPE:
+                        return
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await queue.put(e)
+
 
-        raw = fields.get(b"data")
-        payload = raw.decode() if isinstance(raw, (bytes,bytearray)) else raw
-        yield Envelope.from_dict(json.loads(payload))
+async def reply_stream(redis: Redis, request_env: Envelope, chunks, agent_name: str = None):
+    """
+    Responder side of bus_rpc_stream: publish each item of `chunks` (an
+    iterable or async iterable of content) to request_env.reply_to as a
+    "stream_chunk" envelope, then a "stream_end" envelope.
+    """
+    def envelope(content, envelope_type):
+        return Envelope(
+            role="agent", content=content, agent_name=agent_name, envelope_type=envelope_type,
+            correlation_id=request_env.correlation_id, session_code=request_env.session_code,
+        )
 
+    try:
+        if hasattr(chunks, "__aiter__"):
+            async for content in chunks:
+                await publish_envelope(redis, request_env.reply_to, envelope(content, STREAM_CHUNK_TYPE))
+        else:
+            for content in chunks:
+                await publish_envelope(redis, request_env.reply_to, envelope(content, STREAM_CHUNK_TYPE))
+    finally:
+        await publish_envelope(redis, request_env.reply_to, envelope(None, STREAM_END_TYPE))
 
 
 async def bus_rpc_call(
@@ -62,10 +143,13 @@ async def bus_rpc_call(
 ) -> Optional[str]:
     print(f'----> [RPC] bus_rpc_call initiated. Target: {target_stream}, CID: {request_env.correlation_id}, ReplyTo: {request_env.reply_to}')
     print(f"\n---<>-----\n[RPC][DEBUG_PUBLISH] About to publish to target_stream='{target_stream}' (type: {type(target_stream)}), request_env.reply_to='{request_env.reply_to}' (type: {type(request_env.reply_to)})")
+    # Read from the reply stream's current tail, fixed before publishing: with
+    # "$" a reply landing before the first XREAD would be missed.
+    last_id = await stream_tail_id(redis, request_env.reply_to)
+    request_env.set_deadline(timeout)
     await publish_envelope(redis, target_stream, request_env)
     
     deadline = time.time() + timeout
-    last_id = "$" 
 
     while time.time() < deadline:
         current_block_ms = int(max(1, (deadline - time.time()) * 1000)) # Ensure block_ms is at least 1
@@ -84,7 +168,7 @@ async def bus_rpc_call(
             continue
 
         print(f'[RPC] Raw XREAD results for {request_env.reply_to}, CID: {request_env.correlation_id}: {results}')
-        stream_key, entries = results[0]
+        stream_key, entries = read_batches(results)[0]
         entry_id, fields = entries[0]
         last_id = entry_id 
 
@@ -110,21 +194,59 @@ async def bus_rpc_envelope(
     redis_client: Redis,
     target_inbox: str,
     request_envelope: Envelope,
-    timeout: float = 10.0
+    timeout: float = 10.0,
+    coalesce_key: Union[str, bool, None] = None,
+    coalesce_shared: bool = False,
+    cache: Optional[ResponseCache] = None,
+    cache_ttl: Optional[float] = None,
+    hedge: Union[HedgePolicy, bool, None] = None,
+    circuit: Union[BreakerRegistry, bool, None] = None,
 ) -> Union[Envelope, Dict[str, Any], None]:
     """
     Performs an RPC-style call over the bus, returning a deserialized Envelope object.
     This wraps bus_rpc_call and deserializes its string output.
     Returns Envelope, a dict with "error", or None if no response.
+
+    coalesce_key: identical concurrent calls share one request (see
+    singleflight.py). Pass a key of your choosing, or True to key on the
+    target, envelope_type and content. Each caller gets its own copy of the
+    response carrying its own correlation_id. With coalesce_shared=True,
+    callers in other processes are coalesced through Redis as well.
+
+    cache: a rpc_cache.ResponseCache answering repeats of this request
+    (same target, type and content) without a round trip. The reply is
+    stored for cache_ttl seconds, or as long as the callee's
+    headers["cache_ttl"] allows.
+
+    hedge: True (default policy) or a hedging.HedgePolicy sends a second
+    copy when the reply is slower than the target's recent p95. Only for
+    requests without a reply_to, and only for idempotent requests or
+    targets subscribing with dedup.
+
+    circuit: True (process-wide circuit.BREAKERS) or a
+    circuit.BreakerRegistry. Repeated timeouts open the target's breaker,
+    after which calls return {"error": "Circuit open for <target>"} at once
+    until a probe gets through again.
     """
+    if cache is not None:
+        return await _cached_rpc(redis_client, target_inbox, request_envelope, timeout, coalesce_key, coalesce_shared, cache, cache_ttl, hedge, circuit)
+    if circuit:
+        return await _guarded_rpc(redis_client, target_inbox, request_envelope, timeout, coalesce_key, coalesce_shared, hedge, circuit)
+    if coalesce_key:
+        return await _coalesced_rpc(redis_client, target_inbox, request_envelope, timeout, coalesce_key, coalesce_shared, hedge)
+
     print(f"[RPC][bus_rpc_envelope] Calling bus_rpc_call for CID: {request_envelope.correlation_id} to target: {target_inbox} | reply_to: {request_envelope.reply_to}")
     
-    # Ensure reply_to is set for bus_rpc_call to listen on
+    # Without a caller-chosen reply_to, use the process-wide reply listener
     if not request_envelope.reply_to:
-        # This should ideally be set by the caller (e.g., A2AProxy using kb.a2a_response)
-        # but as a fallback:
-        request_envelope.reply_to = f"AG1:rpc_reply:{request_envelope.agent_name or 'unknown'}:{request_envelope.correlation_id or str(uuid.uuid4())}"
-        print(f"[RPC][bus_rpc_envelope][WARN] request_envelope.reply_to was not set. Using fallback: {request_envelope.reply_to}")
+        if hedge:
+            policy = hedge if isinstance(hedge, HedgePolicy) else None
+            response_envelope = await bus_rpc_hedged(redis_client, target_inbox, request_envelope, timeout, policy)
+        else:
+            response_envelope = await get_reply_mux(redis_client).call(target_inbox, request_envelope, timeout)
+        if response_envelope is None:
+            return {"error": "RPC Timeout or No Response"}
+        return response_envelope
 
     raw_response_json_str = await bus_rpc_call(redis_client, target_inbox, request_envelope, timeout)
 
@@ -149,4 +271,210 @@ async def bus_rpc_envelope(
     else:
         # This case should not be reached if bus_rpc_call returns Optional[str]
         print(f"[RPC][bus_rpc_envelope][WARN] Unexpected return type from bus_rpc_call: {type(raw_response_json_str)}. Expected str or None.")
-        return {"error": f"RPC Unexpected Internal Return Type: {type(raw_response_json_str)}"}
\ No newline at end of file
+        return {"error": f"RPC Unexpected Internal Return Type: {type(raw_response_json_str)}"}
+
+def _encode_rpc_result(result) -> str:
+    if isinstance(result, Envelope):
+        return json.dumps({"envelope": result.to_dict()})
+    return json.dumps({"result": result})
+
+
+def _decode_rpc_result(raw: str):
+    payload = json.loads(raw)
+    if "envelope" in payload:
+        return Envelope.from_dict(payload["envelope"])
+    return payload.get("result")
+
+
+async def _cached_rpc(redis_client, target_inbox, request_envelope, timeout, coalesce_key, coalesce_shared, cache, cache_ttl, hedge, circuit):
+    cached = await cache.get(target_inbox, request_envelope)
+    if cached is not None:
+        cached.correlation_id = request_envelope.correlation_id or cached.correlation_id
+        return cached
+    reply = await bus_rpc_envelope(redis_client, target_inbox, request_envelope, timeout, coalesce_key, coalesce_shared, hedge=hedge, circuit=circuit)
+    if isinstance(reply, Envelope):
+        await cache.put(target_inbox, request_envelope, reply, cache_ttl)
+    return reply
+
+
+async def _guarded_rpc(redis_client, target_inbox, request_envelope, timeout, coalesce_key, coalesce_shared, hedge, circuit):
+    breakers = circuit if isinstance(circuit, BreakerRegistry) else BREAKERS
+    if not await breakers.allow(redis_client, target_inbox):
+        return {"error": f"Circuit open for {target_inbox}"}
+    breaker = breakers.get(target_inbox)
+    started = time.perf_counter()
+    try:
+        reply = await bus_rpc_envelope(redis_client, target_inbox, request_envelope, timeout, coalesce_key, coalesce_shared, hedge=hedge)
+    except TRANSPORT_ERRORS:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        breaker.release()  # cancelled, or the caller's own error: says nothing about the target
+        raise
+    if isinstance(reply, Envelope):
+        breaker.record_success((time.perf_counter() - started) * 1000)
+    else:
+        breaker.record_failure()
+    return reply
+
+
+async def _coalesced_rpc(redis_client, target_inbox, request_envelope, timeout, coalesce_key, shared, hedge):
+    from AG1_AetherBus.singleflight import FLIGHTS, content_key
+
+    if not isinstance(coalesce_key, str):
+        coalesce_key = content_key(target_inbox, request_envelope.envelope_type, request_envelope.content)
+    try:
+        result = await FLIGHTS.do(
+            f"rpc:{coalesce_key}",
+            lambda: bus_rpc_envelope(redis_client, target_inbox, request_envelope, timeout, hedge=hedge),
+            redis=redis_client if shared else None,
+            timeout=timeout,
+            encode=_encode_rpc_result,
+            decode=_decode_rpc_result,
+        )
+    except asyncio.TimeoutError:
+        return {"error": "RPC Timeout or No Response"}
+    if isinstance(result, Envelope):
+        # every waiter gets its own envelope, answering its own request
+        result = copy.deepcopy(result)
+        result.correlation_id = request_envelope.correlation_id or result.correlation_id
+    return result
+
+
+async def bus_rpc_batch(
+    redis_client: Redis,
+    requests: List[Tuple[str, Envelope]],
+    timeout: float = 10.0,
+) -> List[Union[Envelope, Dict[str, Any]]]:
+    """
+    Send several (target, envelope) requests at once and wait for all replies:
+
+        results = await bus_rpc_batch(redis, [(inbox_a, env_a), (inbox_b, env_b)], timeout=30)
+
+    All requests go out in one pipeline (bus.publish_envelopes) and replies
+    come back through the process-wide reply listener, so the batch takes
+    about as long as its slowest call, provided the targets handle requests
+    concurrently (subscribe(..., max_in_flight=N)); a target consuming one
+    at a time still answers them in sequence. `timeout` applies to every
+    item separately but runs from the moment the batch is sent, and each
+    request carries that same deadline, so an item still queued at a serial
+    target when it passes is dropped there and returned as a timeout.
+
+    Returns one result per request, in order: the reply Envelope, or a dict
+    with "error" for that item alone (timeout, or an envelope too large to
+    send). The caller's envelopes are not modified: copies are sent, keeping
+    their correlation_id unless it is missing or repeats an earlier item's.
+    Replies come back on the reply listener's stream, so the requests must
+    not set reply_to (ValueError).
+    """
+    for n, (_, request) in enumerate(requests):
+        if request.reply_to:
+            raise ValueError(f"bus_rpc_batch request {n} has reply_to={request.reply_to!r}; replies must go to the batch's reply listener")
+    mux = get_reply_mux(redis_client)
+    results: List[Union[Envelope, Dict[str, Any], None]] = [None] * len(requests)
+    futures: Dict[int, asyncio.Future] = {}
+    to_send = []
+    seen = set()
+    for n, (target, request) in enumerate(requests):
+        env = copy.deepcopy(request)
+        if not env.correlation_id or env.correlation_id in seen:
+            env.correlation_id = str(uuid.uuid4())
+        seen.add(env.correlation_id)
+        env.reply_to = mux.stream
+        env.set_deadline(timeout)
+        if len(json.dumps(env.to_dict()).encode("utf-8")) > ENVELOPE_SIZE_LIMIT:
+            results[n] = {"error": f"Envelope exceeds {ENVELOPE_SIZE_LIMIT} bytes"}
+            continue
+        futures[n] = mux.expect(env.correlation_id)
+        to_send.append((target, env))
+
+    try:
+        await mux.ready()
+        started = time.perf_counter()
+        for n, future in futures.items():
+            target = requests[n][0]
+            future.add_done_callback(
+                lambda f, target=target: f.cancelled() or record_rpc_latency(target, (time.perf_counter() - started) * 1000)
+            )
+        await publish_envelopes(redis_client, to_send)
+        if futures:
+            await asyncio.wait(futures.values(), timeout=timeout)
+        for n, future in futures.items():
+            if future.done():
+                results[n] = future.result()
+            else:
+                mux.timeouts.inc()
+                results[n] = {"error": "RPC Timeout or No Response"}
+    finally:
+        for _, env in to_send:
+            mux.unregister(env.correlation_id)
+    missing = sum(1 for r in results if isinstance(r, dict))
+    if missing:
+        print(f"[RPC][bus_rpc_batch][WARN] {missing}/{len(requests)} requests failed or got no reply within {timeout}s")
+    return results
+
+
+async def bus_rpc_scatter(
+    redis_client: Redis,
+    targets: List[str],
+    request_envelope: Envelope,
+    want: Optional[int] = None,
+    timeout: float = 10.0,
+) -> AsyncIterator[Tuple[str, Envelope]]:
+    """
+    Send request_envelope to every target and yield (target, reply) pairs
+    as replies arrive, fastest first:
+
+        async for target, reply in bus_rpc_scatter(redis, inboxes, env, want=1, timeout=5):
+            ...
+
+    Stops after `want` replies (default: all targets) or when `timeout`
+    seconds have passed since sending, whichever comes first. Each target
+    gets its own copy of the envelope (own envelope_id, correlation_id
+    "<cid>:<n>"), all published in one pipeline; replies go to the
+    process-wide reply listener. Replies arriving after the iterator
+    finishes are ignored.
+    """
+    mux = get_reply_mux(redis_client)
+    loop = asyncio.get_running_loop()
+    arrivals: asyncio.Queue = asyncio.Queue()
+    base_cid = request_envelope.correlation_id or str(uuid.uuid4())
+    pending: Dict[str, str] = {}
+    requests = []
+    request_envelope.set_deadline(timeout)
+    for n, target in enumerate(targets):
+        env = copy.deepcopy(request_envelope)
+        env.envelope_id = str(uuid.uuid4())
+        env.correlation_id = f"{base_cid}:{n}"
+        env.reply_to = mux.stream
+        pending[env.correlation_id] = target
+        mux.register(env.correlation_id, arrivals.put_nowait)
+        requests.append((target, env))
+    want = len(requests) if want is None else min(want, len(requests))
+
+    try:
+        await mux.ready()
+        started = time.perf_counter()
+        await publish_envelopes(redis_client, requests)
+        deadline = loop.time() + timeout
+        received = 0
+        while received < want:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                reply = await asyncio.wait_for(arrivals.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            target = pending.pop(reply.correlation_id, None)
+            if target is None:
+                continue  # second reply from the same target
+            mux.unregister(reply.correlation_id)
+            record_rpc_latency(target, (time.perf_counter() - started) * 1000)
+            received += 1
+            yield target, reply
+        if received < want:
+            print(f"[RPC][bus_rpc_scatter][WARN] {received}/{want} replies within {timeout}s; no reply from {sorted(pending.values())}")
+    finally:
+        for cid in pending:
+            mux.unregister(cid)
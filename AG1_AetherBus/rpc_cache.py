@@ -0,0 +1,151 @@
+# AG1_AetherBus/rpc_cache.py
+"""
+Client-side response cache for idempotent bus RPCs.
+
+Many RPCs are pure lookups (MCP discovery for the same query, registry
+lookups, A2A tasks/get). With a ResponseCache the caller answers repeats
+locally instead of going over the bus:
+
+    cache = ResponseCache(redis)                          # shared across replicas
+    reply = await bus_rpc_envelope(redis, inbox, env, cache=cache, cache_ttl=60)
+    reply = await adapter.request_response(inbox, env, cache=cache)
+
+Entries are keyed by target plus a hash of envelope_type and content
+(dict keys sorted, so key order doesn't matter). A reply is stored when:
+
+    the caller passed cache_ttl                  -> for cache_ttl seconds
+    the callee set headers["cache_ttl"]          -> for that many seconds
+                                                    (mark_cacheable(reply, 60))
+
+If both are given the shorter one wins, and a callee header of "0" means
+never cache. Only Envelope replies are cached, never errors or timeouts.
+
+Two layers, as in dedup.py: a local LRU of `max_entries` (always on) and,
+with `redis`, a SET EX key per entry (AG1:rpccache:<namespace>:<hash>).
+Hits and misses are counted per target (bus_rpc_cache_hits_total /
+bus_rpc_cache_misses_total, and stats()).
+"""
+import copy
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from AG1_AetherBus.envelope import Envelope
+from AG1_AetherBus.metrics import REGISTRY, stream_label
+from AG1_AetherBus.singleflight import content_key
+
+CACHE_KEY_PREFIX = "AG1:rpccache:"
+CACHE_TTL_HEADER = "cache_ttl"
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def mark_cacheable(reply: Envelope, ttl_seconds: float) -> Envelope:
+    """Callee side: allow callers with a ResponseCache to reuse this reply for ttl_seconds (0 = never)."""
+    if reply.headers is None:
+        reply.headers = {}
+    reply.headers[CACHE_TTL_HEADER] = str(ttl_seconds)
+    return reply
+
+
+def reply_ttl(reply: Envelope, cache_ttl: Optional[float]) -> Optional[float]:
+    """How long `reply` may be cached given the caller's cache_ttl and the callee's header."""
+    try:
+        header = float((reply.headers or {})[CACHE_TTL_HEADER])
+    except (KeyError, TypeError, ValueError):
+        header = None
+    ttls = [t for t in (cache_ttl, header) if t is not None]
+    if not ttls or min(ttls) <= 0:
+        return None
+    return min(ttls)
+
+
+class ResponseCache:
+    def __init__(self, redis=None, max_entries: int = 1000, namespace: str = "default"):
+        self.redis = redis
+        self.max_entries = max_entries
+        self.namespace = namespace
+        # key -> (reply envelope dict, expiry monotonic time)
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._targets: Dict[str, Dict[str, int]] = {}
+        self.evictions = 0
+
+    def key_for(self, target: str, env: Envelope) -> str:
+        return content_key(target, env.envelope_type, env.content)
+
+    def _redis_key(self, key: str) -> str:
+        return f"{CACHE_KEY_PREFIX}{self.namespace}:{key}"
+
+    def _count(self, target: str, outcome: str):
+        label = stream_label(target)
+        counts = self._targets.setdefault(label, {"hits": 0, "misses": 0})
+        counts[outcome] += 1
+        REGISTRY.counter(f"bus_rpc_cache_{outcome}_total", f"RPC response cache {outcome}", target=label).inc()
+
+    def _remember(self, key: str, data: dict, ttl: float):
+        self._local[key] = (data, time.monotonic() + ttl)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, target: str, env: Envelope) -> Optional[Envelope]:
+        """Cached reply for this request (a fresh copy), or None."""
+        key = self.key_for(target, env)
+        data = None
+        record = self._local.get(key)
+        if record is not None:
+            if time.monotonic() < record[1]:
+                self._local.move_to_end(key)
+                data = record[0]
+            else:
+                del self._local[key]
+        if data is None and self.redis is not None:
+            redis_key = self._redis_key(key)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.get(redis_key)
+            pipe.ttl(redis_key)
+            raw, ttl = await pipe.execute()
+            if raw is not None:
+                data = json.loads(_decode(raw))
+                if ttl and ttl > 0:
+                    self._remember(key, data, ttl)
+        if data is None:
+            self._count(target, "misses")
+            return None
+        self._count(target, "hits")
+        return Envelope.from_dict(copy.deepcopy(data))
+
+    async def put(self, target: str, env: Envelope, reply: Envelope, cache_ttl: Optional[float] = None) -> bool:
+        """Store reply for this request if the caller's cache_ttl or the callee's header allows it."""
+        ttl = reply_ttl(reply, cache_ttl)
+        if ttl is None:
+            return False
+        key = self.key_for(target, env)
+        data = copy.deepcopy(reply.to_dict())
+        self._remember(key, data, ttl)
+        if self.redis is not None:
+            await self.redis.set(self._redis_key(key), json.dumps(data), ex=max(1, int(ttl)))
+        return True
+
+    async def invalidate(self, target: str, env: Envelope):
+        key = self.key_for(target, env)
+        self._local.pop(key, None)
+        if self.redis is not None:
+            await self.redis.delete(self._redis_key(key))
+
+    def stats(self) -> dict:
+        targets = {
+            target: {**counts, "hit_ratio": round(counts["hits"] / (counts["hits"] + counts["misses"]), 4)}
+            for target, counts in self._targets.items()
+        }
+        return {
+            "namespace": self.namespace,
+            "size": len(self._local),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "targets": targets,
+        }
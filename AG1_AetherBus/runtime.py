@@ -0,0 +1,59 @@
+# AG1_AetherBus/runtime.py
+"""
+Entry helper for bus services.
+
+    from AG1_AetherBus.runtime import run
+
+    if __name__ == "__main__":
+        run(main)            # or run(main(config))
+
+run() is asyncio.run() with consistent loop settings for every service:
+
+    - uvloop when it is installed (pip install uvloop / the `fast` extra),
+      otherwise the stdlib loop. BUS_LOOP=asyncio forces the stdlib loop.
+    - asyncio debug mode off unless BUS_LOOP_DEBUG=1 (debug mode slows every
+      callback and logs slow ones; useful only while chasing a bug).
+    - a default executor sized for I/O-bound work (asyncio.to_thread and
+      run_in_executor(None, ...) in handlers); BUS_EXECUTOR_WORKERS overrides.
+
+The loop in use is logged once at startup.
+"""
+import asyncio
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+# Handlers push blocking SDK/HTTP calls to the executor, so size it for I/O rather than CPU
+DEFAULT_EXECUTOR_WORKERS = min(64, (os.cpu_count() or 1) * 4 + 4)
+
+
+def loop_factory(prefer_uvloop: bool = None) -> Tuple[Optional[Callable], str]:
+    """(factory for asyncio.Runner, loop name). The factory is None for the stdlib loop."""
+    if prefer_uvloop is None:
+        prefer_uvloop = os.getenv("BUS_LOOP", "uvloop").lower() != "asyncio"
+    if prefer_uvloop:
+        try:
+            import uvloop
+            return uvloop.new_event_loop, f"uvloop {uvloop.__version__}"
+        except ImportError:
+            pass
+    return None, "asyncio"
+
+
+def run(main, *, debug: bool = None, use_uvloop: bool = None, executor_workers: int = None):
+    """
+    Run `main` (a coroutine, or a callable returning one) to completion on a
+    new event loop and return its result.
+    """
+    coro = main() if not inspect.iscoroutine(main) and callable(main) else main
+    if debug is None:
+        debug = os.getenv("BUS_LOOP_DEBUG", "0") == "1"
+    workers = executor_workers or int(os.getenv("BUS_EXECUTOR_WORKERS", DEFAULT_EXECUTOR_WORKERS))
+    factory, loop_name = loop_factory(use_uvloop)
+
+    with asyncio.Runner(debug=debug, loop_factory=factory) as runner:
+        loop = runner.get_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=workers, thread_name_prefix="aetherbus"))
+        print(f"[BUS][RUNTIME] Event loop: {loop_name} ({type(loop).__name__}), debug={loop.get_debug()}, executor workers={workers}")
+        return runner.run(coro)
@@ -0,0 +1,152 @@
+# AG1_AetherBus/scheduler.py
+"""
+Delayed and scheduled envelope delivery.
+
+    await publish_envelope(redis, inbox, env, delay=30)            # in 30 s
+    await publish_envelope(redis, inbox, env, deliver_at=ts)       # at a unix time
+
+Instead of XADDing, publish_envelope ZADDs a timer id to one Redis sorted
+set (AG1:scheduler:timers) scored by its due time in milliseconds, and
+stores the target stream and encoded envelope under that id in a hash
+(AG1:scheduler:timers:payloads). Inserts are O(log N), the sorted set holds
+only short ids however large the envelopes, a pending timer needs no task,
+and timers survive restarts of the publisher. Scheduling the same timer id
+(envelope_id) again replaces the earlier timer.
+
+A scheduler process moves due envelopes into their target streams:
+
+    python -m AG1_AetherBus.scheduler
+    # or, inside a service: asyncio.create_task(Scheduler(redis).run())
+
+Each pass reads up to `batch_size` due ids (ZRANGEBYSCORE), claims them
+with one pipelined round of ZREMs, fetches and deletes the payloads of the
+ids whose ZREM returned 1 (HMGET + HDEL) and delivers them with
+bus.publish_envelopes, so a delayed envelope gets the same lane routing,
+discovery announcement and publish metrics as an immediate one. Several
+schedulers can run side by side without double delivery; a scheduler dying
+between claiming and delivering can lose that batch. While idle it sleeps
+until the next due time (capped at `max_sleep`), so it doesn't poll the set
+in a tight loop.
+"""
+import asyncio
+import json
+import time
+import traceback
+from typing import Optional
+
+from AG1_AetherBus.envelope import Envelope
+from AG1_AetherBus.metrics import REGISTRY, stream_label
+
+TIMERS_KEY = "AG1:scheduler:timers"
+
+
+def payloads_key(key: str = TIMERS_KEY) -> str:
+    """Hash holding the {stream, data} payload of every timer in `key`."""
+    return f"{key}:payloads"
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+async def schedule_envelope(redis, stream: str, data: str, due: float, timer_id: str, key: str = TIMERS_KEY):
+    """Store an encoded envelope for delivery to `stream` at unix time `due`."""
+    pipe = redis.pipeline(transaction=False)
+    # payload first, so a scheduler never claims an id without one
+    pipe.hset(payloads_key(key), timer_id, json.dumps({"stream": stream, "data": data}))
+    pipe.zadd(key, {timer_id: int(due * 1000)})
+    await pipe.execute()
+    REGISTRY.counter("bus_scheduled_total", "Envelopes scheduled for delayed delivery", stream=stream_label(stream)).inc()
+
+
+class Scheduler:
+    def __init__(self, redis, key: str = TIMERS_KEY, batch_size: int = 500, max_sleep: float = 1.0):
+        self.redis = redis
+        self.key = key
+        self.payloads_key = payloads_key(key)
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self.delivered = 0
+        self.lag_ms = REGISTRY.histogram("bus_scheduler_lag_ms", "Delivery time minus due time (ms)")
+        self.pending = REGISTRY.gauge("bus_scheduler_pending", "Timers waiting in the scheduler set")
+
+    async def run_once(self, now: float = None) -> int:
+        """Deliver up to batch_size due envelopes; returns how many were delivered."""
+        now_ms = int((time.time() if now is None else now) * 1000)
+        due = await self.redis.zrangebyscore(self.key, "-inf", now_ms, start=0, num=self.batch_size, withscores=True)
+        if not due:
+            return 0
+
+        claim = self.redis.pipeline(transaction=False)
+        for member, _ in due:
+            claim.zrem(self.key, member)
+        claimed = await claim.execute()
+        won = [(_decode(member), score) for (member, score), ok in zip(due, claimed) if ok]
+        if not won:
+            return 0  # another scheduler took them
+
+        ids = [timer_id for timer_id, _ in won]
+        fetch = self.redis.pipeline(transaction=False)
+        fetch.hmget(self.payloads_key, ids)
+        fetch.hdel(self.payloads_key, *ids)
+        payloads, _ = await fetch.execute()
+
+        from AG1_AetherBus.bus import publish_envelopes  # bus imports this module
+
+        items = []
+        for (timer_id, score), payload in zip(won, payloads):
+            # timers stored before payloads moved to the hash carry the payload in the member itself
+            raw = timer_id if payload is None and timer_id.startswith("{") else _decode(payload)
+            try:
+                timer = json.loads(raw)
+                items.append((timer["stream"], Envelope.from_dict(json.loads(timer["data"]))))
+            except (TypeError, ValueError, KeyError) as e:
+                print(f"[BUS][SCHEDULER][ERROR] Dropping unreadable timer {timer_id[:120]}: {e}")
+                continue
+            self.lag_ms.observe(max(0, now_ms - score))
+        if items:
+            await publish_envelopes(self.redis, items)
+            self.delivered += len(items)
+        return len(items)
+
+    async def _next_due(self) -> Optional[float]:
+        head = await self.redis.zrangebyscore(self.key, "-inf", "+inf", start=0, num=1, withscores=True)
+        return head[0][1] / 1000 if head else None
+
+    async def run(self, stop_event: asyncio.Event = None):
+        """Deliver due envelopes until stop_event is set."""
+        print(f"[BUS][SCHEDULER] Started on '{self.key}' (batch {self.batch_size})")
+        while stop_event is None or not stop_event.is_set():
+            try:
+                if await self.run_once() >= self.batch_size:
+                    continue  # backlog: go straight to the next batch
+                self.pending.set(await self.redis.zcard(self.key))
+                next_due = await self._next_due()
+                sleep = self.max_sleep if next_due is None else min(self.max_sleep, max(0.0, next_due - time.time()))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[BUS][SCHEDULER][ERROR] Pass failed: {e}")
+                traceback.print_exc()
+                sleep = self.max_sleep
+            if stop_event is None:
+                await asyncio.sleep(sleep)
+            else:
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=sleep)
+                except asyncio.TimeoutError:
+                    pass
+
+
+async def main():
+    from AG1_AetherBus.bus import create_redis_client
+    redis = create_redis_client()
+    try:
+        await Scheduler(redis).run()
+    finally:
+        await redis.aclose()
+
+
+if __name__ == "__main__":
+    from AG1_AetherBus import runtime
+    runtime.run(main)
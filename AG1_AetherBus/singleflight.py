@@ -0,0 +1,133 @@
+# AG1_AetherBus/singleflight.py
+"""
+Request coalescing ("singleflight") for identical in-flight calls.
+
+When several callers ask for the same thing at the same moment (every agent
+running MCP discovery right after a deploy, the same LLM prompt from
+several edges), only the first caller, the leader, does the work; the
+others wait for its result:
+
+    result = await FLIGHTS.do(key, lambda: expensive_call(), redis=redis, timeout=10)
+
+Callers in the same process share one asyncio future. With `redis` given,
+callers in other processes coalesce too: the leader holds a lock key
+(SET NX PX) naming its flight, publishes the encoded result to that flight's
+result stream and lets it expire; followers in other processes read the
+result with XREAD BLOCK. If the leader fails, its lock is released without
+a result and remote followers time out (asyncio.TimeoutError). If the
+leader's caller is cancelled (its own timeout, say), local followers are
+not: the first of them to wake retries and becomes the new leader.
+
+rpc.bus_rpc_envelope and BusAdapterV2.request_response expose this through
+their `coalesce_key` argument.
+"""
+import asyncio
+import hashlib
+import json
+import uuid
+from typing import Any, Awaitable, Callable, Dict
+
+from AG1_AetherBus.bus import read_batches
+from AG1_AetherBus.metrics import REGISTRY
+
+SINGLEFLIGHT_PREFIX = "AG1:singleflight:"
+RESULT_TTL_SECONDS = 30
+
+
+def content_key(*parts) -> str:
+    """Stable key for a request from its parts (target, type, content...)."""
+    blob = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class LeaderCancelled(Exception):
+    """Set on a flight whose leader was cancelled; followers retry the call."""
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class SingleFlight:
+    def __init__(self, prefix: str = SINGLEFLIGHT_PREFIX, result_ttl: int = RESULT_TTL_SECONDS):
+        self.prefix = prefix
+        self.result_ttl = result_ttl
+        self._flights: Dict[str, asyncio.Future] = {}
+        self.leaders = REGISTRY.counter("bus_singleflight_leader_total", "Coalesced calls actually executed")
+        self.followers = REGISTRY.counter("bus_singleflight_shared_total", "Calls answered by another caller's in-flight result")
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        redis=None,
+        timeout: float = 30.0,
+        encode: Callable[[Any], str] = json.dumps,
+        decode: Callable[[str], Any] = json.loads,
+    ):
+        """Run fn() once per key across concurrent callers and return its result to all of them."""
+        followed = False
+        while key in self._flights:
+            if not followed:
+                self.followers.inc()
+                followed = True
+            try:
+                return await asyncio.shield(self._flights[key])
+            except LeaderCancelled:
+                continue  # the leader's caller gave up; retry, leading if nobody else has yet
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        try:
+            if redis is None:
+                result = await self._lead(fn)
+            else:
+                result = await self._do_shared(key, fn, redis, timeout, encode, decode)
+            flight.set_result(result)
+            return result
+        except BaseException as e:
+            # a cancelled leader must not cancel its followers: they retry instead
+            flight.set_exception(LeaderCancelled(key) if isinstance(e, asyncio.CancelledError) else e)
+            flight.exception()  # followers may not exist; don't warn about an unretrieved exception
+            raise
+        finally:
+            self._flights.pop(key, None)
+
+    async def _lead(self, fn):
+        self.leaders.inc()
+        return await fn()
+
+    async def _do_shared(self, key, fn, redis, timeout, encode, decode):
+        lock_key = f"{self.prefix}lock:{key}"
+        flight_id = uuid.uuid4().hex
+        lease_ms = int((timeout + 5) * 1000)
+        if not await redis.set(lock_key, flight_id, nx=True, px=lease_ms):
+            holder = _decode(await redis.get(lock_key))
+            if holder is not None:
+                self.followers.inc()
+                return decode(await self._await_remote(redis, holder, timeout))
+            # the other leader finished between SET and GET; lead ourselves
+            await redis.set(lock_key, flight_id, px=lease_ms)
+
+        result_stream = f"{self.prefix}result:{flight_id}"
+        try:
+            result = await self._lead(fn)
+            pipe = redis.pipeline(transaction=False)
+            pipe.xadd(result_stream, {"data": encode(result)})
+            pipe.expire(result_stream, self.result_ttl)
+            await pipe.execute()
+            return result
+        finally:
+            if _decode(await redis.get(lock_key)) == flight_id:
+                await redis.delete(lock_key)
+
+    async def _await_remote(self, redis, flight_id: str, timeout: float) -> str:
+        result_stream = f"{self.prefix}result:{flight_id}"
+        response = await redis.xread({result_stream: "0-0"}, count=1, block=max(1, int(timeout * 1000)))
+        for _, entries in read_batches(response):
+            for _, fields in entries:
+                return _decode(fields.get(b"data") or fields.get("data"))
+        raise asyncio.TimeoutError(f"No coalesced result for flight {flight_id} within {timeout}s")
+
+
+FLIGHTS = SingleFlight()
@@ -0,0 +1,220 @@
+# AG1_AetherBus/trimming.py
+"""
+Consumer-aware stream trimming.
+
+Length-based XADD trimming can delete entries a lagging consumer group has
+not read yet, silently. SafeTrimmer instead asks Redis (XINFO GROUPS /
+XPENDING) how far every group on a stream has got and only trims below the
+slowest one, so nothing undelivered or unacknowledged is removed. A hard
+length cap is applied as a last resort; entries dropped by it are counted
+and reported as forced trims.
+
+Pair it with a consumer_safe retention policy (see retention.py) so that
+writers stop trimming those streams themselves:
+
+    retention.set_policy("inbox", RetentionPolicy(consumer_safe=True, hard_maxlen=50000))
+    trimmer = SafeTrimmer(redis, patterns=["AG1:agent:*:inbox"])
+    asyncio.create_task(trimmer.run())
+
+reap_reply_streams() cleans up per-call reply streams (AG1:rpc_reply:...)
+that carry no TTL, e.g. ones created before reply TTLs existed or written by
+code that bypasses publish_envelope (see retention.py, "ephemeral_reply").
+"""
+import asyncio
+import json
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from redis.exceptions import ResponseError
+
+from AG1_AetherBus.envelope import Envelope
+from AG1_AetherBus.metrics import REGISTRY, stream_label
+from AG1_AetherBus.retention import REPLY_TTL_SECONDS, policy_for, xadd_kwargs
+
+REPLY_STREAM_PATTERN = "*:rpc_reply:*"
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def parse_stream_id(stream_id) -> Tuple[int, int]:
+    """'1700000000000-3' -> (1700000000000, 3), for ordering entry IDs."""
+    ms, _, seq = _decode(stream_id).partition("-")
+    return int(ms), int(seq or 0)
+
+
+class SafeTrimmer:
+    """
+    Periodically trims streams below the oldest entry any consumer group
+    still needs. Streams are given explicitly (`streams`) and/or discovered
+    by SCAN (`patterns`).
+    """
+
+    def __init__(
+        self,
+        redis,
+        streams: List[str] = None,
+        patterns: List[str] = None,
+        interval: float = 30.0,
+        hard_maxlen: int = None,
+        report_stream: str = None,
+    ):
+        self.redis = redis
+        self.streams = list(streams or [])
+        self.patterns = list(patterns or [])
+        self.interval = interval
+        self.hard_maxlen = hard_maxlen
+        self.report_stream = report_stream
+        # stream -> counters
+        self.stats: Dict[str, dict] = {}
+
+    def _stats_for(self, stream: str) -> dict:
+        return self.stats.setdefault(stream, {
+            "runs": 0,
+            "safe_trimmed": 0,
+            "forced_trimmed": 0,
+            "forced_events": 0,
+            "last_floor": None,
+            "last_length": None,
+        })
+
+    async def safe_floor(self, stream: str) -> Optional[str]:
+        """
+        Lowest entry ID that some consumer group still needs: the oldest
+        pending (delivered, unacked) entry or the last-delivered ID, whichever
+        is older, minimised over all groups. None if the stream has no groups.
+        """
+        try:
+            groups = await self.redis.xinfo_groups(stream)
+        except ResponseError:
+            return None  # stream vanished
+        floor = None
+        for group in groups:
+            name = _decode(group["name"])
+            candidate = _decode(group["last-delivered-id"])
+            if group.get("pending"):
+                pending = await self.redis.xpending(stream, name)
+                if pending.get("min") is not None:
+                    oldest_pending = _decode(pending["min"])
+                    if parse_stream_id(oldest_pending) < parse_stream_id(candidate):
+                        candidate = oldest_pending
+            if floor is None or parse_stream_id(candidate) < parse_stream_id(floor):
+                floor = candidate
+        return floor
+
+    async def trim_stream(self, stream: str) -> dict:
+        """Trim one stream; returns {'safe': n, 'forced': n} entries removed."""
+        stats = self._stats_for(stream)
+        stats["runs"] += 1
+        removed = {"safe": 0, "forced": 0}
+
+        floor = await self.safe_floor(stream)
+        stats["last_floor"] = floor
+        if floor and floor != "0-0":
+            # MINID keeps every entry >= floor, so the slowest group's next entry survives
+            removed["safe"] = await self.redis.xtrim(stream, minid=floor, approximate=True) or 0
+            stats["safe_trimmed"] += removed["safe"]
+            REGISTRY.counter("bus_trim_safe_total", "Consumed entries removed by SafeTrimmer", stream=stream_label(stream)).inc(removed["safe"])
+
+        hard_maxlen = self.hard_maxlen or policy_for(stream).hard_maxlen
+        length = await self.redis.xlen(stream)
+        if hard_maxlen and length > hard_maxlen:
+            # Everything below the floor is already gone, so whatever this removes
+            # had not been consumed by at least one group.
+            removed["forced"] = await self.redis.xtrim(stream, maxlen=hard_maxlen, approximate=False) or 0
+            if removed["forced"]:
+                stats["forced_trimmed"] += removed["forced"]
+                stats["forced_events"] += 1
+                REGISTRY.counter("bus_trim_forced_total", "Unconsumed entries removed by the hard cap", stream=stream_label(stream)).inc(removed["forced"])
+                print(f"[BUS][TRIM][WARN] Hard cap {hard_maxlen} hit on '{stream}': dropped {removed['forced']} entries not yet consumed by every group (floor {floor}).")
+            length -= removed["forced"]
+        stats["last_length"] = length
+        return removed
+
+    async def _discover(self) -> List[str]:
+        found = set(self.streams)
+        for pattern in self.patterns:
+            cursor = "0"
+            while True:
+                cursor, keys = await self.redis.scan(cursor=cursor, match=pattern, _type="stream")
+                found.update(_decode(k) for k in keys)
+                if cursor in (0, "0", b"0"):
+                    break
+        return sorted(found)
+
+    async def run_once(self) -> Dict[str, dict]:
+        """One pass over every stream; returns the entries removed per stream."""
+        results = {}
+        for stream in await self._discover():
+            try:
+                removed = await self.trim_stream(stream)
+            except ResponseError as e:
+                print(f"[BUS][TRIM][ERROR] Could not trim '{stream}': {e}")
+                continue
+            if removed["safe"] or removed["forced"]:
+                results[stream] = removed
+        if results and self.report_stream:
+            await self._publish_report(results)
+        return results
+
+    async def _publish_report(self, results: Dict[str, dict]):
+        report = Envelope(
+            role="system",
+            agent_name="bus_trimmer",
+            envelope_type="trim_report",
+            content={"trimmed": results, "at": time.time()},
+        )
+        await self.redis.xadd(self.report_stream, {"data": json.dumps(report.to_dict())}, **xadd_kwargs(self.report_stream))
+
+    async def run(self):
+        """Trim forever, every `interval` seconds."""
+        print(f"[BUS][TRIM] SafeTrimmer started (streams={self.streams}, patterns={self.patterns}, every {self.interval}s)")
+        while True:
+            try:
+                results = await self.run_once()
+                if results:
+                    print(f"[BUS][TRIM] {results}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[BUS][TRIM][ERROR] Trim pass failed: {e}")
+                traceback.print_exc()
+            await asyncio.sleep(self.interval)
+
+    def report(self) -> Dict[str, dict]:
+        """Cumulative per-stream trim counters."""
+        return {stream: dict(stats) for stream, stats in self.stats.items()}
+
+
+async def reap_reply_streams(redis, pattern: str = REPLY_STREAM_PATTERN, idle_seconds: float = REPLY_TTL_SECONDS) -> Dict[str, int]:
+    """
+    Reclaim orphaned reply streams: any stream matching `pattern` without a
+    TTL is deleted if its newest entry is older than `idle_seconds` (or it
+    is empty), otherwise given a TTL for the remaining idle time. Streams
+    that already expire are left alone. Returns {"deleted": n, "expiring": n}.
+    """
+    counts = {"deleted": 0, "expiring": 0}
+    now_ms = int(time.time() * 1000)
+    cursor = "0"
+    while True:
+        cursor, keys = await redis.scan(cursor=cursor, match=pattern, _type="stream")
+        for key in keys:
+            stream = _decode(key)
+            if await redis.ttl(stream) != -1:
+                continue
+            newest = await redis.xrevrange(stream, count=1)
+            idle_ms = now_ms - parse_stream_id(newest[0][0])[0] if newest else None
+            if idle_ms is None or idle_ms >= idle_seconds * 1000:
+                await redis.delete(stream)
+                counts["deleted"] += 1
+            else:
+                await redis.expire(stream, max(1, int(idle_seconds - idle_ms / 1000)))
+                counts["expiring"] += 1
+        if cursor in (0, "0", b"0"):
+            break
+    for action, n in counts.items():
+        if n:
+            REGISTRY.counter("bus_reply_streams_reaped_total", "Orphaned reply streams deleted or given a TTL", action=action).inc(n)
+    return counts
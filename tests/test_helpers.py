@@ -0,0 +1,207 @@
+"""
+test_helpers.py
+
+Purpose:
+    Table-driven tests for the bus's pure helpers (retention policies and key
+    classes, the metrics registry's exposition format, latency histograms,
+    reply-shape and URL helpers), which need no transport at all.
+
+Usage:
+    $ python -m pytest tests/test_helpers.py
+"""
+import math
+import random
+
+import pytest
+
+from AG1_AetherBus import metrics
+from AG1_AetherBus.bus import read_batches, redis_connection_kwargs, unix_socket_url
+from AG1_AetherBus.latency import HdrHistogram, queue_delay_ms
+from AG1_AetherBus.metrics import NULL_METRIC, MetricsRegistry
+from AG1_AetherBus.retention import RetentionPolicy, classify_stream, parse_policy
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("maxlen:500", RetentionPolicy(maxlen=500)),
+    ("  MAXLEN:500 ", RetentionPolicy(maxlen=500)),
+    ("age:3600", RetentionPolicy(max_age_seconds=3600.0)),
+    ("age:1.5", RetentionPolicy(max_age_seconds=1.5)),
+    ("safe", RetentionPolicy(consumer_safe=True)),
+    ("safe:50000", RetentionPolicy(consumer_safe=True, hard_maxlen=50000)),
+    ("none", RetentionPolicy()),
+    ("off", RetentionPolicy()),
+    ("", RetentionPolicy()),
+    ("maxlen:1000,ttl:600", RetentionPolicy(maxlen=1000, expire_seconds=600)),
+    ("age:60,ttl:120", RetentionPolicy(max_age_seconds=60.0, expire_seconds=120)),
+    ("safe:10,ttl:30", RetentionPolicy(consumer_safe=True, hard_maxlen=10, expire_seconds=30)),
+    ("none,ttl:600", RetentionPolicy(expire_seconds=600)),
+])
+def test_parse_policy(spec, expected):
+    assert parse_policy(spec) == expected
+
+
+@pytest.mark.parametrize("spec", ["maxlen", "maxlen:abc", "keep:10", "maxlen:10,ttl:soon"])
+def test_parse_policy_rejects_bad_specs(spec):
+    with pytest.raises(ValueError):
+        parse_policy(spec)
+
+
+@pytest.mark.parametrize("policy, kwargs", [
+    (RetentionPolicy(maxlen=10), {"maxlen": 10, "approximate": True}),
+    (RetentionPolicy(consumer_safe=True, hard_maxlen=10), {}),
+    (RetentionPolicy(), {}),
+])
+def test_policy_xadd_kwargs(policy, kwargs):
+    assert policy.xadd_kwargs() == kwargs
+
+
+def test_age_policy_min_id():
+    assert RetentionPolicy(max_age_seconds=60).min_id(now_ms=100_000) == "40000-0"
+    assert RetentionPolicy(max_age_seconds=600).min_id(now_ms=100_000) == "0-0"
+
+
+@pytest.mark.parametrize("stream, key_class", [
+    ("user.discovery", "discovery"),
+    ("AG1:rpc_reply:mux:host:1:abcd1234", "ephemeral_reply"),
+    ("AG1:rpc_reply:stream:cid-1", "ephemeral_reply"),
+    # ephemeral_reply is checked before rpc_reply: a per-call stream ending in :response is still per-call
+    ("AG1:rpc_reply:cid-1:response", "ephemeral_reply"),
+    ("AG1:edge:llm:response", "rpc_reply"),
+    ("AG1:a2a:response:task-1", "rpc_reply"),
+    ("AG1:agent:muse:inbox", "inbox"),
+    ("AG1:agent:muse:inbox:high", "inbox"),
+    ("AG1:agent:muse:inbox:low", "inbox"),
+    ("AG1:agent:muse:outbox", "outbox"),
+    ("AG1:agent:muse:register", "register"),
+    ("AG1:session:abc:stream", "session"),
+    ("AG1:flow:f1:input", "session"),
+    ("AG1:a2a:stream:task-1", "session"),
+    ("AG1:something:else", "default"),
+])
+def test_classify_stream(stream, key_class):
+    assert classify_stream(stream) == key_class
+
+
+def test_render_prometheus_format():
+    registry = MetricsRegistry()
+    registry.counter("bus_publish_total", "Envelopes published", stream="AG1:a:inbox").inc(3)
+    registry.gauge("bus_in_flight", "Handlers running", stream='we"ird\\name\nx').set(2)
+    hist = registry.histogram("bus_publish_ms", "Publish time (ms)", stream="s")
+    for value in (0.2, 3, 3, 70000):
+        hist.observe(value)
+
+    lines = registry.render_prometheus().splitlines()
+    assert "# HELP bus_publish_total Envelopes published" in lines
+    assert "# TYPE bus_publish_total counter" in lines
+    assert 'bus_publish_total{stream="AG1:a:inbox"} 3.0' in lines
+    assert 'bus_in_flight{stream="we\\"ird\\\\name\\nx"} 2' in lines  # ", \\ and newline escaped
+
+    assert "# TYPE bus_publish_ms histogram" in lines
+    buckets = [line for line in lines if line.startswith("bus_publish_ms_bucket")]
+    assert buckets[0] == 'bus_publish_ms_bucket{stream="s",le="0.5"} 1'
+    assert 'bus_publish_ms_bucket{stream="s",le="5"} 3' in buckets  # cumulative
+    assert buckets[-1] == 'bus_publish_ms_bucket{stream="s",le="+Inf"} 4'
+    counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert counts == sorted(counts)
+    assert 'bus_publish_ms_count{stream="s"} 4' in lines
+    assert 'bus_publish_ms_sum{stream="s"} 70006.2' in lines
+
+
+def test_series_cap_falls_back_to_null_metric(monkeypatch):
+    monkeypatch.setattr(metrics, "MAX_SERIES_PER_METRIC", 2)
+    registry = MetricsRegistry()
+    first = registry.counter("c", stream="a")
+    registry.counter("c", stream="b").inc()
+    assert registry.counter("c", stream="c") is NULL_METRIC
+    assert registry.counter("c", stream="a") is first  # existing series still resolve
+    registry.counter("c", stream="c").inc()  # no-op
+    assert 'stream="c"' not in registry.render_prometheus()
+    assert MetricsRegistry(enabled=False).counter("c") is NULL_METRIC
+
+
+def _exact_percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(q * len(ordered))) - 1]
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_hdr_histogram_percentiles_within_bucket_error(seed):
+    rng = random.Random(seed)
+    values = [rng.lognormvariate(2, 1.5) for _ in range(5000)]  # ms, long-tailed
+    hist = HdrHistogram()
+    for v in values:
+        hist.record(v)
+
+    result = hist.percentiles((0.5, 0.95, 0.99))
+    for q in (0.5, 0.95, 0.99):
+        exact = _exact_percentile(values, q)
+        # upper bucket edge: never below the true value, at most ~1/32 above (plus 1 us resolution)
+        assert exact - 0.001 <= result[f"p{int(q * 100)}"] <= exact * (1 + 1 / 32) + 0.002
+
+
+def test_hdr_histogram_small_values_are_exact():
+    hist = HdrHistogram()
+    for us in range(1, 11):
+        hist.record(us / 1000)
+    assert hist.percentiles((0.5, 1.0)) == {"p50": 0.005, "p100": 0.01}
+    assert HdrHistogram().percentiles((0.5,)) == {"p50": None}
+
+
+def test_hdr_histogram_merge_matches_single_histogram():
+    rng = random.Random(7)
+    a_values = [rng.uniform(0, 50) for _ in range(1000)]
+    b_values = [rng.uniform(100, 500) for _ in range(500)]
+    a, b, both = HdrHistogram(), HdrHistogram(), HdrHistogram()
+    for v in a_values:
+        a.record(v)
+        both.record(v)
+    for v in b_values:
+        b.record(v)
+        both.record(v)
+
+    merged = a.merge(b)
+    assert merged.counts == both.counts and merged.count == 1500
+    assert merged.max_us == both.max_us
+    assert merged.percentiles() == both.percentiles()
+    assert HdrHistogram.from_dict(merged.to_dict()).percentiles() == both.percentiles()
+
+
+def test_queue_delay_uses_entry_id_clock():
+    assert queue_delay_ms("1000-0", now=1.5) == 500.0
+    assert queue_delay_ms(b"2000-3", now=1.5) == 0.0  # consumer clock behind Redis: clamped
+
+
+ENTRIES = [(b"1-0", {b"data": b"{}"}), (b"2-0", {b"data": b"{}"})]
+
+
+@pytest.mark.parametrize("response, expected", [
+    # RESP2: a list of [stream, entries] pairs
+    ([[b"AG1:a:inbox", ENTRIES]], [(b"AG1:a:inbox", ENTRIES)]),
+    ([[b"a", ENTRIES[:1]], [b"b", ENTRIES[1:]]], [(b"a", ENTRIES[:1]), (b"b", ENTRIES[1:])]),
+    # RESP3: a {stream: [entries]} map
+    ({b"AG1:a:inbox": [ENTRIES]}, [(b"AG1:a:inbox", ENTRIES)]),
+    ({b"a": [ENTRIES[:1]], b"b": [ENTRIES[1:]]}, [(b"a", ENTRIES[:1]), (b"b", ENTRIES[1:])]),
+    ({b"a": []}, [(b"a", [])]),
+    # nothing read (BLOCK timed out)
+    (None, []),
+    ([], []),
+    ({}, []),
+])
+def test_read_batches_handles_resp2_and_resp3(response, expected):
+    assert [(stream, list(entries)) for stream, entries in read_batches(response)] == expected
+
+
+@pytest.mark.parametrize("user, pwd, url", [
+    (None, None, "unix:///var/run/redis/redis.sock"),
+    (None, "secret", "unix://:secret@/var/run/redis/redis.sock"),
+    ("admin", "secret", "unix://admin:secret@/var/run/redis/redis.sock"),
+    ("admin", None, "unix:///var/run/redis/redis.sock"),  # a user without a password is ignored
+])
+def test_unix_socket_url(user, pwd, url):
+    assert unix_socket_url("/var/run/redis/redis.sock", user, pwd) == url
+
+
+def test_connection_kwargs_skip_keepalive_on_unix_sockets():
+    assert "socket_keepalive" not in redis_connection_kwargs("unix:///tmp/redis.sock", protocol=3, keepalive=True)
+    tcp = redis_connection_kwargs("redis://localhost:6379", protocol=2, keepalive=True)
+    assert tcp["protocol"] == 2 and tcp["socket_keepalive"] is True
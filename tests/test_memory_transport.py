@@ -0,0 +1,768 @@
+"""
+test_memory_transport.py
+
+Purpose:
+    Runs publish_envelope / subscribe / subscribe_simple / RPC over the in-process
+    transport (InMemoryRedis), so the bus paths are exercised without a Redis server.
+
+Usage:
+    $ python -m pytest tests/test_memory_transport.py
+"""
+import asyncio
+import json
+import time
+
+import pytest
+
+from AG1_AetherBus.bus import publish_envelope, subscribe, subscribe_simple
+from AG1_AetherBus.envelope import Envelope
+from AG1_AetherBus.memory_transport import InMemoryRedis
+from AG1_AetherBus.rpc import bus_rpc_envelope
+from AG1_AetherBus.trimming import SafeTrimmer
+
+STREAM = "AG1:agent:memtest:inbox"
+
+
+async def _cancel(task):
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_subscribe_delivers_and_acks():
+    redis = InMemoryRedis()
+    received = asyncio.Queue()
+
+    async def handler(env):
+        await received.put(env)
+
+    task = asyncio.create_task(subscribe(redis, STREAM, handler, group="memtest", block_ms=50))
+    await asyncio.sleep(0.01)
+    await publish_envelope(redis, STREAM, Envelope(role="user", content={"text": "hi"}))
+
+    env = await asyncio.wait_for(received.get(), 1)
+    assert env.content == {"text": "hi"}
+    await asyncio.sleep(0.01)
+    assert (await redis.xpending(STREAM, "memtest"))["pending"] == 0
+    await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_group_consumers_share_entries():
+    redis = InMemoryRedis()
+    seen = {"a": [], "b": []}
+
+    def handler_for(name):
+        async def handler(env):
+            seen[name].append(env.content["n"])
+        return handler
+
+    tasks = [
+        asyncio.create_task(subscribe(redis, STREAM, handler_for(name), group="shared", consumer=name, block_ms=50))
+        for name in seen
+    ]
+    await asyncio.sleep(0.01)
+    for n in range(20):
+        await publish_envelope(redis, STREAM, Envelope(role="user", content={"n": n}))
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.05)
+
+    assert sorted(seen["a"] + seen["b"]) == list(range(20))
+    for task in tasks:
+        await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_blocking_xread_wakes_on_xadd():
+    redis = InMemoryRedis()
+    reader = asyncio.create_task(redis.xread({STREAM: "$"}, block=1000))
+    await asyncio.sleep(0.01)
+    await redis.xadd(STREAM, {"data": "x"})
+
+    [[stream, entries]] = await asyncio.wait_for(reader, 0.5)
+    assert stream == STREAM.encode()
+    assert entries[0][1] == {b"data": b"x"}
+    assert await redis.xread({STREAM: "$"}, block=10) == []
+
+
+@pytest.mark.asyncio
+async def test_exists_and_expire_look_up_keys_directly():
+    redis = InMemoryRedis()
+    for n in range(2000):
+        await redis.set(f"filler:{n}", "x")
+    await redis.xadd(STREAM, {"data": "{}"})
+
+    assert await redis.exists(STREAM, "missing") == 1
+    assert await redis.expire("missing", 10) is False
+    assert await redis.expire(STREAM, 0.01) is True
+    await asyncio.sleep(0.02)
+    assert await redis.exists(STREAM) == 0 and await redis.ttl(STREAM) == -2
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        await redis.exists(STREAM)
+    assert time.perf_counter() - started < 0.05  # no walk over the 2000 other keys
+
+
+@pytest.mark.asyncio
+async def test_subscribe_simple_starts_at_tail():
+    redis = InMemoryRedis()
+    await publish_envelope(redis, STREAM, Envelope(role="user", content={"n": "old"}))
+    received = asyncio.Queue()
+
+    async def handler(env):
+        await received.put(env.content["n"])
+
+    task = asyncio.create_task(subscribe_simple(redis, STREAM, handler, low_latency=True))
+    await asyncio.sleep(0.01)
+    await publish_envelope(redis, STREAM, Envelope(role="user", content={"n": "new"}))
+
+    assert await asyncio.wait_for(received.get(), 1) == "new"
+    assert received.empty()
+    await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_rpc_round_trip():
+    redis = InMemoryRedis()
+    target = "AG1:agent:echo:inbox"
+
+    async def echo(env):
+        reply = Envelope(role="agent", content={"echo": env.content}, correlation_id=env.correlation_id)
+        await publish_envelope(redis, env.reply_to, reply)
+
+    task = asyncio.create_task(subscribe(redis, target, echo, group="echo", block_ms=50))
+    await asyncio.sleep(0.01)
+    request = Envelope(role="user", content={"q": 1}, reply_to="AG1:rpc_reply:memtest:1", correlation_id="memtest-1")
+
+    response = await bus_rpc_envelope(redis, target, request, timeout=1)
+    assert isinstance(response, Envelope)
+    assert response.content == {"echo": {"q": 1}}
+    await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_safe_trimmer_keeps_unconsumed_entries():
+    redis = InMemoryRedis()
+    await redis.xgroup_create(STREAM, "slow", id="0", mkstream=True)
+    for n in range(10):
+        await redis.xadd(STREAM, {"n": n})
+    await redis.xreadgroup("slow", "c1", {STREAM: ">"}, count=4)
+    await redis.xack(STREAM, "slow", *[e[0] for e in (await redis.xrange(STREAM, count=3))])
+
+    removed = await SafeTrimmer(redis, streams=[STREAM]).trim_stream(STREAM)
+    assert removed == {"safe": 3, "forced": 0}
+    assert await redis.xlen(STREAM) == 7
+
+
+@pytest.mark.asyncio
+async def test_in_flight_window_pauses_reads_at_limit():
+    from AG1_AetherBus.backpressure import WINDOWS
+
+    redis = InMemoryRedis()
+    running, peak, handled, reads = 0, 0, [], []
+
+    async def handler(env):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.03)
+        running -= 1
+        handled.append(env.envelope_id)
+
+    xreadgroup = redis.xreadgroup
+
+    async def spy(*args, **kwargs):
+        reads.append((WINDOWS[(STREAM, "window")].in_flight, kwargs.get("count")))  # slots taken at read time
+        return await xreadgroup(*args, **kwargs)
+
+    redis.xreadgroup = spy
+    for _ in range(12):
+        await publish_envelope(redis, STREAM, Envelope(role="user", content={}))
+    task = asyncio.create_task(subscribe(redis, STREAM, handler, group="window", block_ms=20, max_in_flight=3))
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if len(handled) == 12:
+            break
+
+    assert len(handled) == 12
+    assert peak == 3
+    assert all(busy < 3 and count == 3 - busy for busy, count in reads)  # never read while full
+    assert WINDOWS[(STREAM, "window")].stats()["blocked_total"] > 0  # and did wait for capacity
+    await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_adapter_stop_drains_in_flight_handlers():
+    from AG1_AetherBus.bus_adapterV2 import BusAdapterV2
+
+    redis = InMemoryRedis()
+    await redis.xgroup_create(STREAM, "drain", id="$", mkstream=True)
+    started, finished = asyncio.Event(), []
+
+    async def slow_handler(env, redis_client):
+        started.set()
+        await asyncio.sleep(0.2)
+        finished.append(env.content["n"])
+
+    adapter = BusAdapterV2("drain", slow_handler, redis, patterns=[STREAM], group="drain", max_in_flight=4)
+    await adapter.start()
+    await asyncio.sleep(0.01)
+    for n in range(4):
+        await publish_envelope(redis, STREAM, Envelope(role="user", content={"n": n}))
+    await asyncio.wait_for(started.wait(), 1)
+
+    assert await adapter.stop(drain_timeout=3) is True
+    assert sorted(finished) == [0, 1, 2, 3]
+    assert (await redis.xpending(STREAM, "drain"))["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_dedup_skips_repeated_envelope_id():
+    from AG1_AetherBus.dedup import DedupCache
+
+    redis = InMemoryRedis()
+    dedup = DedupCache(redis, max_entries=100)
+    handled = []
+
+    async def handler(env):
+        handled.append(env.envelope_id)
+
+    task = asyncio.create_task(subscribe(redis, STREAM, handler, group="dedup", block_ms=50, dedup=dedup))
+    await asyncio.sleep(0.01)
+    env = Envelope(role="user", content={"text": "once"})
+    await publish_envelope(redis, STREAM, env)
+    await publish_envelope(redis, STREAM, env)  # e.g. an edge re-posting the same update
+    await asyncio.sleep(0.05)
+
+    assert handled == [env.envelope_id]
+    assert dedup.stats()["hits"] == 1
+    assert (await redis.xpending(STREAM, "dedup"))["pending"] == 0
+    await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_priority_lane_overtakes_saturated_low_lane():
+    from AG1_AetherBus.bus import subscribe_priority
+
+    redis = InMemoryRedis()
+    order = []
+
+    async def handler(env):
+        await asyncio.sleep(0.002)
+        order.append(env.headers.get("priority"))
+
+    task = asyncio.create_task(subscribe_priority(redis, STREAM, handler, group="lanes", block_ms=50))
+    await asyncio.sleep(0.01)
+    for _ in range(100):
+        await publish_envelope(redis, STREAM, Envelope(role="system", headers={"priority": "low"}))
+    await asyncio.sleep(0.02)
+    await publish_envelope(redis, STREAM, Envelope(role="user", headers={"priority": "high"}))
+    await asyncio.sleep(0.05)
+
+    assert await redis.xlen(f"{STREAM}:low") == 100  # routed to the lane, not the inbox
+    assert "high" in order
+    assert order.index("high") < 40  # not queued behind the low backlog
+    await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_priority_discovery_keeps_backpressure_options():
+    from AG1_AetherBus.agent_bus_minimal import discover_and_subscribe
+
+    redis = InMemoryRedis()
+    inbox = "AG1:agent:lanesbp:inbox"
+    running, peak, handled = 0, 0, []
+
+    async def handler(env):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        handled.append(env.envelope_id)
+
+    await publish_envelope(redis, inbox, Envelope(role="user", content={}))  # creates the inbox for SCAN
+    stop = asyncio.Event()
+    task = asyncio.create_task(discover_and_subscribe(
+        redis, f"{inbox}*", "lanes", handler, poll_delay=0.05, stop_event=stop,
+        priority_weights={"high": 4}, max_in_flight=3, drain_timeout=1,
+    ))
+    await asyncio.sleep(0.02)
+    for _ in range(8):
+        await publish_envelope(redis, inbox, Envelope(role="user", content={}, headers={"priority": "high"}))
+    await asyncio.sleep(0.08)
+    stop.set()
+    await asyncio.wait_for(task, 2)
+
+    assert peak == 3  # max_in_flight reached the lane subscriber
+    assert running == 0 and len(handled) >= 4  # drained before returning
+
+
+@pytest.mark.asyncio
+async def test_delayed_publish_lands_when_due():
+    from AG1_AetherBus.bus import DISCOVERY_STREAM
+    from AG1_AetherBus.scheduler import TIMERS_KEY, Scheduler, payloads_key
+
+    redis = InMemoryRedis()
+    env = Envelope(role="user", content={"text": "reminder"})
+    await publish_envelope(redis, STREAM, env, delay=60)
+
+    assert await redis.xlen(STREAM) == 0
+    assert await redis.zrangebyscore(TIMERS_KEY, "-inf", "+inf") == [env.envelope_id.encode()]  # only the id
+
+    scheduler = Scheduler(redis)
+    assert await scheduler.run_once() == 0
+    assert await scheduler.run_once(now=time.time() + 61) == 1
+    assert await redis.zcard(TIMERS_KEY) == 0
+    assert await redis.hgetall(payloads_key()) == {}
+    [(_, fields)] = await redis.xrange(STREAM)
+    assert json.loads(fields[b"data"])["envelope_id"] == env.envelope_id
+    assert await redis.xlen(DISCOVERY_STREAM) == 1  # announced like an immediate publish
+
+
+@pytest.mark.asyncio
+async def test_identical_rpcs_are_coalesced():
+    from AG1_AetherBus.singleflight import SingleFlight
+
+    redis = InMemoryRedis()
+    target = "AG1:agent:tools:inbox"
+    calls = []
+
+    async def list_tools(env):
+        calls.append(env.correlation_id)
+        await asyncio.sleep(0.05)
+        reply = Envelope(role="agent", content={"tools": ["search"]}, correlation_id=env.correlation_id)
+        await publish_envelope(redis, env.reply_to, reply)
+
+    task = asyncio.create_task(subscribe(redis, target, list_tools, group="tools", block_ms=50))
+    await asyncio.sleep(0.01)
+    requests = [
+        Envelope(role="user", content={"op": "list"}, reply_to=f"AG1:rpc_reply:memtest:{n}", correlation_id=f"cid-{n}")
+        for n in range(5)
+    ]
+
+    responses = await asyncio.gather(*(bus_rpc_envelope(redis, target, r, timeout=1, coalesce_key=True) for r in requests))
+    assert len(calls) == 1
+    assert [r.correlation_id for r in responses] == [f"cid-{n}" for n in range(5)]
+    assert all(r.content == {"tools": ["search"]} for r in responses)
+
+    # a second process (its own SingleFlight) follows the leader through Redis
+    other_process, executed = SingleFlight(), []
+
+    async def work():
+        executed.append(1)
+        await asyncio.sleep(0.05)
+        return {"n": 42}
+
+    results = await asyncio.gather(
+        SingleFlight().do("k", work, redis=redis, timeout=1),
+        other_process.do("k", work, redis=redis, timeout=1),
+    )
+    assert results == [{"n": 42}, {"n": 42}] and len(executed) == 1
+    await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_followers():
+    from AG1_AetherBus.singleflight import SingleFlight
+
+    flights, executed = SingleFlight(), []
+
+    async def work():
+        executed.append(1)
+        await asyncio.sleep(0.05)
+        return len(executed)
+
+    leader = asyncio.create_task(flights.do("k", work))
+    await asyncio.sleep(0.01)
+    followers = [asyncio.create_task(flights.do("k", work)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    await _cancel(leader)
+
+    # one follower takes over as leader, the other shares its result
+    assert await asyncio.gather(*followers) == [2, 2]
+    assert leader.cancelled() and len(executed) == 2
+
+
+@pytest.mark.asyncio
+async def test_reply_mux_routes_concurrent_replies():
+    from AG1_AetherBus.reply_mux import close_reply_mux, get_reply_mux
+
+    redis = InMemoryRedis()
+    target = "AG1:agent:echo:inbox"
+
+    async def echo(env):
+        await publish_envelope(redis, env.reply_to, Envelope(role="agent", content=env.content, correlation_id=env.correlation_id))
+
+    task = asyncio.create_task(subscribe(redis, target, echo, group="echo", block_ms=50, max_in_flight=16))
+    await asyncio.sleep(0.01)
+
+    # no reply_to: bus_rpc_envelope goes through the shared reply listener
+    responses = await asyncio.gather(*(
+        bus_rpc_envelope(redis, target, Envelope(role="user", content={"n": n}), timeout=2) for n in range(50)
+    ))
+    assert [r.content["n"] for r in responses] == list(range(50))
+    mux = get_reply_mux(redis)
+    assert await redis.xlen(mux.stream) == 50  # one reply stream for all calls
+    assert mux.in_flight == 0
+
+    await close_reply_mux(redis)
+    await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_adapter_request_response_reuses_reply_router():
+    from AG1_AetherBus.bus_adapterV2 import BusAdapterV2
+
+    redis = InMemoryRedis()
+    target = "AG1:agent:echo:inbox"
+    reply_to = "AG1:agent:caller:outbox"
+    await publish_envelope(redis, reply_to, Envelope(role="agent", correlation_id="old"))  # history is skipped
+
+    async def echo(env):
+        await publish_envelope(redis, env.reply_to, Envelope(role="agent", content=env.content, correlation_id=env.correlation_id))
+
+    task = asyncio.create_task(subscribe(redis, target, echo, group="echo", block_ms=50, max_in_flight=8))
+    await asyncio.sleep(0.01)
+    adapter = BusAdapterV2("caller", echo, redis)
+
+    for n in range(3):
+        resp = await adapter.request_response(target, Envelope(role="user", content={"n": n}, reply_to=reply_to), timeout=1)
+        assert resp.content == {"n": n}
+    many = await asyncio.gather(*(
+        adapter.request_response(target, Envelope(role="user", content={"n": n}, reply_to=reply_to), timeout=1)
+        for n in range(20)
+    ))
+    assert [r.content["n"] for r in many] == list(range(20))
+    assert adapter.list_subscriptions() == [] and list(adapter._reply_routers) == [reply_to]
+
+    await adapter.stop(drain_timeout=1)
+    assert await redis.exists(reply_to) == 1  # shared reply stream is left in place
+    await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_scatter_yields_fastest_replies_first():
+    from AG1_AetherBus.reply_mux import close_reply_mux
+    from AG1_AetherBus.rpc import bus_rpc_scatter
+
+    redis = InMemoryRedis()
+    delays = {"AG1:agent:fast:inbox": 0.0, "AG1:agent:mid:inbox": 0.05, "AG1:agent:slow:inbox": 2.0}
+
+    def responder(delay):
+        async def handler(env):
+            await asyncio.sleep(delay)
+            await publish_envelope(redis, env.reply_to, Envelope(role="agent", content={"delay": delay}, correlation_id=env.correlation_id))
+        return handler
+
+    tasks = [
+        asyncio.create_task(subscribe(redis, target, responder(delay), group="scatter", block_ms=50))
+        for target, delay in delays.items()
+    ]
+    await asyncio.sleep(0.01)
+
+    started = time.monotonic()
+    replies = [target async for target, _ in bus_rpc_scatter(redis, list(delays), Envelope(role="user"), want=2, timeout=1)]
+    assert replies == ["AG1:agent:fast:inbox", "AG1:agent:mid:inbox"]
+    assert time.monotonic() - started < 0.5  # not held up by the slow target
+
+    await close_reply_mux(redis)
+    for task in tasks:
+        await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_subscribe_drops_envelopes_past_deadline():
+    from AG1_AetherBus.metrics import REGISTRY
+
+    redis = InMemoryRedis()
+    handled = []
+
+    async def handler(env):
+        handled.append(env.content["n"])
+
+    stale = Envelope(role="user", content={"n": "stale"})
+    stale.set_deadline(-5)  # the caller gave up five seconds ago
+    fresh = Envelope(role="user", content={"n": "fresh"})
+    fresh.set_deadline(5)
+    assert stale.expired() and not fresh.expired() and 4 < fresh.time_remaining() < 5.01
+
+    task = asyncio.create_task(subscribe(redis, STREAM, handler, group="deadline", block_ms=50))
+    await asyncio.sleep(0.01)
+    await publish_envelope(redis, STREAM, stale)
+    await publish_envelope(redis, STREAM, fresh)
+    await asyncio.sleep(0.05)
+
+    assert handled == ["fresh"]
+    assert REGISTRY.counter("bus_expired_total", stream=STREAM, group="deadline").value == 1
+    assert (await redis.xpending(STREAM, "deadline"))["pending"] == 0
+    await _cancel(task)
+
+    # handler-side check: same grace as subscribe, counted in the same series
+    from AG1_AetherBus.bus import DEADLINE_GRACE_SECONDS, deadline_passed
+    just_missed = Envelope(role="user", content={})
+    just_missed.set_deadline(-DEADLINE_GRACE_SECONDS / 2)  # within the grace: still handled
+    assert just_missed.expired() and not deadline_passed(just_missed, STREAM, "deadline")
+    assert deadline_passed(stale, STREAM, "deadline")
+    assert REGISTRY.counter("bus_expired_total", stream=STREAM, group="deadline").value == 2
+
+
+@pytest.mark.asyncio
+async def test_rpc_stream_yields_chunks_until_end_marker():
+    from AG1_AetherBus.rpc import bus_rpc_stream, reply_stream
+
+    redis = InMemoryRedis()
+    target = "AG1:agent:streamer:inbox"
+
+    async def tokens(env):
+        async def chunks():
+            for word in ("hello", "streaming", "world"):
+                await asyncio.sleep(0.01)
+                yield {"token": word}
+        await reply_stream(redis, env, chunks())
+
+    task = asyncio.create_task(subscribe(redis, target, tokens, group="streamer", block_ms=50))
+    await asyncio.sleep(0.01)
+
+    request = Envelope(role="user", content={"prompt": "hi"})
+    chunks = [c.content["token"] async for c in bus_rpc_stream(redis, target, request, first_chunk_timeout=1, chunk_timeout=0.5)]
+    assert chunks == ["hello", "streaming", "world"]
+    assert await redis.exists(request.reply_to) == 0  # private reply stream removed
+
+    limited = [c async for c in bus_rpc_stream(redis, target, Envelope(role="user"), timeout=1, max_responses=2)]
+    assert len(limited) == 2
+    await _cancel(task)
+
+    # a zero timeout must not turn into XREAD BLOCK 0 (block forever)
+    blocks, xread = [], redis.xread
+
+    async def spy(streams, count=None, block=None):
+        blocks.append(block)
+        return await xread(streams, count=count, block=block)
+
+    redis.xread = spy
+    started = time.monotonic()
+    assert [c async for c in bus_rpc_stream(redis, "AG1:agent:nobody:inbox", Envelope(role="user"), first_chunk_timeout=0)] == []
+    await asyncio.sleep(0.01)
+    assert time.monotonic() - started < 0.5
+    assert blocks and all(block >= 1 for block in blocks)
+
+
+@pytest.mark.asyncio
+async def test_reply_streams_expire_and_orphans_are_reaped():
+    from AG1_AetherBus.trimming import reap_reply_streams
+
+    redis = InMemoryRedis()
+    reply = "AG1:rpc_reply:memtest:cid-1"
+    await publish_envelope(redis, reply, Envelope(role="agent"))
+    assert 0 < await redis.ttl(reply) <= 600
+    await publish_envelope(redis, "AG1:edge:llm:alice:response", Envelope(role="agent"))
+    assert await redis.ttl("AG1:edge:llm:alice:response") == -1  # shared reply streams keep no TTL
+
+    # written without publish_envelope, so no TTL: one long idle, one recent
+    await redis.xadd("AG1:rpc_reply:old:cid-2", {"data": "{}"}, id=f"{int(time.time() * 1000) - 3_600_000}-0")
+    await redis.xadd("AG1:rpc_reply:new:cid-3", {"data": "{}"})
+
+    assert await reap_reply_streams(redis, idle_seconds=600) == {"deleted": 1, "expiring": 1}
+    assert await redis.exists("AG1:rpc_reply:old:cid-2") == 0
+    assert 0 < await redis.ttl("AG1:rpc_reply:new:cid-3") <= 600
+
+
+@pytest.mark.asyncio
+async def test_response_cache_answers_repeat_lookups():
+    from AG1_AetherBus.reply_mux import close_reply_mux
+    from AG1_AetherBus.rpc_cache import ResponseCache, mark_cacheable
+
+    redis = InMemoryRedis()
+    target = "AG1:agent:registry:inbox"
+    calls = []
+
+    async def lookup(env):
+        calls.append(env.content["name"])
+        reply = Envelope(role="agent", content={"found": env.content["name"]}, correlation_id=env.correlation_id)
+        if env.content["name"] != "volatile":
+            mark_cacheable(reply, 60)
+        await publish_envelope(redis, env.reply_to, reply)
+
+    task = asyncio.create_task(subscribe(redis, target, lookup, group="registry", block_ms=50))
+    await asyncio.sleep(0.01)
+    cache = ResponseCache(redis)
+
+    for name in ("muse", "muse", "volatile", "volatile"):
+        reply = await bus_rpc_envelope(redis, target, Envelope(role="user", content={"name": name}), timeout=1, cache=cache)
+        assert reply.content == {"found": name}
+    assert calls == ["muse", "volatile", "volatile"]
+
+    # another process with an empty local tier hits the shared Redis tier
+    other = ResponseCache(redis)
+    assert (await other.get(target, Envelope(role="user", content={"name": "muse"}))).content == {"found": "muse"}
+    assert cache.stats()["targets"][target] == {"hits": 1, "misses": 3, "hit_ratio": 0.25}
+
+    await close_reply_mux(redis)
+    await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_hedged_rpc_beats_stalled_replica():
+    from AG1_AetherBus.dedup import DedupCache
+    from AG1_AetherBus.hedging import HedgePolicy
+    from AG1_AetherBus.reply_mux import close_reply_mux
+
+    redis = InMemoryRedis()
+    target = "AG1:agent:replicas:inbox"
+    handled = []
+
+    def replica(name, delay):
+        async def handler(env):
+            handled.append((name, env.headers.get("hedge_of")))
+            await asyncio.sleep(delay)
+            await publish_envelope(redis, env.reply_to, Envelope(role="agent", content={"by": name}, correlation_id=env.correlation_id))
+        return handler
+
+    dedup = DedupCache(redis)
+    tasks = [
+        asyncio.create_task(subscribe(redis, target, replica("stalled", 1.0), group="replicas", consumer="a", block_ms=50, dedup=dedup)),
+    ]
+    await asyncio.sleep(0.01)
+    policy = HedgePolicy(default_delay=0.05, budget=1.0, max_burst=1)
+
+    request = Envelope(role="user", content={"q": 1})
+    call = asyncio.create_task(bus_rpc_envelope(redis, target, request, timeout=2, hedge=policy))
+    await asyncio.sleep(0.02)  # the stalled replica has taken the original
+    tasks.append(asyncio.create_task(subscribe(redis, target, replica("healthy", 0.0), group="replicas", consumer="b", block_ms=50, dedup=dedup)))
+
+    started = time.monotonic()
+    reply = await call
+    assert reply.content == {"by": "healthy"}
+    assert time.monotonic() - started < 0.5
+    assert handled == [("stalled", None), ("healthy", request.envelope_id)]
+    assert await dedup.is_done(request.envelope_id)
+
+    await close_reply_mux(redis)
+    for task in tasks:
+        await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_fails_fast_and_recovers():
+    from AG1_AetherBus.circuit import BreakerRegistry
+    from AG1_AetherBus.reply_mux import close_reply_mux
+
+    redis = InMemoryRedis()
+    target = "AG1:agent:flaky:inbox"
+    breakers = BreakerRegistry(failure_threshold=2, reset_timeout=0.2)
+
+    for _ in range(2):
+        reply = await bus_rpc_envelope(redis, target, Envelope(role="user", content={}), timeout=0.05, circuit=breakers)
+        assert reply == {"error": "RPC Timeout or No Response"}
+    assert breakers.get(target).state == "open"
+
+    started = time.monotonic()
+    reply = await bus_rpc_envelope(redis, target, Envelope(role="user", content={}), timeout=5, circuit=breakers)
+    assert reply == {"error": f"Circuit open for {target}"}
+    assert time.monotonic() - started < 0.05
+
+    async def handler(env):
+        await publish_envelope(redis, env.reply_to, Envelope(role="agent", content={"ok": True}, correlation_id=env.correlation_id))
+
+    task = asyncio.create_task(subscribe(redis, target, handler, block_ms=50))
+    await asyncio.sleep(0.2)  # reset_timeout passes; the next call is the half-open probe
+    reply = await bus_rpc_envelope(redis, target, Envelope(role="user", content={}), timeout=2, circuit=breakers)
+    assert reply.content == {"ok": True}
+    snapshot = breakers.snapshot()[target]
+    assert snapshot["state"] == "closed" and 0 < snapshot["health"] < 1
+
+    # a caller-side error (oversized envelope) is not the target's failure
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            await bus_rpc_envelope(redis, target, Envelope(role="user", content={"blob": "x" * 200_000}), timeout=1, circuit=breakers)
+    assert breakers.get(target).state == "closed" and breakers.get(target).consecutive_failures == 0
+
+    # with liveness checks, a target nobody consumes is refused without sending
+    live_only = BreakerRegistry(check_liveness=True)
+    reply = await bus_rpc_envelope(redis, "AG1:agent:nobody:inbox", Envelope(role="user", content={}), timeout=5, circuit=live_only)
+    assert reply == {"error": "Circuit open for AG1:agent:nobody:inbox"}
+    assert await live_only.has_live_consumer(redis, target)
+
+    # gauges are exported only while a metrics registry is attached
+    from AG1_AetherBus.metrics import MetricsRegistry
+    metrics = MetricsRegistry()
+    exported = BreakerRegistry(registry=metrics)
+    exported.get(target)
+    assert "bus_target_health" in metrics.render_prometheus()
+    exported.close()
+    assert "bus_target_health{" not in metrics.render_prometheus()
+
+    await close_reply_mux(redis)
+    await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_rpc_batch_returns_replies_in_order():
+    from AG1_AetherBus.reply_mux import close_reply_mux
+    from AG1_AetherBus.rpc import bus_rpc_batch
+
+    redis = InMemoryRedis()
+
+    def responder(name):
+        async def handler(env):
+            await asyncio.sleep(0.2)
+            await publish_envelope(redis, env.reply_to, Envelope(role="agent", content={"by": name, "q": env.content["q"]}, correlation_id=env.correlation_id))
+        return handler
+
+    targets = [f"AG1:agent:batch{n}:inbox" for n in range(3)]
+    tasks = [asyncio.create_task(subscribe(redis, t, responder(t), block_ms=50)) for t in targets]
+    await asyncio.sleep(0.01)
+
+    requests = [(t, Envelope(role="user", content={"q": n})) for n, t in enumerate(targets)]
+    requests.append(("AG1:agent:nobody:inbox", Envelope(role="user", content={"q": 3})))
+    started = time.monotonic()
+    results = await bus_rpc_batch(redis, requests, timeout=0.5)
+    elapsed = time.monotonic() - started
+
+    assert [r.content for r in results[:3]] == [{"by": t, "q": n} for n, t in enumerate(targets)]
+    assert results[3] == {"error": "RPC Timeout or No Response"}
+    assert elapsed < 0.7  # the slowest call, not the sum
+
+    await close_reply_mux(redis)
+    for task in tasks:
+        await _cancel(task)
+
+
+@pytest.mark.asyncio
+async def test_rpc_batch_beats_sequential_calls():
+    from AG1_AetherBus.reply_mux import close_reply_mux
+    from AG1_AetherBus.rpc import bus_rpc_batch
+
+    redis = InMemoryRedis()
+    target = "AG1:agent:concurrent:inbox"
+
+    async def handler(env):
+        await asyncio.sleep(0.1)
+        await publish_envelope(redis, env.reply_to, Envelope(role="agent", content=env.content, correlation_id=env.correlation_id))
+
+    task = asyncio.create_task(subscribe(redis, target, handler, block_ms=50, max_in_flight=4))
+    await asyncio.sleep(0.01)
+
+    def requests():
+        return [(target, Envelope(role="user", content={"q": n})) for n in range(4)]
+
+    started = time.monotonic()
+    for _, env in requests():
+        assert (await bus_rpc_envelope(redis, target, env, timeout=2)).content == env.content
+    sequential = time.monotonic() - started
+
+    batch = requests()
+    started = time.monotonic()
+    results = await bus_rpc_batch(redis, batch, timeout=2)
+    batched = time.monotonic() - started
+
+    assert [r.content for r in results] == [{"q": n} for n in range(4)]
+    assert batched < sequential / 2
+    assert all(env.reply_to is None and "deadline" not in env.headers for _, env in batch)
+    with pytest.raises(ValueError):
+        await bus_rpc_batch(redis, [(target, Envelope(role="user", content={}, reply_to="AG1:mine"))], timeout=1)
+
+    await close_reply_mux(redis)
+    await _cancel(task)